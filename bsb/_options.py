@@ -4,6 +4,7 @@ registered using plugin registration. See `setup.py` for the setuptools metadata
 """
 
 from .option import BsbOption
+from .exceptions import OptionError
 from .reporting import report
 
 
@@ -86,6 +87,121 @@ class ConfigOption(
         return "network_configuration.json"
 
 
+class SchedulerOption(
+    BsbOption,
+    name="scheduler",
+    cli=("scheduler",),
+    project=("scheduler",),
+    env=("BSB_SCHEDULER",),
+    script=("scheduler",),
+):
+    """
+    Set the job scheduler used during parallel execution. ``fifo`` submits jobs to the
+    MPI pool as soon as their dependencies complete, ``locality`` assigns neighbouring
+    chunks to the same MPI process and lets idle processes steal work.
+    """
+
+    def setter(self, value):
+        return _check_scheduler(value)
+
+    def getter(self, value):
+        return _check_scheduler(value)
+
+    def get_default(self):
+        return "fifo"
+
+
+def _check_scheduler(value):
+    value = str(value).lower()
+    if value in ("fifo", "locality"):
+        return value
+    raise OptionError(f"Invalid scheduler '{value}', choose 'fifo' or 'locality'.")
+
+
+class PoolOption(
+    BsbOption,
+    name="pool",
+    cli=("pool",),
+    project=("pool",),
+    env=("BSB_POOL",),
+    script=("pool",),
+):
+    """
+    Set the job pool backend used when running without MPI. ``serial`` runs all jobs in
+    the main process, ``processes:N`` distributes them over ``N`` local processes. If
+    ``N`` is omitted, a process is started per CPU.
+    """
+
+    def setter(self, value):
+        return _check_pool(value)
+
+    def getter(self, value):
+        return _check_pool(value)
+
+    def get_default(self):
+        return "serial"
+
+
+def _check_pool(value):
+    value = str(value).lower()
+    backend, sep, n = value.partition(":")
+    if value == "serial" or (
+        backend == "processes" and (not sep or (n.isdigit() and int(n) > 0))
+    ):
+        return value
+    raise OptionError(
+        f"Invalid pool '{value}', choose 'serial', 'processes' or 'processes:N'."
+    )
+
+
+class MorphologyCacheOption(
+    BsbOption,
+    name="morphology_cache",
+    cli=("morphology_cache",),
+    project=("morphology_cache",),
+    env=("BSB_MORPHOLOGY_CACHE",),
+    script=("morphology_cache",),
+):
+    """
+    Set the size, in MiB, of the morphology cache of each storage engine. Loaded
+    morphologies are kept in the cache until it is full, then the least recently used
+    morphologies are dropped. ``0`` disables the cache.
+    """
+
+    def setter(self, value):
+        return int(value)
+
+    def getter(self, value):
+        return int(value)
+
+    def get_default(self):
+        return 256
+
+
+class BoxTreeOption(
+    BsbOption,
+    name="box_tree",
+    cli=("box_tree",),
+    project=("box_tree",),
+    env=("BSB_BOX_TREE",),
+    script=("box_tree",),
+):
+    """
+    Set the box tree provider used to find intersecting boxes. ``rtree`` uses a bulk
+    loaded R-tree, ``grid`` hashes the boxes into a uniform grid and answers batches of
+    queries with vectorized operations.
+    """
+
+    def setter(self, value):
+        return str(value).lower()
+
+    def getter(self, value):
+        return str(value).lower()
+
+    def get_default(self):
+        return "rtree"
+
+
 def verbosity():
     return VerbosityOption
 
@@ -100,3 +216,19 @@ def sudo():
 
 def config():
     return ConfigOption
+
+
+def scheduler():
+    return SchedulerOption
+
+
+def pool():
+    return PoolOption
+
+
+def morphology_cache():
+    return MorphologyCacheOption
+
+
+def box_tree():
+    return BoxTreeOption
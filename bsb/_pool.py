@@ -34,11 +34,28 @@ class name, ``_name`` for the job name and ``_c`` for the chunk. These are used
 to display what the workers are doing during parallel execution. This is an experimental
 API and subject to sudden change in the future.
 
+The order in which jobs are handed to the MPI workers is determined by the ``scheduler``
+option. The default ``fifo`` scheduler submits jobs to the pool as soon as their
+dependencies complete. The ``locality`` scheduler (see :class:`.LocalityScheduler`)
+builds the full dependency graph upfront and assigns spatially neighbouring chunks to
+the same worker, so that data they share stays cached, while idle workers steal jobs
+from the busiest worker.
+
+Without MPI, jobs are executed serially, unless the ``pool`` option is set to
+``processes:N``, in which case the jobs are distributed over ``N`` local worker processes
+(see :func:`.create_job_pool`).
+
 """
 
 from mpi4py.MPI import COMM_WORLD
+from . import options
+from .reporting import warn
+import os
 import time
+import bisect
+import contextlib
 import concurrent.futures
+import multiprocessing
 import threading
 
 
@@ -72,6 +89,7 @@ class Job:
         self._args = args
         self._kwargs = kwargs
         self._deps = set(deps or [])
+        self._pool = None
         self._completion_cbs = []
         for j in self._deps:
             j.on_completion(self._dep_completed)
@@ -104,19 +122,22 @@ class Job:
         # When a dep completes we end up here and we discard it as a dependency as it has
         # finished. When all our dependencies have been discarded we can queue ourselves.
         self._deps.discard(dep)
-        # Serial execution is based on enqueue order only, no async deps.
-        if not _serial_execution and not self._deps:
+        # Serial execution is based on enqueue order only, no async deps. Jobs that
+        # were never enqueued are either executed serially, or managed by a scheduler
+        # that tracks the deps itself.
+        if not self._deps and self._pool is not None:
             self._enqueue(self._pool)
 
     def _enqueue(self, pool):
         if not self._deps:
-            # Notify anyone waiting on the spaceholder `FakeFuture` that we're
-            # now actually queueing ourselves
-            self._future.set_result("ENQUEUED")
             # Go ahead and submit ourselves to the pool, no dependencies to wait for
             # The dispatcher is run on the remote worker and unpacks the data required
             # to execute the job contents.
+            placeholder = self._future
             self._future = pool.submit(dispatcher, self.pool_id, self.serialize())
+            # Notify anyone waiting on the spaceholder `FakeFuture` that we're
+            # now actually queued.
+            placeholder.set_result("ENQUEUED")
             # Invoke our completion callbacks when the future completes.
             self._future.add_done_callback(self._completion)
         else:
@@ -128,6 +149,7 @@ class Job:
 class ChunkedJob(Job):
     def __init__(self, pool, f, chunk, deps=None):
         super().__init__(pool, f, (chunk,), {}, deps=deps)
+        self._c = chunk
 
 
 class PlacementJob(ChunkedJob):
@@ -246,7 +268,9 @@ class JobPool:
         # in dependency-first order; which should always be the case unless someone
         # submits jobs first and then starts adding things to the jobs' `._deps`
         # attribute. Which isn't expected to work.
-        if _serial_execution:
+        if _serial_execution and _process_count():
+            self._execute_processes(_process_count(), master_event_loop)
+        elif _serial_execution:
             # Just run each job serially
             for job in self._queue:
                 # Execute the static handler
@@ -267,24 +291,302 @@ class JobPool:
                 # the shutdown signal from the master, they return here skipping the
                 # master logic.
                 return
-            # Tell each job in our queue that they have to put themselves in the pool
-            # queue; each job will store their own future and will use the futures of
-            # their previously enqueued dependencies to determine when they can put
-            # themselves on the pool queue.
+            locality = options.scheduler == "locality"
+            if locality and not LocalityScheduler.supports(pool):
+                warn(
+                    "The installed zwembad version does not support the locality"
+                    + " scheduler, falling back to the fifo scheduler."
+                )
+                locality = False
+            if locality:
+                # Hand our queue over to a scheduler that decides which worker executes
+                # which job.
+                LocalityScheduler(pool, self._queue).start()
+            else:
+                # Tell each job in our queue that they have to put themselves in the pool
+                # queue; each job will store their own future and will use the futures
+                # of their previously enqueued dependencies to determine when they can
+                # put themselves on the pool queue.
+                for job in self._queue:
+                    job._enqueue(pool)
+
+            self._wait(master_event_loop)
+            pool.shutdown()
+
+    def _execute_processes(self, n, master_event_loop):
+        # Each worker process reconstructs the scaffold from its storage, and they share
+        # a lock that synchronizes their access to it.
+        storage = self.owner.storage
+        # Make sure the workers load the configuration we're running.
+        storage.store_active_config(self.owner.configuration)
+        # Forking a process that has threads running can deadlock the child, so spawn
+        # fresh interpreters instead.
+        ctx = multiprocessing.get_context("spawn")
+        lock = ProcessLock(ctx)
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=n,
+            mp_context=ctx,
+            initializer=_init_process_worker,
+            initargs=(self.id, storage.format, storage.root, lock),
+        )
+        with pool:
             for job in self._queue:
                 job._enqueue(pool)
+            self._wait(master_event_loop)
+        self._queue = []
 
-            q = self._queue.copy()
-            # As long as any of the jobs aren't done yet we repeat the master_event_loop
-            while open_jobs := [j._future for j in self._queue if not j._future.done()]:
-                if master_event_loop:
-                    # If there is an event loop, run it and hand it a copy of the jobqueue
-                    master_event_loop(q)
-                else:
-                    # If there is no event loop just let the master idle until execution
-                    # has completed.
-                    concurrent.futures.wait(open_jobs)
-            pool.shutdown()
+    def _wait(self, master_event_loop):
+        q = self._queue.copy()
+        # As long as any of the jobs aren't done yet we repeat the master_event_loop
+        while open_jobs := [j._future for j in self._queue if not j._future.done()]:
+            if master_event_loop:
+                # If there is an event loop, run it and hand it a copy of the jobqueue
+                master_event_loop(q)
+            else:
+                # If there is no event loop just let the master idle until execution
+                # has completed.
+                concurrent.futures.wait(open_jobs)
+        # Raise the first error that occurred on the workers.
+        for job in self._queue:
+            job._future.result()
+
+
+class LocalityScheduler:
+    """
+    Schedules jobs onto specific workers of an MPI pool. The chunks of all chunked jobs
+    are sorted along a Morton (Z-order) curve and divided into contiguous blocks, one per
+    worker, so that neighbouring chunks, which tend to read the same data, are executed
+    on the same worker. Jobs become ready when all of their dependencies have completed,
+    and each idle worker executes the ready job of its own block that is earliest on the
+    curve. Workers without ready jobs of their own steal the job that is latest on the
+    curve from the worker with the most ready jobs left.
+
+    :param pool: The MPI pool of the workers.
+    :type pool: zwembad.MPIPoolExecutor
+    :param jobs: The jobs to schedule, including all of their dependencies.
+    :type jobs: list[~bsb._pool.Job]
+    """
+
+    def __init__(self, pool, jobs):
+        self._lock = threading.Lock()
+        self._workers = sorted(pool._workers)
+        self._jobs = list(jobs)
+        # Map each job to the jobs that depend on it.
+        self._dependents = {job: [] for job in self._jobs}
+        for job in self._jobs:
+            for dep in job._deps:
+                self._dependents[dep].append(job)
+        # Assign each job a position on the locality curve and a home worker.
+        self._rank = {}
+        self._home = {}
+        ordered = sorted(self._jobs, key=_locality_key)
+        per_worker = -(-len(ordered) // len(self._workers)) or 1
+        for i, job in enumerate(ordered):
+            self._rank[job] = i
+            self._home[job] = self._workers[i // per_worker]
+        # Ready jobs per worker, as sorted lists of `(rank, job id)`.
+        self._ready = {worker: [] for worker in self._workers}
+        self._by_id = {id(job): job for job in self._jobs}
+        self._idle = set(self._workers)
+        for job in self._jobs:
+            job.on_completion(self._job_done)
+
+    @staticmethod
+    def supports(pool):
+        """
+        Check whether jobs can be assigned to specific workers of the pool. This relies
+        on internals of zwembad, which can change between releases.
+
+        :param pool: The MPI pool of the workers.
+        :type pool: zwembad.MPIPoolExecutor
+        :rtype: bool
+        """
+        try:
+            from zwembad.pool import _JobThread
+        except ImportError:
+            return False
+        return hasattr(pool, "_workers") and callable(
+            getattr(_JobThread, "assign_worker", None)
+        )
+
+    def start(self):
+        """
+        Start executing all the jobs without dependencies.
+        """
+        with self._lock:
+            for job in self._jobs:
+                if not job._deps:
+                    self._push(job)
+            self._dispatch()
+
+    def _push(self, job):
+        bisect.insort(self._ready[self._home[job]], (self._rank[job], id(job)))
+
+    def _pop(self, worker):
+        if self._ready[worker]:
+            # Take the job nearest to the start of our own block.
+            return self._by_id[self._ready[worker].pop(0)[1]]
+        victim = max(self._workers, key=lambda w: len(self._ready[w]))
+        if self._ready[victim]:
+            # Steal the job furthest from the start of the victim's block, which is the
+            # job that will stay in its queue the longest.
+            return self._by_id[self._ready[victim].pop()[1]]
+
+    def _dispatch(self):
+        for worker in sorted(self._idle):
+            job = self._pop(worker)
+            if job is None:
+                break
+            self._idle.discard(worker)
+            self._execute(worker, job)
+
+    def _execute(self, worker, job):
+        from zwembad.pool import _JobThread
+
+        future = concurrent.futures.Future()
+        thread = _JobThread(future, dispatcher, (job.pool_id, job.serialize()), {})
+        thread.assign_worker(worker)
+        # Swap out the spaceholder `FakeFuture` before we notify anyone waiting on it.
+        placeholder, job._future = job._future, future
+        placeholder.set_result("ENQUEUED")
+        future.add_done_callback(job._completion)
+        future.add_done_callback(self._worker_done(worker))
+        thread.start()
+
+    def _worker_done(self, worker):
+        def worker_done_cb(_):
+            with self._lock:
+                self._idle.add(worker)
+                self._dispatch()
+
+        return worker_done_cb
+
+    def _job_done(self, job):
+        # The completion callbacks of the job's dependents were registered before ours,
+        # so they've already discarded this job as one of their dependencies.
+        with self._lock:
+            for dependent in self._dependents[job]:
+                if not dependent._deps:
+                    self._push(dependent)
+
+
+def _locality_key(job):
+    # Jobs without a chunk are ordered before all chunked jobs.
+    chunk = job._c
+    if chunk is None:
+        return (0, 0)
+    return (1, _morton_code(chunk))
+
+
+def _morton_code(coords):
+    # Interleave the bits of the 16 bit chunk coordinates (shifted to be unsigned), so
+    # that chunks close in space are close on the curve.
+    code = 0
+    shifted = [int(c) + 2 ** 15 for c in coords]
+    for bit in range(16):
+        for dim, c in enumerate(shifted):
+            code |= ((c >> bit) & 1) << (3 * bit + dim)
+    return code
+
+
+def _process_count():
+    # Parse the `pool` option into the amount of worker processes to use, or 0 for no
+    # worker processes.
+    backend, _, n = options.pool.partition(":")
+    if backend != "processes":
+        return 0
+    return int(n) if n else os.cpu_count()
+
+
+def _init_process_worker(pool_id, engine, root, lock):
+    from .storage import Storage
+
+    storage = Storage(engine, root)
+    # Replace the MPI lock of the storage engine by the lock shared by the processes.
+    storage._engine._lock = lock
+    JobPool._pool_owners[pool_id] = storage.load()
+
+
+class ProcessLock:
+    """
+    Read/write lock shared between local processes, that provides the read and write
+    locks of :func:`mpilock.sync` to storage engines in worker processes. Read locks can
+    be held by many processes at once, write locks only by a single process. Locks can be
+    nested, and a process that holds a read lock can acquire a write lock.
+
+    :param ctx: Multiprocessing context to create the shared primitives in.
+    """
+
+    def __init__(self, ctx):
+        self._cond = ctx.Condition()
+        self._readers = ctx.Value("i", 0, lock=False)
+        self._writing = ctx.Value("b", False, lock=False)
+        # Process local nesting state
+        self._reads = 0
+        self._writes = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_reads"] = state["_writes"] = 0
+        return state
+
+    @contextlib.contextmanager
+    def read(self):
+        if self._reads or self._writes:
+            self._reads += 1
+            try:
+                yield
+            finally:
+                self._reads -= 1
+            return
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writing.value)
+            self._readers.value += 1
+        self._reads = 1
+        try:
+            yield
+        finally:
+            self._reads = 0
+            with self._cond:
+                self._readers.value -= 1
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        if self._writes:
+            self._writes += 1
+            try:
+                yield
+            finally:
+                self._writes -= 1
+            return
+        with self._cond:
+            # Give up our read lock while we wait for the write lock.
+            self._readers.value -= self._reads > 0
+            self._cond.notify_all()
+            self._cond.wait_for(
+                lambda: not self._writing.value and not self._readers.value
+            )
+            self._writing.value = True
+        self._writes = 1
+        try:
+            yield
+        finally:
+            self._writes = 0
+            with self._cond:
+                self._writing.value = False
+                self._readers.value += self._reads > 0
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def single_write(self):
+        from mpilock import Fence
+        from mpi4py.MPI import COMM_SELF
+
+        # Every process that asks for a single write lock is the single writer of its own
+        # communicator, so the fence never kicks anyone out.
+        with self.write(), Fence(0, True, COMM_SELF) as fence:
+            yield fence
 
 
 def create_job_pool(scaffold):
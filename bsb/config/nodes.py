@@ -14,6 +14,7 @@ _available_distributions = [
 @pluggable(key="engine", plugin_name="storage engine")
 class StorageNode:
     root = slot()
+    packed = attr(type=bool, default=False)
 
     @classmethod
     def __plugins__(cls):
@@ -1,7 +1,7 @@
 from itertools import chain
 from functools import reduce, cache
 import numpy as np
-from ...storage import Chunk
+from ...storage import ChunkList
 
 
 class Intersectional:
@@ -15,20 +15,15 @@ class Intersectional:
             np.arange(l1 - u2 + c, u1 - l2 + c + 1)
             for l1, l2, u1, u2, c in zip(lpre, lpost, upre, upost, chunk)
         )
-        # Flatten and stack the meshgrid coordinates into a list.
-        clist = np.column_stack(
-            [a.reshape(-1) for a in np.meshgrid(*bounds, indexing="ij")]
+        # Flatten and stack the meshgrid coordinates into a chunk list.
+        clist = ChunkList(
+            np.column_stack([a.reshape(-1) for a in np.meshgrid(*bounds, indexing="ij")]),
+            chunk.dimensions,
         )
         if not hasattr(self, "_occ_chunks"):
             # Filter by chunks where cells were actually placed
-            self._occ_chunks = set(
-                chain.from_iterable(ps.get_all_chunks() for ps in post_ps)
-            )
-        if not self._occ_chunks:
-            return []
-        else:
-            size = next(iter(self._occ_chunks)).dimensions
-            return [t for c in clist if (t := Chunk(c, size)) in self._occ_chunks]
+            self._occ_chunks = ChunkList.union(*(ps.get_all_chunks() for ps in post_ps))
+        return clist.intersect(self._occ_chunks)
 
     @cache
     def _get_rect_ext(self, chunk_size, pre_post_flag):
@@ -55,4 +50,4 @@ class Intersectional:
             box_tree = cset.load_box_tree()
             print("Target has,", len(box_tree), "boxes")
             for ttype, tset, tboxes in target_cache:
-                yield (tset, cset, box_tree.query(tboxes))
+                yield (tset, cset, box_tree.query_batch(tboxes))
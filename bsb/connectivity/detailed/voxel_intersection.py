@@ -5,6 +5,7 @@ import random
 from ..strategy import ConnectionStrategy
 from .shared import Intersectional
 from ...exceptions import *
+from ...morphologies import TransformedMorphology
 from ... import config
 from ...config import types
 
@@ -34,13 +35,6 @@ class VoxelIntersection(Intersectional, ConnectionStrategy):
         pass
 
     def connect(self, pre, post):
-        if self.cache:
-            cache = {
-                set_.tag: set_.load_morphologies()
-                for set_ in itertools.chain(
-                    pre.placement.values(), post.placement.values()
-                )
-            }
         if self.favor_cache == "pre":
             targets = pre
             candidates = post
@@ -53,39 +47,53 @@ class VoxelIntersection(Intersectional, ConnectionStrategy):
             self._n_cvoxels = self.voxels_pre
         combo_itr = self.candidate_intersection(targets, candidates)
         for target_set, cand_set, match_itr in combo_itr:
-            if self.cache:
-                target_mset = cache[target_set.tag]
-                cand_mset = cache[cand_set.tag]
-            else:
-                target_mset = target_set.load_morphologies()
-                cand_mset = cand_set.load_morphologies()
+            target_mset = target_set.load_morphologies()
+            cand_mset = cand_set.load_morphologies()
             self._match_voxel_intersection(
                 match_itr, target_set, cand_set, target_mset, cand_mset
             )
 
     def _match_voxel_intersection(self, matches, tset, cset, tmset, cmset):
-        # Soft caching caches at the IO level and gives you a fresh copy of the morphology
-        # each time, the `cached_voxelize` function we need wouldn't have any effect!
-        tm_iter = tmset.iter_morphologies(cache=self.cache, hard_cache=self.cache)
-        target_itrs = zip(tset.load_positions(), tset.load_rotations().iter(), tm_iter)
-        rotations = cset.load_rotations()
+        # The morphology cache hands out a fresh copy of the morphology each time, so we
+        # keep the voxels of each unique target morphology around ourselves.
+        tm_indices = tmset.get_indices()
+        cm_indices = cmset.get_indices()
+        tvoxel_cache = {}
+        cview_cache = {}
+        tpositions = tset.load_positions()
+        tmatrices = tset.load_rotations().as_matrices()
+        cmatrices = cset.load_rotations().as_matrices()
         positions = cset.load_positions()
         data_acc = []
-        for target, candidates in enumerate(matches):
-            tpos, trot, tmor = next(target_itrs)
-            if not candidates:
+        offsets, cand_ids = matches
+        for target, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+            tpos = tpositions[target]
+            candidates = cand_ids[start:stop]
+            if not len(candidates):
                 # No need to load or voxelize if there's no candidates anyway
                 continue
             # Load and voxelize the target into a box tree
-            if self.cache:
-                tvoxels = tmor.cached_voxelize(N=self._n_tvoxels)
+            tm_index = tm_indices[target]
+            if self.cache and tm_index in tvoxel_cache:
+                tvoxels = tvoxel_cache[tm_index]
             else:
+                tmor = tmset.get(target, cache=self.cache)
                 tvoxels = tmor.voxelize(N=self._n_tvoxels)
+                if self.cache:
+                    tvoxel_cache[tm_index] = tvoxels
             tree = tvoxels.as_boxtree(cache=self.cache)
             for cand in candidates:
                 cpos = positions[cand]
-                crot = rotations[cand]
-                morpho = cmset.get(cand, cache=self.cache, hard_cache=False)
+                # Look at the candidate through a transformed view of its morphology,
+                # that shares the points of the morphology with all other views of it.
+                cm_index = cm_indices[cand]
+                if self.cache and cm_index in cview_cache:
+                    morpho = cview_cache[cm_index].copy()
+                else:
+                    cmor = cmset.get(cand, cache=self.cache)
+                    morpho = TransformedMorphology(cmor)
+                    if self.cache:
+                        cview_cache[cm_index] = morpho.copy()
                 # Transform candidate, keep target unrotated and untranslated at origin:
                 # 1) Rotate self by own rotation
                 # 2) Translate by position relative to target
@@ -93,13 +101,19 @@ class VoxelIntersection(Intersectional, ConnectionStrategy):
                 # Gives us the candidate relative to the target without having to modify,
                 # reload, recalculate or revoxelize any of the target morphologies.
                 # So in the case of a single target morphology we can keep that around.
-                morpho.rotate(crot)
+                # The transforms are composed, and the points are only transformed once,
+                # when the view is voxelized.
+                morpho.rotate(cmatrices[cand])
                 morpho.translate(cpos - tpos)
-                morpho.rotate(trot.inv())
+                morpho.rotate(tmatrices[target].T)
                 cvoxels = morpho.voxelize(N=self._n_cvoxels)
                 boxes = cvoxels.as_boxes()
                 # Filter out the candidate voxels that overlap with target voxels.
-                overlap = [(i, v) for i, v in enumerate(tree.query(boxes)) if v]
+                voffsets, tvs = tree.query_batch(boxes)
+                overlap = [
+                    (i, tvs[voffsets[i] : voffsets[i + 1]])
+                    for i in np.nonzero(np.diff(voffsets))[0]
+                ]
                 if overlap:
                     locations = self._pick_locations(
                         target, cand, tvoxels, cvoxels, overlap
@@ -130,8 +144,8 @@ class VoxelIntersection(Intersectional, ConnectionStrategy):
         clocs = []
         for i in _rng.integers(len(overlap), size=n):
             cv, tvs = overlap[i]
-            cpool = cvoxels.get_data(cv)
-            tpool = np.concatenate([tvoxels.get_data(tv) for tv in tvs])
+            cpool = cvoxels.get_data(cv, copy=False)
+            tpool = tvoxels.get_data(tvs)
             tlocs.append((tid, *random.choice(tpool)))
             clocs.append((cid, *random.choice(cpool)))
         return tlocs, clocs
@@ -3,6 +3,7 @@ import functools
 from .strategy import ConnectionStrategy
 from .. import config
 from ..exceptions import *
+from ..storage import ChunkList
 from ..reporting import report, warn
 
 
@@ -49,8 +50,7 @@ class AllToAll(ConnectionStrategy):
     @functools.cache
     def _get_all_pre_chunks(self):
         all_ps = self.presynaptic.placement.values()
-        chunks = set(itertools.chain.from_iterable(ps.get_all_chunks() for ps in all_ps))
-        return list(chunks)
+        return ChunkList.union(*(ps.get_all_chunks() for ps in all_ps))
 
     def connect(self):
         from_type = self.presynaptic.type
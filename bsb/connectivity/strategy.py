@@ -3,6 +3,7 @@ from ..config import refs, types
 from ..helpers import SortableByAfter
 from ..reporting import report, warn
 from ..exceptions import *
+from ..storage import ChunkList
 import abc
 from itertools import chain
 
@@ -87,10 +88,8 @@ class ConnectionStrategy(abc.ABC, SortableByAfter):
         deps = set(chain.from_iterable(strat._queued_jobs for strat in self.get_after()))
         pre_types = self.presynaptic.cell_types
         # Iterate over each chunk that is populated by our presynaptic cell types.
-        from_chunks = set(
-            chain.from_iterable(
-                ct.get_placement_set().get_all_chunks() for ct in pre_types
-            )
+        from_chunks = ChunkList.union(
+            *(ct.get_placement_set().get_all_chunks() for ct in pre_types)
         )
         # For determining the ROI, it's more logical and often easier to determine where
         # axons can go, then where they can come from, so we let them do that, and flip
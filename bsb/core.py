@@ -216,6 +216,10 @@ class Scaffold:
                 self._stop_progress_loop(loop, debug=DEBUG)
         else:
             pool.execute()
+        if self.storage_cfg.packed:
+            cell_types = {ct.name: ct for s in strategies for ct in s.cell_types}
+            report(f"Compacting placement of: {', '.join(cell_types)}", level=3)
+            self.storage.compact_placement(cell_types.values())
 
     def run_connectivity(self, strategies=None, DEBUG=True):
         """
@@ -238,6 +242,9 @@ class Scaffold:
                 self._stop_progress_loop(loop, debug=DEBUG)
         else:
             pool.execute()
+        if self.storage_cfg.packed:
+            report("Compacting connectivity", level=3)
+            self.storage.compact_connectivity()
 
     def run_placement_strategy(self, strategy):
         """
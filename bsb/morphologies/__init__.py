@@ -38,7 +38,6 @@ class MorphologySet:
     def __init__(self, loaders, m_indices):
         self._m_indices = m_indices
         self._loaders = loaders
-        self._cached = {}
 
     def __len__(self):
         return len(self._m_indices)
@@ -49,55 +48,42 @@ class MorphologySet:
     def get_indices(self):
         return self._m_indices
 
-    def get(self, index, cache=True, hard_cache=False):
+    def get(self, index, cache=True):
+        """
+        Get the morphology of the cell(s) at the given index.
+
+        :param cache: Load the morphologies through the :ref:`morphology cache
+          <morphology-cache>` of the storage.
+        :type cache: bool
+        """
         data = self._m_indices[index]
+        load = self._cached_load if cache else self._load
         if data.ndim:
-            if hard_cache:
-                return np.array([self._loaders[idx].cached_load() for idx in data])
-            elif cache:
-                res = []
-                for idx in data:
-                    if idx not in self._cached:
-                        self._cached[idx] = self._loaders[idx].load()
-                    res.append(self._cached[idx].copy())
-            else:
-                res = np.array([self._loaders[idx].load() for idx in data])
-            return res
-        elif cache:
-            if hard_cache:
-                return self._loaders[data].cached_load()
-            elif data not in self._cached:
-                self._cached[data] = self._loaders[data].load()
-            return self._cached[data].copy()
-
-    def clear_soft_cache(self):
-        self._cached = {}
+            return np.array([load(idx) for idx in data])
+        else:
+            return load(data)
 
-    def iter_morphologies(self, cache=True, unique=False, hard_cache=False):
+    def iter_morphologies(self, cache=True, unique=False):
         """
         Iterate over the morphologies in a MorphologySet with full control over caching.
 
-        :param cache: Use :ref:`soft-caching` (1 copy stored in mem per cache miss, 1 copy
-          created from that per cache hit).
+        :param cache: Load the morphologies through the :ref:`morphology cache
+          <morphology-cache>` of the storage.
         :type cache: bool
-        :param hard_cache: Use :ref:`hard-caching` (1 copy stored on the loader, always
-          same copy returned from that loader forever).
+        :param unique: Iterate over the unique morphologies of the set instead.
+        :type unique: bool
         """
+        load = self._cached_load if cache else self._load
         if unique:
-            if hard_cache:
-                yield from (l.cached_load() for l in self._loaders)
-            else:
-                yield from (l.load() for l in self._loaders)
-        elif not cache:
-            yield from (self._loaders[idx].load() for idx in self._m_indices)
-        elif hard_cache:
-            yield from (self._loaders[idx].cached_load() for idx in self._m_indices)
+            yield from (load(idx) for idx in range(len(self._loaders)))
         else:
-            _cached = {}
-            for idx in self._m_indices:
-                if idx not in _cached:
-                    _cached[idx] = self._loaders[idx].load()
-                yield _cached[idx].copy()
+            yield from (load(idx) for idx in self._m_indices)
+
+    def _load(self, idx):
+        return self._loaders[idx].load()
+
+    def _cached_load(self, idx):
+        return self._loaders[idx].cached_load()
 
     def iter_meta(self, unique=False):
         if unique:
@@ -124,6 +110,7 @@ class RotationSet:
 
     def __init__(self, data):
         self._data = data
+        self._matrices = None
 
     def __iter__(self):
         return self.iter()
@@ -138,20 +125,80 @@ class RotationSet:
     def __len__(self):
         return len(self._data)
 
+    def get_raw(self, copy=True):
+        """
+        Get the euler angles of the rotations, as a (Nx3) matrix.
+
+        :param copy: Return a copy of the data.
+        :type copy: bool
+        """
+        return np.array(self._data, copy=copy).reshape(-1, 3)
+
+    def as_matrices(self, index=None):
+        """
+        Get the rotation matrices of the rotations, as a (Nx3x3) array. The matrices are
+        calculated once, in a single vectorized call, and kept for subsequent calls.
+
+        :param index: Only return the matrices of the rotations at this index.
+        :type index: Union[int, slice, numpy.ndarray]
+        :rtype: numpy.ndarray
+        """
+        if self._matrices is None:
+            angles = self.get_raw(copy=False)
+            if len(angles):
+                self._matrices = Rotation.from_euler("xyz", angles).as_matrix()
+            else:
+                self._matrices = np.empty((0, 3, 3))
+        if index is None:
+            return self._matrices
+        return self._matrices[index]
+
+    def apply_to(self, points, index_array, block_size=100000):
+        """
+        Rotate each point by the rotation at the corresponding index of ``index_array``,
+        for example to rotate the points of many morphologies at once.
+
+        :param points: Matrix of the points, with one point on each row.
+        :type points: numpy.ndarray
+        :param index_array: Index of the rotation to apply to each point, or a single
+          index to apply to all points.
+        :type index_array: Union[int, numpy.ndarray]
+        :param block_size: Maximum number of points to rotate at once, to limit the
+          memory of the intermediate matrices.
+        :type block_size: int
+        :returns: The rotated points.
+        :rtype: numpy.ndarray
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        index_array = np.broadcast_to(index_array, (len(points),))
+        matrices = self.as_matrices()
+        rotated = np.empty_like(points)
+        for i in range(0, len(points), block_size):
+            block = slice(i, i + block_size)
+            rotated[block] = np.einsum(
+                "nij,nj->ni", matrices[index_array[block]], points[block]
+            )
+        return rotated
+
     def iter(self, cache=False):
         if cache:
-            yield from (self._cached_rot(tuple(d)) for d in self._data)
+            yield from (_cached_rot(tuple(d)) for d in self._data)
         else:
-            yield from (self._rot(d) for d in self._data)
-
-    @functools.cache
-    def _cached_rot(self, angles):
-        return self._rot(angles)
+            angles = self.get_raw(copy=False)
+            if len(angles):
+                # Convert all the angles at once, and just slice out the rotations.
+                rotations = Rotation.from_euler("xyz", angles)
+                yield from (rotations[i] for i in range(len(rotations)))
 
     def _rot(self, angles):
         return Rotation.from_euler("xyz", angles)
 
 
+@functools.lru_cache(maxsize=1024)
+def _cached_rot(angles):
+    return Rotation.from_euler("xyz", angles)
+
+
 def branch_iter(branch):
     """
     Iterate over a branch and all of its children depth first.
@@ -284,8 +331,9 @@ class SubTree:
             raise ValueError("Point must be a sequence of x, y and z coordinates")
         for p, vector in zip(point, Branch.vectors):
             for branch in self.branches:
-                array = getattr(branch, vector)
-                array += p
+                # Replace rather than modify the vectors, they might be shared with a
+                # cached morphology.
+                setattr(branch, vector, getattr(branch, vector) + p)
 
     @property
     def origin(self):
@@ -345,6 +393,158 @@ class Morphology(SubTree):
         return self.__class__([branch_copy_map[r] for r in self.roots], meta=self.meta)
 
 
+class TransformedMorphology:
+    """
+    Lazy view of a morphology under a rigid transformation. The transformations are
+    composed into a single 4x4 affine matrix, and the points of the source morphology are
+    only transformed, in a single vectorized call, when they are flattened or voxelized.
+    The source morphology is never modified or copied.
+
+    :param morphology: The source morphology.
+    :type morphology: :class:`~.morphologies.Morphology`
+    :param affine: Initial 4x4 affine transformation matrix. Identity by default.
+    :type affine: numpy.ndarray
+    """
+
+    def __init__(self, morphology, affine=None):
+        self._morphology = morphology
+        self._affine = np.eye(4) if affine is None else np.array(affine, dtype=float)
+        # The flat points of the source are shared by all copies of the view.
+        self._source = {}
+        self._points = None
+
+    @property
+    def morphology(self):
+        """
+        The untransformed source morphology.
+        """
+        return self._morphology
+
+    @property
+    def affine(self):
+        return self._affine.copy()
+
+    @property
+    def meta(self):
+        # The bounds of the source don't hold under transformation.
+        meta = self._morphology.meta
+        return {k: v for k, v in meta.items() if k not in ("ldc", "mdc")}
+
+    @property
+    def branches(self):
+        """
+        The branches of the source morphology. Their points are not transformed, use
+        :meth:`.flatten` to obtain the transformed points.
+        """
+        return self._morphology.branches
+
+    @property
+    def bounds(self):
+        points = self._transformed()
+        if not len(points):
+            return np.zeros(3), np.zeros(3)
+        return np.min(points, axis=0), np.max(points, axis=0)
+
+    def copy(self):
+        """
+        Return a copy of the view, that shares the source morphology and its points.
+        """
+        copy = type(self)(self._morphology, self._affine)
+        copy._source = self._source
+        return copy
+
+    def transform(self, affine):
+        """
+        Apply a transformation, after the transformations already applied to the view.
+
+        :param affine: 4x4 affine transformation matrix, or 3x3 linear transformation
+          matrix.
+        :type affine: numpy.ndarray
+        """
+        affine = np.asarray(affine, dtype=float)
+        if affine.shape == (3, 3):
+            linear, affine = affine, np.eye(4)
+            affine[:3, :3] = linear
+        self._affine = affine @ self._affine
+        self._points = None
+        return self
+
+    def rotate(self, rot, center=None):
+        """
+        Point rotation
+
+        :param rot: Scipy rotation, or rotation matrix.
+        :type: Union[:class:`scipy.spatial.transform.Rotation`, numpy.ndarray]
+        :param center: Point to rotate around, by default the origin.
+        :type center: numpy.ndarray
+        """
+        matrix = rot.as_matrix() if isinstance(rot, Rotation) else rot
+        if center is not None:
+            self.translate(-np.asarray(center))
+        self.transform(matrix)
+        if center is not None:
+            self.translate(center)
+        return self
+
+    def translate(self, point):
+        if len(point) != 3:
+            raise ValueError("Point must be a sequence of x, y and z coordinates")
+        affine = np.eye(4)
+        affine[:3, 3] = point
+        return self.transform(affine)
+
+    def flatten(self, vectors=None, matrix=False, labels=None):
+        """
+        Return the flattened vectors of the transformed morphology. See
+        :meth:`.SubTree.flatten`.
+        """
+        if vectors is None:
+            vectors = Branch.vectors
+        xyz = ("x", "y", "z")
+        if labels is None and all(v in xyz for v in vectors):
+            data = self._transformed()[:, [xyz.index(v) for v in vectors]]
+        else:
+            data = self._morphology.flatten(vectors, matrix=True, labels=labels)
+            cols = [i for i, v in enumerate(vectors) if v in xyz]
+            if cols:
+                points = self._morphology.flatten(xyz, matrix=True, labels=labels)
+                points = self._apply(points)
+                data[:, cols] = points[:, [xyz.index(vectors[i]) for i in cols]]
+        return data if matrix else tuple(data.T)
+
+    def voxelize(self, N, labels=None):
+        if labels is not None:
+            raise NotImplementedError("Can't voxelize labelled parts yet.")
+        return VoxelSet.from_morphology(self, N)
+
+    def materialize(self):
+        """
+        Return a new morphology with the transformed points.
+
+        :rtype: :class:`~.morphologies.Morphology`
+        """
+        points = self._transformed()
+        morphology = self._morphology.copy()
+        ptr = 0
+        for branch in morphology.branches:
+            branch.x, branch.y, branch.z = points[ptr : ptr + len(branch)].T
+            ptr += len(branch)
+        morphology._meta = self.meta
+        return morphology
+
+    def _transformed(self):
+        if self._points is None:
+            if "points" not in self._source:
+                self._source["points"] = self._morphology.flatten(
+                    vectors=["x", "y", "z"], matrix=True
+                )
+            self._points = self._apply(self._source["points"])
+        return self._points
+
+    def _apply(self, points):
+        return points @ self._affine[:3, :3].T + self._affine[:3, 3]
+
+
 def _copy_api(cls, wrap=lambda self: self):
     # Wraps functions so they are called with `self` wrapped in `wrap`
     def make_wrapper(f):
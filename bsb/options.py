@@ -233,7 +233,8 @@ def set_module_option(tag, value):
     if (option := _get_module_option(tag)).readonly:
         raise ReadOnlyOptionError("'%tag%' is a read-only option.", option, tag)
     mod_tag = _get_module_tag(tag)
-    _module_option_values[mod_tag] = value
+    # Let the option validate and convert the value, like the other descriptors do.
+    _module_option_values[mod_tag] = getattr(option, "setter", lambda x: x)(value)
 
 
 def get_module_option(tag):
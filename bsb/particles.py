@@ -1,8 +1,10 @@
 import numpy as np
 from sklearn.neighbors import KDTree
-from rtree import index
+from scipy.spatial import cKDTree
 from random import choice
 from .reporting import report
+from .voxels import VoxelSet
+from .trees import BoxRTree
 
 try:
     import plotly.graph_objects as go
@@ -103,6 +105,7 @@ class ParticleSystem:
     def __init__(self, track_displaced=False, scaffold=None):
         self.particle_types = []
         self.voxels = []
+        self._voxel_sets = []
         self.track_displaced = track_displaced
         self.scaffold = scaffold
 
@@ -117,6 +120,7 @@ class ParticleSystem:
         # Set initial radius for collision/rearrangement to 2 times the largest particle type radius
         self.search_radius = self.max_radius * 2
         # Create a list of voxels where the particles can be placed.
+        self._voxel_sets.append(voxels)
         self.voxels.extend(
             ParticleVoxel(ldc, size)
             for ldc, size in zip(
@@ -144,6 +148,9 @@ class ParticleSystem:
                 # Store the particle object
                 self.add_particle(radius, particle_position, type=particle_type)
 
+    def __len__(self):
+        return len(self.particles)
+
     def freeze(self):
         self.__frozen_positions = np.array([p.position for p in self.particles])
         self.radii = [p.radius for p in self.particles]
@@ -154,6 +161,18 @@ class ParticleSystem:
         x = np.array([p.position for p in self.particles])
         return x
 
+    def get_positions(self, type):
+        """
+        Get the positions of the particles of a particle type.
+        """
+        return self.positions.reshape(-1, self.dimensions)[self._type_mask(type)]
+
+    def _type_mask(self, type):
+        return np.array([p.type is type for p in self.particles], dtype=bool)
+
+    def _particle_ids(self, particles):
+        return np.array([p.id for p in particles], dtype=int)
+
     def find_colliding_particles(self, freeze=False):
         if not hasattr(self, "tree") or freeze:
             self.freeze()
@@ -300,59 +319,193 @@ class ParticleSystem:
 
     def prune(self, at_risk_particles=None, voxels=None):
         """
-        Remove particles that have been moved outside of the bounds of the voxels.
+        Find the particles that have been moved outside of the bounds of the voxels. The
+        particles aren't removed, instead a mask of the particles to keep is returned for
+        each particle type, in the order of :meth:`.get_positions`.
 
-        :param at_risk_particles: Subset of particles that might've been moved and might need to be moved, if omitted check all particles.
+        :param at_risk_particles: Subset of particles that might've been moved out of
+          bounds, if omitted check all particles.
         :type at_risk_particles: :class:`numpy.ndarray`
-        :param voxels: A subset of the voxels that the particles have to be in bounds of, if omitted all voxels are used.
+        :param voxels: A subset of the voxels that the particles have to be in bounds of,
+          if omitted all voxels are used.
+        :type voxels: Union[~bsb.voxels.VoxelSet, list[ParticleVoxel]]
+        :returns: A mask of the particles that are in bounds, per particle type name.
+        :rtype: dict[str, numpy.ndarray]
         """
-        # Define affected particles and voxels
+        positions = self.positions.reshape(-1, self.dimensions)
         if at_risk_particles is None:
-            at_risk_particles = self.particles
+            at_risk = np.arange(len(positions))
+        else:
+            at_risk = self._particle_ids(at_risk_particles)
         if voxels is None:
-            voxels = self.voxels
-        # Initialize Rtree index.
-        property = index.Property(dimension=3)
-        idx = index.Index(properties=property, interleaved=True)
-        # Insert voxel bounds in index.
-        for i, voxel in enumerate(self.voxels):
-            idx.insert(
-                i,
-                (*voxel.origin, *(voxel.origin + voxel.size)),
-            )
-        # Query index, filter whether the intersection returns any hits, map to id and cell type.
-        out_of_bounds_ids = list(
-            map(
-                lambda p: p.id,
-                filter(
-                    lambda p: not (list(idx.intersection((*p.position, *p.position)))),
-                    at_risk_particles,
-                ),
+            voxels = VoxelSet.concatenate(*self._voxel_sets)
+        inside = np.ones(len(positions), dtype=bool)
+        inside[at_risk] = _inside_voxels(positions[at_risk], voxels)
+        return {
+            pt["name"]: inside[self._type_mask(pt)]
+            for pt in self.particle_types
+            # Particles added without a type have no name to report them under.
+            if pt is not None
+        }
+
+
+class ArrayParticleSystem(ParticleSystem):
+    """
+    Particle system that stores the positions, radii and types of the particles in
+    arrays, and resolves all collisions at once each iteration. The colliding pairs are
+    found with a KD-tree, and each particle of a pair is pushed away from the other
+    with the same repulsive force as the :class:`.ParticleSystem`.
+
+    :param max_iterations: Maximum number of collision resolution iterations.
+    :type max_iterations: int
+    """
+
+    def __init__(self, track_displaced=False, scaffold=None, max_iterations=1000):
+        super().__init__(track_displaced=track_displaced, scaffold=scaffold)
+        self.max_iterations = max_iterations
+        self.positions = np.empty((0, 3))
+        self.radii = np.empty(0)
+        self.type_ids = np.empty(0, dtype=int)
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def positions(self):
+        return self._positions
+
+    @positions.setter
+    def positions(self, value):
+        self._positions = value
+
+    def fill(self, voxels, particles):
+        self.dimensions = voxels.get_raw(copy=False).shape[1]
+        first_type = len(self.particle_types)
+        self.particle_types.extend(particles)
+        # Particles added without a type have no type radius.
+        type_radii = [pt["radius"] for pt in self.particle_types if pt is not None]
+        self.max_radius = max(type_radii)
+        self.min_radius = min(type_radii)
+        self.search_radius = self.max_radius * 2
+        self._voxel_sets.append(voxels)
+        self.voxels.extend(
+            ParticleVoxel(ldc, size)
+            for ldc, size in zip(
+                voxels.as_spatial_coords(copy=False), voxels.get_size_matrix(copy=False)
             )
         )
+        origins = np.array([v.origin for v in self.voxels]).reshape(-1, self.dimensions)
+        sizes = np.array([v.size for v in self.voxels]).reshape(-1, self.dimensions)
+        positions, radii, type_ids = [], [], []
+        for type_id, particle_type in enumerate(particles, start=first_type):
+            placement_voxels = np.array(particle_type["voxels"], dtype=int)
+            count = particle_type["count"]
+            # Pick a random voxel for each particle, and a random position inside of it.
+            placement_matrix = np.random.rand(count, self.dimensions + 1)
+            voxel_ids = placement_voxels[
+                (placement_matrix[:, 0] * len(placement_voxels)).astype(int)
+            ]
+            positions.append(
+                origins[voxel_ids] + placement_matrix[:, 1:] * sizes[voxel_ids]
+            )
+            radii.append(np.full(count, particle_type["radius"], dtype=float))
+            type_ids.append(np.full(count, type_id))
+        # Reset particles
+        self.positions = np.concatenate(positions).reshape(-1, self.dimensions)
+        self.radii = np.concatenate(radii)
+        self.type_ids = np.concatenate(type_ids)
+        self.displaced_particles = np.empty(0, dtype=int)
+
+    def _type_mask(self, type):
+        type_id = next(i for i, pt in enumerate(self.particle_types) if pt is type)
+        return self.type_ids == type_id
+
+    def _particle_ids(self, particles):
+        return np.array(particles, dtype=int)
+
+    def get_packing_factor(self, particles=None, volume=None):
+        if particles is None:
+            particles_volume = np.sum(sphere_volume(self.radii))
+        else:
+            particles_volume = np.sum(sphere_volume(self.radii[particles]))
+        if volume is None:
+            volume = np.sum([np.prod(v.size) for v in self.voxels])
+        return particles_volume / volume
 
-        out_of_bounds_types = list(
-            map(
-                lambda p: p.type["name"],
-                filter(
-                    lambda p: not (list(idx.intersection((*p.position, *p.position)))),
-                    at_risk_particles,
-                ),
+    def find_colliding_particles(self, freeze=False):
+        pairs, _, _ = self._colliding_pairs()
+        self.colliding_particles = np.unique(pairs)
+        self.colliding_count = len(self.colliding_particles)
+        return self.colliding_particles
+
+    def solve_collisions(self):
+        displaced = np.zeros(len(self), dtype=bool)
+        for i in range(self.max_iterations):
+            pairs, vectors, distances = self._colliding_pairs()
+            if not len(pairs):
+                break
+            report(f"Untangling {len(pairs)} collisions", level=2)
+            displaced[pairs.reshape(-1)] = True
+            self.positions = self.positions + self._displacements(
+                pairs, vectors, distances
             )
+        else:
+            report(f"Gave up untangling after {self.max_iterations} iterations", level=1)
+        self.find_colliding_particles()
+        self.displaced_particles = np.nonzero(displaced)[0]
+
+    def _colliding_pairs(self):
+        # Find all pairs of particles that are closer than their collision radius.
+        if len(self) < 2:
+            return np.empty((0, 2), dtype=int), np.empty((0, self.dimensions)), None
+        tree = cKDTree(self.positions)
+        pairs = tree.query_pairs(r=self.search_radius, output_type="ndarray")
+        vectors = self.positions[pairs[:, 0]] - self.positions[pairs[:, 1]]
+        distances = np.sqrt(np.sum(vectors ** 2, axis=1))
+        colliding = distances < np.sum(self.radii[pairs], axis=1)
+        return pairs[colliding], vectors[colliding], distances[colliding]
+
+    def _displacements(self, pairs, vectors, distances):
+        # Vectorized equivalent of `Particle.displace_by` for both particles of each pair
+        radii = self.radii[pairs]
+        collision_radius = np.sum(radii, axis=1)
+        f = np.full(len(pairs), 0.9)
+        touching = distances > 0
+        f[touching] = np.minimum(
+            0.9, 0.3 / ((distances[touching] / collision_radius[touching]) ** 2)
         )
+        # Particles at the exact same spot are pushed apart in a random direction
+        vectors[~touching] = np.random.normal(size=(np.sum(~touching), self.dimensions))
+        directions = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+        # Larger particles are displaced less, due to their inertia.
+        volumes = sphere_volume(radii)
+        inertia = volumes[:, ::-1] / np.sum(volumes, axis=1)[:, np.newaxis]
+        push = directions * (f * collision_radius)[:, np.newaxis]
+        displacements = np.zeros_like(self.positions)
+        np.add.at(displacements, pairs[:, 0], push * inertia[:, 0, np.newaxis])
+        np.add.at(displacements, pairs[:, 1], -push * inertia[:, 1, np.newaxis])
+        return displacements
 
-        types = set(out_of_bounds_types)
-        unique_types = list(types)
+    def add_particles(self, radius, positions, type=None):
+        positions = np.array(positions, dtype=float)
+        dimensions = getattr(self, "dimensions", positions.shape[-1])
+        positions = positions.reshape(-1, dimensions)
+        if not any(pt is type for pt in self.particle_types):
+            self.particle_types.append(type)
+        type_id = next(i for i, pt in enumerate(self.particle_types) if pt is type)
+        self.positions = np.concatenate((self.positions, positions))
+        self.radii = np.concatenate((self.radii, np.full(len(positions), radius)))
+        self.type_ids = np.concatenate((self.type_ids, np.full(len(positions), type_id)))
 
-        # Remove out of bounds particles and return number of affected particles.
-        pruned = self.remove_particles(out_of_bounds_ids)
-        number_pruned = len(out_of_bounds_ids)
-        tot_number_pruned = len(out_of_bounds_ids)
-        number_pruned_per_type = {t["name"]: 0 for t in self.particle_types}
-        if tot_number_pruned > 0:
-            for t in unique_types:
-                number_pruned_per_type[t] = out_of_bounds_types.count(t)
-        return tot_number_pruned, number_pruned_per_type
+    def add_particle(self, radius, position, type=None):
+        self.add_particles(radius, [position], type=type)
+
+    def remove_particles(self, particles_id):
+        keep = np.ones(len(self), dtype=bool)
+        keep[np.array(particles_id, dtype=int)] = False
+        self.positions = self.positions[keep]
+        self.radii = self.radii[keep]
+        self.type_ids = self.type_ids[keep]
 
 
 class LargeParticleSystem(ParticleSystem):
@@ -460,6 +613,36 @@ def get_particle_trace(particle):
     )
 
 
+def _inside_voxels(positions, voxels):
+    # Return a mask of the positions that are inside of any of the voxels.
+    if isinstance(voxels, VoxelSet) and voxels.regular and np.all(voxels.size > 0):
+        return _inside_grid(positions, voxels)
+    # Fall back to an R-tree of the voxel boxes for irregular voxels.
+    if isinstance(voxels, VoxelSet):
+        boxes = voxels.as_boxes()
+    else:
+        boxes = [(*v.origin, *(v.origin + v.size)) for v in voxels]
+    offsets, _ = BoxRTree(boxes).query_batch(np.column_stack((positions, positions)))
+    return np.diff(offsets) > 0
+
+
+def _inside_grid(positions, voxels):
+    # Hash the grid indices of the voxels and of the positions on the voxel grid into
+    # integers, and look the positions up in the sorted voxel hashes.
+    indices = voxels.get_raw(copy=False)
+    if not len(indices):
+        return np.zeros(len(positions), dtype=bool)
+    grid = np.floor(positions / voxels.size).astype(int)
+    ldc = np.min(indices, axis=0)
+    dims = np.max(indices, axis=0) - ldc + 1
+    grid -= ldc
+    inside = np.all((grid >= 0) & (grid < dims), axis=1)
+    occupied = np.unique(np.ravel_multi_index((indices - ldc).T, dims))
+    codes = np.ravel_multi_index(grid[inside].T, dims)
+    inside[inside] = occupied[np.searchsorted(occupied, codes) % len(occupied)] == codes
+    return inside
+
+
 def sphere_volume(radius):
     return 4 / 3 * np.pi * radius ** 3
 
@@ -1,17 +1,26 @@
 from .strategy import PlacementStrategy
 from ..voxels import VoxelSet
-from ..particles import ParticleSystem
+from ..particles import ParticleSystem, ArrayParticleSystem
 from ..exceptions import *
 from ..reporting import report, warn
 from .. import config
+from ..config import types
 import itertools, numpy as np
 
 
 @config.node
 class ParticlePlacement(PlacementStrategy):
+    """
+    Place cells as repelling particles until there is no overlap between the somas.
+    The ``engine`` selects the particle system: ``particles`` moves the particles one
+    colliding neighbourhood at a time, ``arrays`` resolves all collisions at once each
+    iteration, which is much faster and uses less memory for large amounts of cells.
+    """
+
     prune = config.attr(type=bool, default=True)
     bounded = config.attr(type=bool, default=False)
     restrict = config.attr(type=dict)
+    engine = config.attr(type=types.in_(["particles", "arrays"]), default="particles")
 
     def place(self, chunk, indicators):
         voxels = VoxelSet.concatenate(
@@ -29,22 +38,24 @@ class ParticlePlacement(PlacementStrategy):
             for name, indicator in indicators.items()
         ]
         # Create and fill the particle system.
-        system = ParticleSystem(track_displaced=True, scaffold=self.scaffold)
+        if self.engine == "arrays":
+            system = ArrayParticleSystem(track_displaced=True, scaffold=self.scaffold)
+        else:
+            system = ParticleSystem(track_displaced=True, scaffold=self.scaffold)
         system.fill(voxels, particles)
 
-        if len(system.particles) == 0:
+        if len(system) == 0:
             return
 
         # Find the set of colliding particles
         colliding = system.find_colliding_particles()
+        in_bounds = {}
         if len(colliding) > 0:
             system.solve_collisions()
             if self.prune:
-                number_pruned, pruned_per_type = system.prune(
-                    at_risk_particles=system.displaced_particles
-                )
+                in_bounds = system.prune(at_risk_particles=system.displaced_particles)
                 for name, indicator in indicators.items():
-                    pruned = pruned_per_type[name]
+                    pruned = np.count_nonzero(~in_bounds[name])
                     total = indicator.guess(chunk)
                     if not total:
                         pct = 0
@@ -55,10 +66,10 @@ class ParticlePlacement(PlacementStrategy):
         for pt in system.particle_types:
             cell_type = self.scaffold.cell_types[pt["name"]]
             indicator = indicators[pt["name"]]
-            particle_positions = [p.position for p in system.particles if p.type is pt]
-            if len(particle_positions) == 0:
+            positions = system.get_positions(pt)
+            if pt["name"] in in_bounds:
+                positions = positions[in_bounds[pt["name"]]]
+            if len(positions) == 0:
                 continue
-            positions = np.empty((len(particle_positions), 3))
-            positions[:] = particle_positions
             print(f"Placing {len(positions)} {cell_type.name} in {chunk}")
             self.place_cells(indicator, positions, chunk)
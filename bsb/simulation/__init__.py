@@ -4,4 +4,4 @@ from .connection import ConnectionModel
 from .device import DeviceModel
 from .targetting import NeuronTargetting, TargetsSections
 from .adapter import Simulation
-from .results import SimulationResult, SimulationRecorder
+from .results import SimulationResult, SimulationRecorder, ResultWriter
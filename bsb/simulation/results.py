@@ -1,5 +1,9 @@
 from ..reporting import warn
+import mpi4py.MPI as MPI
+import numpy as np
 import traceback
+import h5py
+import os
 
 
 class SimulationResult:
@@ -17,17 +21,41 @@ class SimulationResult:
     def _collect(self, recorder):
         return recorder.get_path(), recorder.get_data(), recorder.get_meta()
 
-    def collect(self):
+    def _flush(self, recorder):
+        return recorder.get_path(), recorder.flush(), recorder.get_meta()
+
+    def collect(self, streams=True):
+        """
+        Collect the data of the recorders, without freeing it. Streaming recorders only
+        hold the data recorded since their last flush, so to write all of their data,
+        :meth:`.flush` them instead, and collect the others with ``streams=False``.
+
+        :param streams: Whether to collect the streaming recorders too.
+        :type streams: bool
+        """
         for recorder in self.recorders:
             if hasattr(recorder, "multi_collect"):
                 yield from (
                     self._collect(subrecorder) for subrecorder in recorder.multi_collect()
                 )
-            else:
+            elif streams or not recorder.streams:
                 yield self._collect(recorder)
 
-    def safe_collect(self):
-        gen = iter(self.collect())
+    def flush(self):
+        """
+        Collect the data that the streaming recorders recorded since their last flush.
+        """
+        for recorder in self.recorders:
+            if recorder.streams:
+                yield self._flush(recorder)
+
+    def safe_collect(self, streams=True):
+        return self._safely(self.collect(streams=streams))
+
+    def safe_flush(self):
+        return self._safely(self.flush())
+
+    def _safely(self, gen):
         while True:
             try:
                 yield next(gen)
@@ -39,6 +67,9 @@ class SimulationResult:
 
 
 class SimulationRecorder:
+    # Streaming recorders can be flushed during the simulation, see `flush`.
+    streams = False
+
     def get_path(self):
         raise NotImplementedError("Recorders need to implement the `get_path` function.")
 
@@ -48,6 +79,13 @@ class SimulationRecorder:
     def get_meta(self):
         return {}
 
+    def flush(self):
+        """
+        Return the data recorded since the last flush, and free it. Only called on
+        recorders that set ``streams`` to ``True``.
+        """
+        raise NotImplementedError("Streaming recorders need to implement `flush`.")
+
 
 class ClosureRecorder(SimulationRecorder):
     def __init__(self, path_func, data_func, meta_func=None):
@@ -74,3 +112,136 @@ class PresetPathMixin:
 class PresetMetaMixin:
     def get_meta(self):
         return self.meta
+
+
+class ResultWriter:
+    """
+    Write simulation results to HDF5 incrementally. Each rank appends its data to
+    resizable, chunked datasets in a shard file of its own, so that data can be written
+    during the simulation and the ranks don't have to take turns. At the end the shards
+    are merged into the result file.
+
+    :param path: Path of the result file.
+    :type path: str
+    :param comm: MPI communicator of the ranks that write to the result file.
+    :type comm: mpi4py.MPI.Comm
+    :param block_size: Maximum amount of bytes to copy at once while merging.
+    :type block_size: int
+    """
+
+    def __init__(self, path, comm=None, block_size=2**26):
+        self.path = path
+        self._comm = comm or MPI.COMM_WORLD
+        self._block_size = block_size
+        self._file = None
+
+    @property
+    def shard_path(self):
+        return self._shard_path(self._comm.Get_rank())
+
+    def _shard_path(self, rank):
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.rank{rank}{ext}"
+
+    def append(self, path, data, meta=None):
+        """
+        Append data along the first axis of the dataset at the given path of the shard.
+
+        :param path: Path of the dataset, as a sequence of group names.
+        :type path: Iterable[str]
+        :param data: Data to append.
+        :type data: numpy.ndarray
+        :param meta: Attributes to set on the dataset.
+        :type meta: dict
+        """
+        if self._file is None:
+            self._file = h5py.File(self.shard_path, "w")
+        _append(self._file, "/".join(str(p) for p in path), data, meta)
+
+    def write(self, results):
+        """
+        Append the results of ``SimulationResult.safe_collect`` or
+        ``SimulationResult.safe_flush`` to the shard.
+        """
+        for path, data, meta in results:
+            try:
+                self.append(path, data, meta)
+            except Exception:
+                if not isinstance(data, np.ndarray):
+                    warn(f"Recorder {path} numpy.ndarray expected, got {type(data)}")
+                else:
+                    warn(
+                        f"Recorder {path} processing errored out:"
+                        + f" {data.dtype} {data.shape}\n\n{traceback.format_exc()}"
+                    )
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def merge(self, attrs=None):
+        """
+        Close the shards and merge them, in order of rank, into the result file. Data of
+        the same path on multiple ranks is concatenated. Collective call.
+
+        :param attrs: Attributes to set on the result file.
+        :type attrs: dict
+        :returns: Path of the result file.
+        :rtype: str
+        """
+        self.close()
+        self._comm.Barrier()
+        if self._comm.Get_rank() == 0:
+            with h5py.File(self.path, "w") as f:
+                f.attrs.update(attrs or {})
+                for rank in range(self._comm.Get_size()):
+                    shard_path = self._shard_path(rank)
+                    if not os.path.exists(shard_path):
+                        continue
+                    with h5py.File(shard_path, "r") as shard:
+                        shard.visititems(lambda path, obj: self._merge(f, path, obj))
+                    os.remove(shard_path)
+        self._comm.Barrier()
+        return self.path
+
+    def _merge(self, f, path, obj):
+        if not isinstance(obj, h5py.Dataset):
+            return
+        # Copy the dataset in blocks of rows, to bound the memory use.
+        row_size = max(obj.dtype.itemsize * int(np.prod(obj.shape[1:])), 1)
+        rows = max(self._block_size // row_size, 1)
+        meta = dict(obj.attrs)
+        for start in range(0, len(obj), rows):
+            _append(f, path, obj[start : start + rows], meta)
+        if not len(obj):
+            _append(f, path, obj[()], meta)
+
+
+def _append(f, path, data, meta=None):
+    data = np.asarray(data)
+    if not data.ndim:
+        data = data.reshape(1)
+    if path in f:
+        d = f[path]
+        n = len(d)
+        d.resize(n + len(data), axis=0)
+        d[n:] = data
+    else:
+        d = f.create_dataset(
+            path,
+            data=data,
+            maxshape=(None, *data.shape[1:]),
+            chunks=_chunks(data),
+        )
+    for k, v in (meta or {}).items():
+        d.attrs[k] = v
+
+
+def _chunks(data):
+    # Chunks of about 64KiB. HDF5 requires positive chunk dimensions.
+    shape = tuple(max(s, 1) for s in data.shape[1:])
+    row_size = max(data.dtype.itemsize * int(np.prod(shape)), 1)
+    return (max(2**16 // row_size, 1), *shape)
@@ -121,15 +121,12 @@ class SphericalTargetting(NeuronTargetting, classmap_entry="sphere"):
 
     def get_targets(self):
         """
-        Target all or certain cells within a cylinder of specified radius.
+        Target all or certain cells within a sphere of specified radius.
         """
         sets = [self.scaffold.get_placement_set(t) for t in self.cell_types]
         targets = []
         for set in sets:
-            if not set.positions:
-                continue
-            distances = np.sum((set.positions - self.origin) ** 2)
-            targets.extend(set.identifiers[distances <= self.radius])
+            targets.extend(set.query_sphere(self.origin, self.radius))
         return np.array(targets)
 
 
@@ -5,6 +5,7 @@ from ...simulation import (
     DeviceModel,
     SimulationResult,
     SimulationRecorder,
+    ResultWriter,
 )
 from ...simulation.targetting import NeuronTargetting
 from ... import config
@@ -15,6 +16,7 @@ from mpi4py.MPI import COMM_WORLD as mpi
 import numpy as np
 import itertools as it
 import functools
+import bisect
 import os
 import time
 import psutil
@@ -93,19 +95,28 @@ class ArborCell(CellModel):
     def _add_labels(self, gid, labels, morphology):
         pwlin = arbor.place_pwlin(morphology)
 
-        def comp_label(comp):
-            if comp.id == -1:
+        def comp_label(id, start):
+            if id == -1:
                 warn(f"Encountered nil compartment on {gid}")
                 return
-            loc, d = pwlin.closest(*comp.start)
+            loc, d = pwlin.closest(*start)
             if d > 0.0001:
-                raise AdapterError(f"Couldn't find {comp.start}, on {self._str(gid)}")
-            labels[f"comp_{comp.id}"] = str(loc)
+                raise AdapterError(f"Couldn't find {start}, on {self._str(gid)}")
+            labels[f"comp_{id}"] = str(loc)
 
-        comps_from = self.adapter._connections_from[gid]
-        comps_on = (rcv.comp_on for rcv in self.adapter._connections_on[gid])
-        gaps = (c.to_compartment for c in self.adapter._gap_junctions_on.get(gid, []))
-        it.consume(comp_label(i) for i in it.chain(comps_from, comps_on, gaps))
+        transmitters = self.adapter._connections_from
+        receivers = self.adapter._connections_on
+        comps_from = zip(
+            transmitters.get(gid, "comp").tolist(), transmitters.get(gid, "start")
+        )
+        comps_on = zip(
+            receivers.get(gid, "comp_on").tolist(), receivers.get(gid, "start")
+        )
+        gaps = (
+            (c.to_compartment.id, c.to_compartment.start)
+            for c in self.adapter._gap_junctions_on.get(gid, [])
+        )
+        it.consume(it.starmap(comp_label, it.chain(comps_from, comps_on, gaps)))
         labels[self.default_endpoint] = "(root)"
         return labels
 
@@ -116,13 +127,8 @@ class ArborCell(CellModel):
         decor.place("(root)", arbor.spike_detector(-10), self.default_endpoint)
 
     def _create_transmitters(self, gid, decor):
-        done = set()
-        for comp in self.adapter._connections_from[gid]:
-            if comp.id in done:
-                continue
-            else:
-                done.add(comp.id)
-            decor.place(f'"comp_{comp.id}"', arbor.spike_detector(-10), f"comp_{comp.id}")
+        for id in np.unique(self.adapter._connections_from.get(gid, "comp")).tolist():
+            decor.place(f'"comp_{id}"', arbor.spike_detector(-10), f"comp_{id}")
 
     def _create_gaps(self, gid, decor):
         done = set()
@@ -135,11 +141,12 @@ class ArborCell(CellModel):
             decor.place(f'"comp_{comp.id}"', arbor.junction("gj"), f"gap_{comp.id}")
 
     def _create_receivers(self, gid, decor):
-        for rcv in self.adapter._connections_on[gid]:
+        receivers = self.adapter._connections_on
+        for comp_on, index in zip(
+            receivers.get(gid, "comp_on").tolist(), receivers.get(gid, "index").tolist()
+        ):
             decor.place(
-                f'"comp_{rcv.comp_on.id}"',
-                rcv.synapse,
-                f"comp_{rcv.comp_on.id}_{rcv.index}",
+                f'"comp_{comp_on}"', arbor.synapse("expsyn"), f"comp_{comp_on}_{index}"
             )
 
 
@@ -180,49 +187,64 @@ class ArborConnection(ConnectionModel):
     def validate(self):
         pass
 
-    def make_receiver(*args):
-        return Receiver(*args)
-
     def gap_(self, conn):
         l = arbor.cell_local_label(f"gap_{conn.to_compartment.id}")
         g = arbor.cell_global_label(int(conn.from_id), f"gap_{conn.from_compartment.id}")
         return arbor.gap_junction_connection(g, l, self.weight)
 
 
-class ReceiverCollection(list):
-    def __init__(self):
-        super().__init__()
-        self._endpoint_counters = {}
-
-    def append(self, rcv):
-        endpoint = rcv.comp_on.id
-        id = self._endpoint_counters.get(endpoint, 0)
-        self._endpoint_counters[endpoint] = id + 1
-        rcv.index = id
-        super().append(rcv)
-
-
-class Receiver:
-    def __init__(self, conn_model, from_gid, comp_from, comp_on):
-        self.conn_model = conn_model
-        self.from_gid = from_gid
-        self.comp_from = comp_from
-        self.comp_on = comp_on
-        self.synapse = arbor.synapse("expsyn")
-
-    @property
-    def weight(self):
-        return self.conn_model.weight
-
-    @property
-    def delay(self):
-        return self.conn_model.delay
-
-    def from_(self):
-        return arbor.cell_global_label(self.from_gid, f"comp_{self.comp_from.id}")
-
-    def on(self):
-        return arbor.cell_local_label(f"comp_{self.comp_on.id}_{self.index}")
+class ConnectionTable:
+    """
+    Table of connection data per gid, in compressed sparse row format. The rows of the
+    ``i``-th of the sorted gids are ``offsets[i]:offsets[i + 1]`` of each column, so
+    looking up the data of a gid is a binary search and an array slice.
+
+    :param gids: The gids to keep the data of, rows of other gids are dropped.
+    :type gids: Iterable[int]
+    :param keys: The gid of each row.
+    :type keys: numpy.ndarray
+    :param columns: The columns of data, with a value for each row.
+    :type columns: Dict[str, numpy.ndarray]
+    """
+
+    def __init__(self, gids, keys, **columns):
+        self.gids = np.unique(np.fromiter(gids, dtype=int))
+        keys = np.asarray(keys, dtype=int)
+        keep = np.isin(keys, self.gids)
+        order = np.argsort(keys[keep], kind="stable")
+        keys = keys[keep][order]
+        self.columns = {k: np.asarray(v)[keep][order] for k, v in columns.items()}
+        self.offsets = np.append(np.searchsorted(keys, self.gids), len(keys))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def rows(self, gid):
+        """
+        Return the slice of the rows of a gid.
+        """
+        i = np.searchsorted(self.gids, gid)
+        if i == len(self.gids) or self.gids[i] != gid:
+            return slice(0, 0)
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def get(self, gid, column):
+        """
+        Return the data of a gid in a column.
+        """
+        return self.columns[column][self.rows(gid)]
+
+
+def _occurrence_index(a, b):
+    # Number each row by how many earlier rows have the same `a` and `b` values.
+    order = np.lexsort((b, a))
+    sa, sb = a[order], b[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = (sa[1:] != sa[:-1]) | (sb[1:] != sb[:-1])
+    starts = np.maximum.accumulate(np.where(first, np.arange(len(a)), 0))
+    index = np.empty(len(a), dtype=int)
+    index[order] = np.arange(len(a)) - starts
+    return index
 
 
 class QuickContains:
@@ -246,10 +268,21 @@ class QuickContains:
 class QuickLookup:
     def __init__(self, adapter):
         network = adapter.scaffold
-        self._contains = [
+        self._index(
             QuickContains(model, network.get_placement_set(model.name))
             for model in adapter.cell_models.values()
-        ]
+        )
+
+    def _index(self, contains):
+        # Sort the gid ranges of all the cell models, so that the range of a gid can be
+        # found with a binary search.
+        ranges = sorted(
+            ((start, stop, c) for c in contains for start, stop in c._ranges),
+            key=lambda r: r[0],
+        )
+        self._starts = [start for start, _, _ in ranges]
+        self._stops = [stop for _, stop, _ in ranges]
+        self._owners = [c for _, _, c in ranges]
 
     def lookup_kind(self, gid):
         return self._lookup(gid)._kind
@@ -258,10 +291,10 @@ class QuickLookup:
         return self._lookup(gid)._model
 
     def _lookup(self, gid):
-        try:
-            return next(c for c in self._contains if gid in c)
-        except StopIteration:
-            raise UnknownGIDError(f"Can't find gid {gid}.") from None
+        i = bisect.bisect_right(self._starts, gid) - 1
+        if i < 0 or gid >= self._stops[i]:
+            raise UnknownGIDError(f"Can't find gid {gid}.")
+        return self._owners[i]
 
 
 class ArborRecipe(arbor.recipe):
@@ -318,9 +351,19 @@ class ArborRecipe(arbor.recipe):
     def connections_on(self, gid):
         if self._is_relay(gid):
             return []
+        table = self._adapter._connections_on
+        rows = table.rows(gid)
+        columns = ("from_gid", "comp_from", "comp_on", "index", "weight", "delay")
         return [
-            arbor.connection(rcv.from_(), rcv.on(), rcv.weight, rcv.delay)
-            for rcv in self._adapter._connections_on[gid]
+            arbor.connection(
+                arbor.cell_global_label(from_gid, f"comp_{comp_from}"),
+                arbor.cell_local_label(f"comp_{comp_on}_{index}"),
+                weight,
+                delay,
+            )
+            for from_gid, comp_from, comp_on, index, weight, delay in zip(
+                *(table.columns[c][rows].tolist() for c in columns)
+            )
         ]
 
     def gap_junctions_on(self, gid):
@@ -431,54 +474,23 @@ class ArborSimulation(Simulation):
             report(arbor.profiler_summary(), level=1)
 
     def collect_output(self, simulation):
-        import h5py, time, random, traceback
+        import time, random
 
         timestamp = str(time.time()).split(".")[0] + str(random.random()).split(".")[1]
         timestamp = self.broadcast(timestamp)
-        result_path = "results_" + self.name + "_" + timestamp + ".hdf5"
-        rank = self.get_rank()
-        for node in range(self.get_size()):
-            self.barrier()
-            if node == rank:
-                report("Node", rank, "is writing", level=2, all_nodes=True)
-                with h5py.File(result_path, "a") as f:
-                    if rank == 0:
-                        spikes = simulation.spikes()
-                        spikes = np.column_stack(
-                            (
-                                np.fromiter((l[0][0] for l in spikes), dtype=int),
-                                np.fromiter((l[1] for l in spikes), dtype=int),
-                            )
-                        )
-                        f.create_dataset("all_spikes_dump", data=spikes)
-                    f.attrs["configuration_string"] = self.scaffold.configuration._raw
-                    for path, data, meta in self.result.safe_collect():
-                        try:
-                            path = "/".join(f"{p}" for p in path)
-                            if path in f:
-                                # Path exists, append by recreating concatenated data
-                                data = np.concatenate((f[path][()], data))
-                                _meta = d.attrs[k].copy()
-                                _meta.update(meta)
-                                meta = _meta
-                                del f[path]
-                            d = f.create_dataset(path, data=data)
-                            for k, v in meta.items():
-                                d.attrs[k] = v
-                        except Exception as e:
-                            if not isinstance(data, np.ndarray):
-                                warn(
-                                    f"Recorder `{path}` expected numpy.ndarray data,"
-                                    + f" got {type(data)}"
-                                )
-                            else:
-                                warn(
-                                    f"Recorder {path} processing errored out."
-                                    + f" - Data: {data.dtype} {data.shape}"
-                                    + f"\n\n{traceback.format_exc()}"
-                                )
-            self.barrier()
-        return result_path
+        writer = ResultWriter("results_" + self.name + "_" + timestamp + ".hdf5", mpi)
+        report("Node", self.get_rank(), "is writing", level=2, all_nodes=True)
+        if self.get_rank() == 0:
+            spikes = simulation.spikes()
+            spikes = np.column_stack(
+                (
+                    np.fromiter((l[0][0] for l in spikes), dtype=int),
+                    np.fromiter((l[1] for l in spikes), dtype=int),
+                )
+            )
+            writer.append(("all_spikes_dump",), spikes)
+        writer.write(self.result.safe_collect())
+        return writer.merge({"configuration_string": self.scaffold.configuration._raw})
 
     def get_recipe(self):
         return ArborRecipe(self)
@@ -499,36 +511,62 @@ class ArborSimulation(Simulation):
                 self._gap_junctions_on.setdefault(conn.from_id, []).append(conn)
 
     def _cache_connections(self):
-        self._connections_on = {gid: ReceiverCollection() for gid in self.gids}
-        self._connections_from = {gid: [] for gid in self.gids}
+        # Collect the connections in flat columns, and store the ones from and onto the
+        # gids of this node in CSR tables, so that the recipe callbacks only slice arrays.
+        cols = collections.defaultdict(list)
+
+        def add(from_gid, to_gid, comp_from, comp_on, conn_model):
+            cols["from"].append(from_gid)
+            cols["to"].append(to_gid)
+            cols["comp_from"].append(comp_from.id)
+            cols["from_start"].append(comp_from.start)
+            cols["comp_on"].append(comp_on.id)
+            cols["on_start"].append(comp_on.start)
+            cols["weight"].append(conn_model.weight)
+            cols["delay"].append(conn_model.delay)
+
         for conn_set in self.scaffold.get_connectivity_sets():
             if conn_set.is_orphan() or not len(conn_set):
                 continue
-            ct = conn_set.connection_types[0]
             try:
                 conn_model = self.connection_models[conn_set.tag]
             except KeyError:
                 raise AdapterError(f"Missing connection model `{conn_set.tag}`")
             if conn_model.gap:
                 continue
-            w = conn_model.weight
             for conn in conn_set.intersections:
-                from_gid = int(conn.from_id)
-                to_gid = int(conn.to_id)
-                comp_from = conn.from_compartment
-                comp_on = conn.to_compartment
-                if from_gid in self._connections_from:
-                    self._connections_from[from_gid].append(comp_from)
-                if to_gid in self._connections_on:
-                    self._connections_on[to_gid].append(
-                        conn_model.make_receiver(from_gid, comp_from, comp_on)
-                    )
-            for gid, relays in self._relays_on.items():
-                for (from_gid, comp_from, comp_on, conn_model) in relays:
-                    self._connections_from[from_gid].append(comp_from)
-                    self._connections_on[gid].append(
-                        conn_model.make_receiver(from_gid, comp_from, comp_on)
-                    )
+                add(
+                    int(conn.from_id),
+                    int(conn.to_id),
+                    conn.from_compartment,
+                    conn.to_compartment,
+                    conn_model,
+                )
+        for gid, relays in self._relays_on.items():
+            for (from_gid, comp_from, comp_on, conn_model) in relays:
+                add(int(from_gid), gid, comp_from, comp_on, conn_model)
+        from_gids = np.array(cols["from"], dtype=int)
+        to_gids = np.array(cols["to"], dtype=int)
+        comp_from = np.array(cols["comp_from"], dtype=int)
+        comp_on = np.array(cols["comp_on"], dtype=int)
+        self._connections_on = ConnectionTable(
+            self.gids,
+            to_gids,
+            from_gid=from_gids,
+            comp_from=comp_from,
+            comp_on=comp_on,
+            start=np.array(cols["on_start"], dtype=float).reshape(-1, 3),
+            # Number the synapses on the same compartment of a cell.
+            index=_occurrence_index(to_gids, comp_on),
+            weight=np.array(cols["weight"], dtype=float),
+            delay=np.array(cols["delay"], dtype=float),
+        )
+        self._connections_from = ConnectionTable(
+            self.gids,
+            from_gids,
+            comp=comp_from,
+            start=np.array(cols["from_start"], dtype=float).reshape(-1, 3),
+        )
 
     def _index_relays(self):
         report("Indexing relays.")
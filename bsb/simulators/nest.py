@@ -6,13 +6,13 @@ from ..simulation import (
 )
 from ..reporting import report, warn
 from ..exceptions import *
+from ..helpers import listify_input
 from .. import config
 from ..config import types, nodes as config_nodes
 import os, json, weakref, numpy as np
 from itertools import chain
-from copy import deepcopy
 from sklearn.neighbors import KDTree
-from ..simulation import SimulationRecorder, SimulationResult
+from ..simulation import SimulationRecorder, SimulationResult, ResultWriter
 import warnings
 import h5py
 import time
@@ -47,15 +47,110 @@ class MapsScaffoldIdentifiers:
     def reset_identifiers(self):
         self.nest_identifiers = []
         self.scaffold_identifiers = []
-        self.scaffold_to_nest_map = {}
+        # Row of the identifier of the first cell of each chunk, and the number of cells
+        # in the chunk, to map the cells of connectivity data to their identifiers.
+        self.chunk_offsets = {}
+        self.identifier_map = IdentifierMap([], [])
 
     def _build_identifier_map(self):
-        self.scaffold_to_nest_map = dict(
-            zip(self.scaffold_identifiers, self.nest_identifiers)
+        self.identifier_map = IdentifierMap(
+            self.scaffold_identifiers, self.nest_identifiers
         )
 
     def get_nest_ids(self, ids):
-        return [self.scaffold_to_nest_map[id] for id in ids]
+        return self.identifier_map.map(ids)
+
+
+class IdentifierMap:
+    """
+    Vectorized bidirectional map between scaffold and NEST identifiers. Identifiers are
+    usually dense ranges, which are mapped through a lookup table. Sparse identifiers are
+    kept as sorted arrays and mapped with a binary search. Either way batches of
+    identifiers are mapped at once, instead of with a dictionary lookup per identifier.
+
+    :param scaffold_ids: Scaffold identifiers.
+    :type scaffold_ids: Iterable[int]
+    :param nest_ids: NEST identifier of each scaffold identifier.
+    :type nest_ids: Iterable[int]
+    """
+
+    def __init__(self, scaffold_ids, nest_ids):
+        scaffold_ids = np.array(list(scaffold_ids), dtype=int)
+        nest_ids = np.array(list(nest_ids), dtype=int)
+        if len(scaffold_ids) != len(nest_ids):
+            raise ValueError(
+                f"Can't map {len(scaffold_ids)} scaffold identifiers"
+                + f" to {len(nest_ids)} NEST identifiers."
+            )
+        self._scaffold_ids = scaffold_ids
+        self._nest_ids = nest_ids
+        self._forward = _lookup_table(scaffold_ids, nest_ids)
+        self._inverse = _lookup_table(nest_ids, scaffold_ids)
+
+    def __len__(self):
+        return len(self._scaffold_ids)
+
+    @property
+    def scaffold_ids(self):
+        return self._scaffold_ids
+
+    @property
+    def nest_ids(self):
+        return self._nest_ids
+
+    @classmethod
+    def merge(cls, maps):
+        """
+        Merge several maps into one.
+        """
+        maps = list(maps)
+        return cls(
+            np.concatenate([m._scaffold_ids for m in maps] + [np.empty(0, dtype=int)]),
+            np.concatenate([m._nest_ids for m in maps] + [np.empty(0, dtype=int)]),
+        )
+
+    def map(self, ids):
+        """
+        Map scaffold identifiers to NEST identifiers.
+
+        :raises: KeyError with the first unknown identifier.
+        """
+        return _lookup(self._forward, ids)
+
+    def inverse(self, ids):
+        """
+        Map NEST identifiers to scaffold identifiers.
+
+        :raises: KeyError with the first unknown identifier.
+        """
+        return _lookup(self._inverse, ids)
+
+
+def _lookup_table(keys, values):
+    # Use a direct lookup table if the keys are dense enough, or sorted arrays otherwise.
+    if len(keys) and np.ptp(keys) < 2 * len(keys):
+        offset = np.min(keys)
+        table = np.full(np.ptp(keys) + 1, -1, dtype=int)
+        table[keys - offset] = values
+        return "dense", offset, table
+    order = np.argsort(keys, kind="stable")
+    return "sorted", keys[order], values[order]
+
+
+def _lookup(table, ids):
+    ids = np.asarray(ids, dtype=int)
+    kind, keys, values = table
+    if kind == "dense":
+        idx = ids - keys
+        found = (idx >= 0) & (idx < len(values))
+        found[found] = values[idx[found]] != -1
+    else:
+        idx = np.searchsorted(keys, ids)
+        found = idx < len(keys)
+        found[found] = keys[idx[found]] == ids[found]
+    if not np.all(found):
+        raise KeyError(int(ids[~found].flat[0]))
+    return values[idx]
 
 
 def _merge_params(node, models, model_key, model_params):
@@ -312,6 +407,7 @@ class NestSimulation(Simulation):
     default_synapse_model = config.attr(type=str, default="static_synapse")
     default_neuron_model = config.attr(type=str, default="iaf_cond_alpha")
     verbosity = config.attr(type=str, default="M_ERROR")
+    connect_block_size = config.attr(type=types.int(min=1), default=1000000)
 
     @property
     def nest(self):
@@ -328,7 +424,8 @@ class NestSimulation(Simulation):
         self.suffix = ""
         self.multi = False
         self.has_lock = False
-        self.global_identifier_map = {}
+        self.global_identifier_map = IdentifierMap([], [])
+        self._local_nodes = None
         self.simulation_id = _randint()
 
     def prepare(self):
@@ -462,7 +559,8 @@ class NestSimulation(Simulation):
         self.is_prepared = False
         if hasattr(self, "nest"):
             self.reset_kernel()
-        self.global_identifier_map = {}
+        self.global_identifier_map = IdentifierMap([], [])
+        self._local_nodes = None
         for cell_model in self.cell_models.values():
             cell_model.reset()
         if self.has_lock:
@@ -548,45 +646,15 @@ class NestSimulation(Simulation):
     def collect_output(self, simulator):
         report("Collecting output...", level=2)
         tick = time.time()
-        try:
-            import mpi4py
-
-            rank = mpi4py.MPI.COMM_WORLD.rank
-        except Exception as e:
-            print(str(e))
-            rank = 0
-
         timestamp = str(time.time()).split(".")[0] + str(_randint())
         result_path = "results_" + self.name + "_" + timestamp + ".hdf5"
-        if rank == 0:
-            with h5py.File(result_path, "a") as f:
-                f.attrs["configuration_string"] = self.scaffold.configuration._raw
-                for path, data, meta in self.result.safe_collect():
-                    try:
-                        path = "/".join(path)
-                        if path in f:
-                            data = np.vstack((f[path][()], data))
-                            del f[path]
-                        d = f.create_dataset(path, data=data)
-                        for k, v in meta.items():
-                            d.attrs[k] = v
-                    except Exception as e:
-                        import traceback
-
-                        traceback.print_exc()
-                        if not isinstance(data, np.ndarray):
-                            warn(
-                                "Recorder {} numpy.ndarray expected, got {}".format(
-                                    path, type(data)
-                                )
-                            )
-                        else:
-                            warn(
-                                "Recorder {} processing errored out: {}".format(
-                                    path, "{} {}".format(data.dtype, data.shape)
-                                )
-                            )
-        mpi4py.MPI.COMM_WORLD.bcast(result_path, root=0)
+        result_path = mpi4py.MPI.COMM_WORLD.bcast(result_path, root=0)
+        writer = ResultWriter(result_path)
+        # The spike recorders of NEST read and remove the spike files of all ranks, so
+        # only rank 0 collects them, and the other ranks only take part in the merge.
+        if mpi4py.MPI.COMM_WORLD.rank == 0:
+            writer.write(self.result.safe_collect())
+        writer.merge({"configuration_string": self.scaffold.configuration._raw})
         report(
             f"Output collected in '{result_path}'. "
             + f"{time.time() - tick:.2f}s elapsed.",
@@ -663,36 +731,45 @@ class NestSimulation(Simulation):
         # Iterate over all simulation components that contain representations
         # of scaffold components with an ID to create a map of all scaffold ID's
         # to all NEST ID's this adapter manages
+        maps = []
         for mapping_type in chain(self.entities.values(), self.cell_models.values()):
             # "Freeze" the type's identifiers into a map
             mapping_type._build_identifier_map()
-            # Add the type's map to the global map
-            self.global_identifier_map.update(mapping_type.scaffold_to_nest_map)
+            maps.append(mapping_type.identifier_map)
+        # Merge the type's maps into the global map
+        self.global_identifier_map = IdentifierMap.merge(maps)
 
     def get_nest_ids(self, ids):
-        return [self.global_identifier_map[id] for id in ids]
+        return self.global_identifier_map.map(ids)
 
     def get_scaffold_ids(self, ids):
-        scaffold_map = {v: k for k, v in self.global_identifier_map.items()}
-        return [scaffold_map[id] for id in ids]
+        return self.global_identifier_map.inverse(ids)
 
     def create_neurons(self):
         """
         Create a population of nodes in the NEST simulator based on the cell model
         configurations.
         """
+        ptr = 0
         for cell_model in self.cell_models.values():
             # Get the cell type's placement information
             ps = self.scaffold.get_placement_set(cell_model.name)
             nest_name = self.suffixed(cell_model.name)
             # Create the population's model
             self.create_model(cell_model)
-            scaffold_identifiers = ps.identifiers
-            report(
-                "Creating {} {}...".format(len(scaffold_identifiers), nest_name), level=3
-            )
-            nest_identifiers = self.nest.Create(nest_name, len(scaffold_identifiers))
-            cell_model.scaffold_identifiers.extend(scaffold_identifiers)
+            # Number the cells by counting through the chunks of the placement set, and
+            # keep the offset of each chunk to map connectivity data to the cells.
+            start = len(cell_model.scaffold_identifiers)
+            for chunk in ps.get_all_chunks():
+                with ps.chunk_context(chunk):
+                    count = len(ps)
+                offset = len(cell_model.scaffold_identifiers)
+                cell_model.chunk_offsets[chunk.id] = (offset, count)
+                cell_model.scaffold_identifiers.extend(range(ptr, ptr + count))
+                ptr += count
+            count = len(cell_model.scaffold_identifiers) - start
+            report("Creating {} {}...".format(count, nest_name), level=3)
+            nest_identifiers = self.nest.Create(nest_name, count)
             cell_model.nest_identifiers.extend(nest_identifiers)
 
     def create_entities(self):
@@ -729,7 +806,9 @@ class NestSimulation(Simulation):
 
     def connect_neurons(self):
         """
-        Connect the cells in NEST according to the connection model configurations
+        Connect the cells in NEST according to the connection model configurations. The
+        connectivity sets are streamed in blocks of ``connect_block_size`` connections,
+        and under MPI each rank only connects the blocks that target its own nodes.
         """
         order = NestConnection.resolve_order(self.connection_models)
 
@@ -745,29 +824,11 @@ class NestSimulation(Simulation):
                     ConnectivityWarning,
                 )
                 continue
-            # Get the NEST identifiers for the connections made in the connectivity matrix
-            try:
-                presynaptic_sources = np.array(
-                    self.get_nest_ids(np.array(cs.from_identifiers, dtype=int))
-                )
-            except KeyError as e:
-                raise UnknownGIDError(
-                    f"Unknown GID {e.args[0]} in presynaptic `{name}` data."
-                ) from None
-            try:
-                postsynaptic_targets = np.array(
-                    self.get_nest_ids(np.array(cs.to_identifiers, dtype=int))
-                )
-            except KeyError as e:
-                raise UnknownGIDError(
-                    f"Unknown GID {e.args[0]} in postsynaptic `{name}` data."
-                ) from None
-            if not len(presynaptic_sources) or not len(postsynaptic_targets):
+            if not len(cs):
                 warn("No connections for " + name)
                 continue
             # Accessing the postsynaptic type to be associated to the volume transmitter of the synapse
             postsynaptic_type = cs.connection_types[0].to_cell_types[0]
-            postsynaptic_cells = np.unique(postsynaptic_targets)
 
             # Create the synapse model in the simulator
             self.create_synapse_model(connection_model)
@@ -790,26 +851,28 @@ class NestSimulation(Simulation):
                     # If no receptor types are specified, go over the connection loop
                     # once, without setting any receptor type in the conn params.
                     receptor_types.append(None)
+                receptor_parameters = []
                 for receptor_type in receptor_types:
-                    single_connection_parameters = deepcopy(connection_parameters)
+                    single_connection_parameters = connection_parameters.copy()
                     if receptor_type is not None:
                         single_connection_parameters["receptor_type"] = receptor_type
-                    self.execute_command(
-                        self.nest.Connect,
-                        presynaptic_sources,
-                        postsynaptic_targets,
-                        connection_specifications,
-                        single_connection_parameters,
-                        exceptions={
-                            "IncompatibleReceptorType": {
-                                "from": None,
-                                "exception": catch_receptor_error(
-                                    "Invalid receptor specifications in {}: ".format(name)
-                                ),
-                            }
-                        },
-                    )
+                    receptor_parameters.append(single_connection_parameters)
+                for pre_block, post_block in self._iter_connection_blocks(cs, name):
+                    for single_connection_parameters in receptor_parameters:
+                        self._connect_block(
+                            name,
+                            pre_block,
+                            post_block,
+                            connection_specifications,
+                            single_connection_parameters,
+                        )
             else:
+                # The volume transmitters are created for all postsynaptic cells, on
+                # every rank, so this requires all of the connectivity data.
+                presynaptic_sources, postsynaptic_targets = self._load_connections(
+                    cs, name
+                )
+                postsynaptic_cells = np.unique(postsynaptic_targets)
                 # Create the volume transmitter if the connection is plastic with heterosynaptic plasticity
                 report("Creating volume transmitter for " + name, level=3)
                 volume_transmitters = self.create_volume_transmitter(
@@ -824,35 +887,107 @@ class NestSimulation(Simulation):
                     indexes = np.where(postsynaptic_targets == post_cell)[0]
                     pre_neurons = presynaptic_sources[indexes]
                     post_neurons = postsynaptic_targets[indexes]
-
-                    self.execute_command(
-                        self.nest.Connect,
+                    self._connect_block(
+                        name,
                         pre_neurons,
                         post_neurons,
                         connection_specifications,
                         connection_parameters,
-                        exceptions={
-                            "IncompatibleReceptorType": {
-                                "from": None,
-                                "exception": catch_receptor_error(
-                                    "Invalid receptor specifications in {}: ".format(name)
-                                ),
-                            }
-                        },
                     )
 
             if connection_model.is_teaching:
-                # We need to map the ID of the postsynaptic_target to its relative volume_transmitter
-                min_ID_postsynaptic = np.min(postsynaptic_targets)
+                # We need to map the ID of the postsynaptic_target to its relative
+                # volume_transmitter, which needs the minimum of all targets first.
+                # The volume transmitters aren't necessarily local to the rank of
+                # their postsynaptic cell, so all blocks are connected on all ranks.
+                blocks = lambda: self._iter_connection_blocks(cs, name, local=False)
+                min_ID_postsynaptic = min(np.min(post) for _, post in blocks())
                 min_ID_volume_transmitter = np.min(postsynaptic_type._vt_id)
                 delta_ID = min_ID_volume_transmitter - min_ID_postsynaptic
-                postsynaptic_volume_transmitters = postsynaptic_targets + delta_ID
-                self.nest.Connect(
-                    presynaptic_sources,
-                    postsynaptic_volume_transmitters,
-                    connection_specifications,
-                    {"model": "static_synapse", "weight": 1.0, "delay": 1.0},
+                for pre_block, post_block in blocks():
+                    self.nest.Connect(
+                        pre_block,
+                        post_block + delta_ID,
+                        connection_specifications,
+                        {"model": "static_synapse", "weight": 1.0, "delay": 1.0},
+                    )
+
+    def _iter_connection_blocks(self, cs, name, local=True):
+        # Stream the connectivity set and yield the NEST ids of its connections, in blocks
+        # of at most `connect_block_size` connections. With `local`, only connections to
+        # the nodes of this rank are yielded.
+        pre_map = self._connection_id_map(cs.pre_type_name, name, "pre")
+        post_map = self._connection_id_map(cs.post_type_name, name, "post")
+        blocks = cs.iter_blocks(block_size=self.connect_block_size)
+        for src_chunk, dest_chunk, src_locs, dest_locs in blocks:
+            post = post_map(dest_chunk, dest_locs[:, 0])
+            if local and self.get_size() > 1:
+                mask = self._is_local(post)
+                if not np.any(mask):
+                    continue
+                yield pre_map(src_chunk, src_locs[mask, 0]), post[mask]
+            else:
+                yield pre_map(src_chunk, src_locs[:, 0]), post
+
+    def _load_connections(self, cs, name):
+        blocks = list(self._iter_connection_blocks(cs, name, local=False))
+        return (
+            np.concatenate([pre for pre, _ in blocks] + [np.empty(0, dtype=int)]),
+            np.concatenate([post for _, post in blocks] + [np.empty(0, dtype=int)]),
+        )
+
+    def _connection_id_map(self, type_name, name, side):
+        # Return a function that maps the cell indices within a chunk to NEST ids, through
+        # the chunk offsets that `create_neurons` kept while creating the identifiers.
+        model = self.cell_models.get(type_name) or self.entities.get(type_name)
+        if model is None:
+            raise UnknownGIDError(f"No model for {side}synaptic `{name}` cells.")
+        ids = np.array(model.scaffold_identifiers, dtype=int)
+
+        def map_locs(chunk, locs):
+            locs = np.asarray(locs, dtype=int)
+            offset, count = model.chunk_offsets.get(chunk.id, (0, 0))
+            if np.any((locs < 0) | (locs >= count)):
+                raise UnknownGIDError(
+                    f"Unknown cell in chunk {chunk} of {side}synaptic `{name}` data."
                 )
+            return self._map_connection_ids(ids[offset + locs], name, side)
+
+        return map_locs
+
+    def _map_connection_ids(self, ids, name, side):
+        # Get the NEST identifiers for the connections made in the connectivity matrix
+        try:
+            return self.get_nest_ids(np.asarray(ids, dtype=int))
+        except KeyError as e:
+            raise UnknownGIDError(
+                f"Unknown GID {e.args[0]} in {side}synaptic `{name}` data."
+            ) from None
+
+    def _is_local(self, nest_ids):
+        # Create a sorted array of the nodes of this rank, the first time it's needed.
+        if self._local_nodes is None:
+            nodes = self.global_identifier_map.nest_ids
+            local = np.array(self.nest.GetStatus(nodes.tolist(), "local"), dtype=bool)
+            self._local_nodes = np.sort(nodes[local])
+        return np.isin(nest_ids, self._local_nodes)
+
+    def _connect_block(self, name, pre, post, conn_spec, syn_spec):
+        self.execute_command(
+            self.nest.Connect,
+            pre,
+            post,
+            conn_spec,
+            syn_spec,
+            exceptions={
+                "IncompatibleReceptorType": {
+                    "from": None,
+                    "exception": catch_receptor_error(
+                        "Invalid receptor specifications in {}: ".format(name)
+                    ),
+                }
+            },
+        )
 
     def create_devices(self):
         """
@@ -1,6 +1,7 @@
 from ...simulation import (
     Simulation,
     SimulationRecorder,
+    ResultWriter,
     CellModel,
     ConnectionModel,
     DeviceModel,
@@ -10,9 +11,8 @@ from ... import config
 from ...config import types
 from ...reporting import report, warn
 from ...exceptions import *
-import random, os, sys
+import random, os, sys, heapq
 import numpy as np
-import traceback
 import errr
 import time
 
@@ -133,11 +133,13 @@ class NeuronSimulation(Simulation):
     resolution = config.attr(type=float, default=1.0)
     initial = config.attr(type=float, default=-65.0)
     temperature = config.attr(type=float, required=True)
+    flush_interval = config.attr(type=types.float(min=0.0), default=None)
 
     def __init__(self):
         self.cells = {}
         self._next_gid = 0
         self.transmitter_map = {}
+        self._writer = None
 
     def validate(self):
         pass
@@ -272,11 +274,71 @@ class NeuronSimulation(Simulation):
             )
 
     def load_balance(self):
+        """
+        Distribute the cells over the ranks by their estimated cost, see
+        :meth:`.estimate_cell_costs` and :func:`.lpt_partition`. The total cost per rank
+        is kept in ``rank_costs``, and the ids of the cells of this rank in
+        ``node_cells``.
+        """
         rank = self.get_rank()
         size = self.get_size()
-        self.cell_total = self.scaffold.get_cell_total()
-        # Do a lazy round robin for now.
-        self.node_cells = set(range(rank, self.cell_total, size))
+        costs, chunks = self.estimate_cell_costs()
+        # Every rank calculates the same deterministic partition, no need to broadcast.
+        ranks, self.rank_costs = lpt_partition(costs, size, groups=chunks)
+        self.cell_total = len(costs)
+        # The costs are indexed by the cell ids of `_iter_cell_chunks`.
+        self.node_cells = set(np.nonzero(ranks == rank)[0].tolist())
+        if self.cell_total:
+            report(
+                f"Node {rank} got {len(self.node_cells)} cells,"
+                + f" {self.rank_costs[rank] / np.mean(self.rank_costs):.2f}x mean cost",
+                level=3,
+                all_nodes=True,
+            )
+
+    def estimate_cell_costs(self):
+        """
+        Estimate the cost of simulating each cell: the number of compartments of its
+        morphology, times one plus the number of mechanisms of its cell model, plus the
+        number of synapses it receives.
+
+        :returns: The cost and the id of the chunk of each cell, indexed by the cell ids
+          of :meth:`._iter_cell_chunks`.
+        :rtype: Tuple[numpy.ndarray, numpy.ndarray]
+        """
+        costs, chunks, offsets = [], [], {}
+        for cell_model, ps, chunk, ids in self._iter_cell_chunks():
+            compartments = _count_compartments(ps, len(ids), cell_model.name)
+            offsets[(cell_model.name, chunk.id)] = ids.start
+            costs.append(compartments * (1 + _count_mechanisms(cell_model)))
+            chunks.append(np.full(len(ids), chunk.id, dtype=int))
+        costs = np.concatenate(costs + [np.empty(0)])
+        for connection_model in self.connection_models.values():
+            try:
+                cs = self.scaffold.get_connectivity_set(connection_model.name)
+            except DatasetNotFoundError:
+                continue
+            post = cs.post_type_name
+            for _, dest_chunk, _, dest_locs in cs.iter_blocks():
+                offset = offsets.get((post, dest_chunk.id))
+                if offset is not None and len(dest_locs):
+                    cells = offset + dest_locs[:, 0]
+                    costs += np.bincount(cells, minlength=len(costs))
+        return costs, np.concatenate(chunks + [np.empty(0, dtype=int)])
+
+    def _iter_cell_chunks(self):
+        # Iterate over the chunks of the placement sets of the cell models, inside of the
+        # chunk context of the placement set, with the range of ids of the cells in the
+        # chunk. The cells are numbered by counting through the chunks of the placement
+        # sets in `get_all_chunks` order, one cell model after the other.
+        ptr = 0
+        for cell_model in self.cell_models.values():
+            ps = self.scaffold.get_placement_set(cell_model.name)
+            for chunk in ps.get_all_chunks():
+                with ps.chunk_context(chunk):
+                    ids = range(ptr, ptr + len(ps))
+                    yield cell_model, ps, chunk, ids
+                ptr = ids.stop
 
     def simulate(self, simulator):
         from plotly import graph_objects as go
@@ -289,55 +351,35 @@ class NeuronSimulation(Simulation):
         pc.set_maxstep(10)
         simulator.finitialize(self.initial)
         progression = 0
+        self._writer = self._create_writer()
+        last_flush = 0
         self.start_progress(self.duration)
         for oi, i in self.step_progress(self.duration, 1):
             t = time.time()
             pc.psolve(i)
             pc.barrier()
             self.progress(i)
+            if self.flush_interval and i - last_flush >= self.flush_interval:
+                # Move the recorded data to disk, to bound the memory of long runs.
+                self._writer.write(self.result.safe_flush())
+                last_flush = i
             if os.path.exists("interrupt_neuron"):
                 report("Iterrupt requested. Stopping simulation.", level=1)
                 break
         report("Finished simulation.", level=2)
 
-    def collect_output(self, simulator):
-        import h5py, time
-
+    def _create_writer(self):
         timestamp = str(time.time()).split(".")[0] + str(random.random()).split(".")[1]
         timestamp = self.pc.broadcast(timestamp)
-        result_path = "results_" + self.name + "_" + timestamp + ".hdf5"
-        for node in range(self.get_size()):
-            self.pc.barrier()
-            if node == self.get_rank():
-                report("Node", self.get_rank(), "is writing", level=2, all_nodes=True)
-                with h5py.File(result_path, "a") as f:
-                    f.attrs["configuration_string"] = self.scaffold.configuration._raw
-                    for path, data, meta in self.result.safe_collect():
-                        try:
-                            path = "/".join(path)
-                            if path in f:
-                                data = np.concatenate((f[path][()], data))
-                                del f[path]
-                            d = f.create_dataset(path, data=data)
-                            for k, v in meta.items():
-                                d.attrs[k] = v
-                        except Exception as e:
-                            if not isinstance(data, np.ndarray):
-                                warn(
-                                    "Recorder {} numpy.ndarray expected, got {}".format(
-                                        path, type(data)
-                                    )
-                                )
-                            else:
-                                warn(
-                                    "Recorder {} processing errored out: {}\n\n{}".format(
-                                        path,
-                                        "{} {}".format(data.dtype, data.shape),
-                                        traceback.format_exc(),
-                                    )
-                                )
-            self.pc.barrier()
-        return result_path
+        return ResultWriter("results_" + self.name + "_" + timestamp + ".hdf5")
+
+    def collect_output(self, simulator):
+        writer = self._writer or self._create_writer()
+        report("Node", self.get_rank(), "is writing", level=2, all_nodes=True)
+        # Flush the rest of the data of the streaming recorders, and collect the others.
+        writer.write(self.result.safe_flush())
+        writer.write(self.result.safe_collect(streams=False))
+        return writer.merge({"configuration_string": self.scaffold.configuration._raw})
 
     def create_transmitters(self):
         # Concatenates all the `from` locations of all intersections together and creates
@@ -447,20 +489,15 @@ class NeuronSimulation(Simulation):
                                 ) from None
 
     def create_neurons(self):
-        for cell_model in self.cell_models.values():
-            cell_positions = None
-            if self.scaffold.configuration.get_cell_type(cell_model.name).entity:
-                cell_data = self.scaffold.get_entities_by_type(cell_model.name)
-                cell_data = np.column_stack((cell_data, np.zeros((len(cell_data), 4))))
-            else:
-                cell_data = self.scaffold.get_cells_by_type(cell_model.name)
-            report("Placing " + str(len(cell_data)) + " " + cell_model.name)
-            for cell in cell_data:
-                cell_id = int(cell[0])
+        for cell_model, ps, chunk, ids in self._iter_cell_chunks():
+            if self.node_cells.isdisjoint(ids):
+                continue
+            report(f"Placing {len(ids)} {cell_model.name} of chunk {chunk}", level=4)
+            for cell_id, position in zip(ids, ps.load_positions()):
                 if not cell_id in self.node_cells:
                     continue
                 kwargs = cell_model.get_parameters()
-                kwargs["position"] = cell[2:5]
+                kwargs["position"] = position
                 if cell_model.entity or cell_model.relay:
                     kwargs["relay"] = cell_model.relay
                     instance = NeuronEntity.instantiate(**kwargs)
@@ -639,11 +676,77 @@ class NeuronSimulation(Simulation):
         self.result.add(SpikeRecorder("soma_spikes", cell, recorder))
 
 
+def lpt_partition(costs, size, groups=None):
+    """
+    Partition items with the given costs over ``size`` bins, using the longest processing
+    time first heuristic: from most to least expensive, each item is put in the bin with
+    the least total cost so far. Items of the same group are kept together, unless the
+    group costs more than the mean cost per bin.
+
+    :param costs: Cost of each item.
+    :type costs: numpy.ndarray
+    :param size: Number of bins.
+    :type size: int
+    :param groups: Group of each item.
+    :type groups: numpy.ndarray
+    :returns: The bin of each item, and the total cost of each bin.
+    :rtype: Tuple[numpy.ndarray, numpy.ndarray]
+    """
+    costs = np.asarray(costs, dtype=float)
+    if groups is None:
+        groups = np.arange(len(costs))
+    _, groups = np.unique(groups, return_inverse=True)
+    group_costs = np.bincount(groups, weights=costs)
+    # Assign the items of the groups that are too expensive to keep together one by one.
+    split = group_costs > np.sum(costs) / size
+    units = np.where(split[groups], len(group_costs) + np.arange(len(costs)), groups)
+    _, units = np.unique(units, return_inverse=True)
+    unit_costs = np.bincount(units, weights=costs)
+    unit_bins = np.empty(len(unit_costs), dtype=int)
+    bins = [(0.0, bin) for bin in range(size)]
+    for unit in np.argsort(-unit_costs, kind="stable"):
+        load, bin = heapq.heappop(bins)
+        unit_bins[unit] = bin
+        heapq.heappush(bins, (load + unit_costs[unit], bin))
+    item_bins = unit_bins[units]
+    return item_bins, np.bincount(item_bins, weights=costs, minlength=size)
+
+
+def _count_compartments(ps, n, name):
+    # Number of points of the morphology of each cell, from the morphology metadata.
+    ms = ps.load_morphologies()
+    if not len(ms):
+        # Cells without morphologies, such as entities, have a single compartment.
+        return np.ones(n)
+    elif len(ms) != n:
+        warn(
+            f"{len(ms)} morphologies stored for {n} `{name}` cells,"
+            + " their compartments can't be counted.",
+            SimulationWarning,
+        )
+        return np.ones(n)
+    points = [max(meta.get("points", 1), 1) for meta in ms.iter_meta(unique=True)]
+    return np.array(points, dtype=float)[ms.get_indices()]
+
+
+def _count_mechanisms(cell_model):
+    # Number of mechanisms inserted in the section types of the cell model.
+    model = getattr(cell_model, "model", None)
+    section_types = getattr(model, "section_types", None) or {}
+    return sum(
+        len(section_type.get("mechanisms", ()))
+        for section_type in section_types.values()
+        if isinstance(section_type, dict)
+    )
+
+
 class NeuronAdapter:
     Simulation = NeuronSimulation
 
 
 class LocationRecorder(SimulationRecorder):
+    streams = True
+
     def __init__(
         self, group, cell, recorder, time_recorder=None, section=None, x=None, meta=None
     ):
@@ -682,6 +785,14 @@ class LocationRecorder(SimulationRecorder):
     def get_meta(self):
         return self.meta
 
+    def flush(self):
+        data = self.get_data()
+        # Recording continues at the start of the emptied vectors.
+        self.recorder.resize(0)
+        if self.time_recorder:
+            self.time_recorder.resize(0)
+        return data
+
 
 class TargetLocation:
     def __init__(self, cell, section, connection=None):
@@ -17,14 +17,17 @@ from abc import abstractmethod, ABC
 from inspect import isclass
 from ..exceptions import *
 from .. import plugins
-from ._chunks import Chunk
+from ._chunks import Chunk, ChunkList
+from ._cache import MorphologyCache
 import mpi4py.MPI as MPI
 import numpy as np
 
 
-# Pretend `Chunk` is defined here, for UX. It's only defined in `_chunks` to avoid
-# circular imports anyway.
+# Pretend `Chunk`, `ChunkList` and `MorphologyCache` are defined here, for UX. They're
+# only defined in private modules to avoid circular imports anyway.
 Chunk.__module__ = __name__
+ChunkList.__module__ = __name__
+MorphologyCache.__module__ = __name__
 # Import the interfaces child module through a relative import as a sibling.
 interfaces = __import__("interfaces", globals=globals(), level=1)
 
@@ -191,6 +194,10 @@ class Storage:
     def files(self):
         return self._engine.files
 
+    @property
+    def morphology_cache(self):
+        return self._engine.morphology_cache
+
     @property
     def root(self):
         return self._root
@@ -332,6 +339,25 @@ class Storage:
         self.create(_bcast=False)
         self.init(scaffold, _bcast=False)
 
+    @_on_master
+    def compact_placement(self, cell_types):
+        """
+        Compact the placement sets of the given cell types.
+
+        :param cell_types: Cell types whose placement sets to compact.
+        :type cell_types: Iterable[:class:`~.objects.cell_type.CellType`]
+        """
+        for cell_type in cell_types:
+            self.get_placement_set(cell_type).compact()
+
+    @_on_master
+    def compact_connectivity(self):
+        """
+        Compact all connectivity sets.
+        """
+        for cs in self.get_connectivity_sets():
+            cs.compact()
+
     @_on_master
     def clear_placement(self):
         self._engine.clear_placement()
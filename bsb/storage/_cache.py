@@ -0,0 +1,120 @@
+from collections import OrderedDict
+
+
+class MorphologyCache:
+    """
+    Least recently used cache of loaded morphologies, within a budget of bytes. Each
+    storage engine owns a cache, that is shared by all the morphology sets read from it.
+
+    The cached morphologies are never handed out. Instead, each cache hit returns a copy
+    that shares its (read-only) point data with the cached morphology. The transformations
+    of the morphology API replace the data they change, so the copies can be transformed
+    safely, without copying the data of the morphology up front.
+
+    Cached morphologies are keyed by the version of the repository that they were
+    loaded from, so that changes made by other processes or engines are noticed.
+
+    :param budget: Maximum number of bytes of morphology data to keep in the cache.
+    :type budget: int
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+        self._version = None
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, name, load, version=None):
+        """
+        Get a copy of a morphology from the cache, or load and cache it.
+
+        :param name: Name of the morphology.
+        :type name: str
+        :param load: Function that loads the morphology on a cache miss.
+        :type load: Callable
+        :param version: Current version of the repository. If it differs from the
+          version of the cached morphologies, they are stale and are dropped.
+        :type version: Hashable
+        :returns: Copy of the morphology
+        :rtype: :class:`~.morphologies.Morphology`
+        """
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+        key = (name, self._generation)
+        try:
+            morphology, size = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            morphology = load()
+            size = _nbytes(morphology)
+            if size <= self.budget:
+                _freeze(morphology)
+                self._entries[key] = (morphology, size)
+                self.size += size
+                self._evict()
+            else:
+                return morphology
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return _share(morphology)
+
+    def invalidate(self):
+        """
+        Start a new generation of the cache, because the contents of the repository
+        changed. All previously cached morphologies are dropped.
+        """
+        self._generation += 1
+        self.clear()
+
+    def clear(self):
+        """
+        Drop all morphologies from the cache.
+        """
+        self._entries.clear()
+        self.size = 0
+
+    def _evict(self):
+        # Drop the least recently used morphologies until we're within budget again.
+        while self.size > self.budget:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+
+
+def _branch_arrays(morphology):
+    for branch in morphology.branches:
+        yield from (getattr(branch, v) for v in type(branch).vectors)
+        yield from branch._label_masks.values()
+
+
+def _nbytes(morphology):
+    return sum(arr.nbytes for arr in _branch_arrays(morphology))
+
+
+def _freeze(morphology):
+    # Make the cached data read-only, so that changes to the shared data of a copy,
+    # that would corrupt the cache, raise an error instead.
+    for arr in _branch_arrays(morphology):
+        arr.flags.writeable = False
+
+
+def _share(morphology):
+    # Copy the branch structure of a morphology, but share the data arrays.
+    copies = {}
+    for branch in morphology.branches:
+        cls = type(branch)
+        copy = cls(*(getattr(branch, v) for v in cls.vectors))
+        copy._full_labels = branch._full_labels.copy()
+        copy._label_masks = branch._label_masks.copy()
+        copies[branch] = copy
+        if branch.parent is not None:
+            copies[branch.parent].attach_child(copy)
+    roots = [copies[root] for root in morphology.roots]
+    return type(morphology)(roots, meta=morphology.meta.copy())
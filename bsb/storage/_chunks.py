@@ -2,6 +2,27 @@ import numpy as np
 from ..exceptions import *
 
 _iinfo = np.iinfo(np.int16)
+# Each chunk coordinate is packed into 16 bits of the chunk id.
+_id_shifts = np.array([0, 16, 32], dtype=np.uint64)
+
+
+def _check_bounds(coords):
+    if np.any(coords < _iinfo.min) or np.any(coords > _iinfo.max):
+        raise ChunkError(
+            f"Chunk coordinates must be between {_iinfo.min} and {_iinfo.max}."
+        )
+
+
+def _ids_of(coords):
+    # Reinterpret the signed coordinates as unsigned and pack them into 48 bits.
+    unsigned = coords.view(np.uint16).astype(np.uint64)
+    return np.bitwise_or.reduce(unsigned << _id_shifts, axis=-1)
+
+
+def _coords_of(ids):
+    ids = np.asarray(ids, dtype=np.uint64).reshape(-1, 1)
+    unsigned = ((ids >> _id_shifts) & np.uint64(0xFFFF)).astype(np.uint16)
+    return unsigned.view(np.int16)
 
 
 class Chunk(np.ndarray):
@@ -10,10 +31,7 @@ class Chunk(np.ndarray):
     """
 
     def __new__(cls, chunk, chunk_size):
-        if any(c < _iinfo.min or c > _iinfo.max for c in chunk):
-            raise ChunkError(
-                f"Chunk coordinates must be between {_iinfo.min} and {_iinfo.max}."
-            )
+        _check_bounds(np.asarray(chunk))
         obj = super().__new__(cls, (3,), dtype=np.short)
         obj[:] = chunk
         obj._size = np.array(chunk_size, dtype=float)
@@ -49,7 +67,7 @@ class Chunk(np.ndarray):
 
     @property
     def id(self):
-        return sum(n * 2 ** (i * 16) for i, n in enumerate(self.view(np.uint16)))
+        return int(_ids_of(self.view(np.ndarray)))
 
     @property
     def box(self):
@@ -66,6 +84,108 @@ class Chunk(np.ndarray):
 
     @classmethod
     def from_id(cls, id, size):
-        raw = [id, id / 2 ** 16, id / 2 ** 32]
-        unpacked = np.array(raw, dtype=np.uint16).astype(np.int16)
-        return cls(unpacked, size)
+        return cls(_coords_of(id)[0], size)
+
+
+class ChunkList(np.ndarray):
+    """
+    Array of N chunk identifiers of the same size, stored as an ``(N, 3)`` array of chunk
+    coordinates. Iterating over or indexing a single element of the list produces
+    :class:`.Chunk` objects, while the identifiers, bounding boxes and set operations are
+    computed for all chunks at once.
+    """
+
+    def __new__(cls, chunks, chunk_size):
+        coords = np.asarray(chunks).reshape(-1, 3)
+        _check_bounds(coords)
+        obj = super().__new__(cls, coords.shape, dtype=np.short)
+        obj[:] = coords
+        obj._size = None if chunk_size is None else np.array(chunk_size, dtype=float)
+        return obj
+
+    def __array_finalize__(self, obj):
+        if obj is not None:
+            self._size = getattr(obj, "_size", None)
+
+    def __reduce__(self):
+        pickled_state = super().__reduce__()
+        new_state = pickled_state[2] + (self._size,)
+        return (pickled_state[0], pickled_state[1], new_state)
+
+    def __setstate__(self, state):
+        super().__setstate__(state[:-1])
+        self._size = state[-1]
+
+    def __iter__(self):
+        for coords in super().__iter__():
+            yield coords.view(Chunk)
+
+    def __getitem__(self, index):
+        item = super().__getitem__(index)
+        if isinstance(index, (int, np.integer)):
+            return item.view(Chunk)
+        return item
+
+    def __contains__(self, chunk):
+        return bool(np.any(self.ids() == Chunk(chunk, self._size).id))
+
+    def __bool__(self):
+        return len(self) > 0
+
+    @property
+    def dimensions(self):
+        return self._size
+
+    def ids(self):
+        """
+        Return the identifiers of all chunks in the list.
+
+        :rtype: numpy.ndarray[numpy.uint64]
+        """
+        return _ids_of(self.view(np.ndarray))
+
+    @classmethod
+    def from_ids(cls, ids, size):
+        """
+        Create a chunk list from an array of chunk identifiers.
+        """
+        return cls(_coords_of(ids), size)
+
+    @classmethod
+    def union(cls, *chunk_lists, size=None):
+        """
+        Create a chunk list of the unique chunks of the given chunk lists, sorted by id.
+        The size is taken from the first list that has a size, unless it is given.
+        """
+        if size is None:
+            size = next((cl.dimensions for cl in chunk_lists if cl), None)
+        if not chunk_lists:
+            return cls([], size)
+        ids = np.concatenate([cls(cl, size).ids() for cl in chunk_lists])
+        return cls.from_ids(np.unique(ids), size)
+
+    @property
+    def ldc(self):
+        return self._size * self.view(np.ndarray)
+
+    @property
+    def mdc(self):
+        return self._size * self.view(np.ndarray) + self._size
+
+    @property
+    def boxes(self):
+        return np.column_stack((self.ldc, self.mdc))
+
+    def isin(self, other):
+        """
+        Return a mask of the chunks that are also present in ``other``.
+        """
+        if not isinstance(other, ChunkList):
+            other = ChunkList(other, self._size)
+        return np.isin(self.ids(), other.ids())
+
+    def intersect(self, other):
+        """
+        Return the chunks that are also present in ``other``, in the order of this list.
+        """
+        return self[self.isin(other)]
@@ -1,6 +1,7 @@
 from .... import config
 from ....config.nodes import StorageNode as IStorageNode
 from ...interfaces import Engine
+from ....exceptions import ResourceError
 from contextlib import contextmanager
 from .placement_set import PlacementSet
 from .connectivity_set import ConnectivitySet
@@ -17,23 +18,80 @@ class HDF5Engine(Engine):
         super().__init__(root)
         self._file = root
         self._lock = sync()
+        # Stack of the lock fences we're currently in, `True` for write fences.
+        self._fences = []
+        # Handle that is shared by all operations within the outermost fence.
+        self._pool = None
+        self._pool_writable = False
+        self._pool_users = 0
+        # Metadata of the morphologies in the repository, see `MorphologyRepository`.
+        self._morphology_index = None
 
     def _read(self):
-        return self._lock.read()
+        return self._fence(self._lock.read(), writable=False)
 
     def _write(self):
-        return self._lock.write()
+        return self._fence(self._lock.write(), writable=True)
 
     def _master_write(self):
         return self._lock.single_write()
 
+    @contextmanager
+    def _fence(self, lock, writable):
+        with lock as fence:
+            self._fences.append(writable)
+            try:
+                yield fence
+            finally:
+                self._fences.pop()
+                if not self._fences:
+                    # Leaving the outermost fence: other processes may modify the file
+                    # from now on, so our handle can't be trusted anymore.
+                    self._release_handle()
+                elif writable and self._pool is not None and self._pool_writable:
+                    self._pool.flush()
+
     def _handle(self, mode):
-        return h5py.File(self._file, mode)
+        """
+        Return a context manager for an HDF5 file handle in the given ``mode``. Inside of
+        a read or write fence a single pooled handle is reused, and only closed when the
+        outermost fence is released. Outside of fences a fresh handle is opened.
+        """
+        if not self._fences:
+            return h5py.File(self._file, mode)
+        return self._pooled_handle(mode)
+
+    @contextmanager
+    def _pooled_handle(self, mode):
+        writable = mode != "r"
+        if mode == "w" or (writable and not self._pool_writable):
+            # The pooled handle can't serve this mode, and needs to be reopened.
+            if self._pool_users:
+                raise ResourceError(
+                    f"Can't open `{self._file}` in '{mode}' mode while its"
+                    + " read-only handle is in use."
+                )
+            self._release_handle()
+        if self._pool is None:
+            self._pool = h5py.File(self._file, mode)
+            self._pool_writable = writable
+        self._pool_users += 1
+        try:
+            yield self._pool
+        finally:
+            self._pool_users -= 1
+
+    def _release_handle(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+            self._pool_writable = False
 
     def exists(self):
         return os.path.exists(self._file)
 
     def create(self):
+        self._clear_caches()
         with self._write():
             with self._handle("w") as handle:
                 handle.create_group("cells")
@@ -46,14 +104,21 @@ class HDF5Engine(Engine):
         from shutil import move
 
         with self._write():
+            self._release_handle()
             move(self._file, new_root)
 
         self._file = new_root
 
     def remove(self):
+        self._clear_caches()
         with self._write() as fence:
+            self._release_handle()
             os.remove(self._file)
 
+    def _clear_caches(self):
+        self._morphology_index = None
+        self.morphology_cache.invalidate()
+
     def clear_placement(self):
         with self._write():
             with self._handle("w") as handle:
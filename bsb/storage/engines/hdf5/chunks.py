@@ -7,10 +7,15 @@ The module provides the :class:`.ChunkLoader` mixin for
 :class:`~.storage.engines.hdf5.resource.Resource` objects (e.g. PlacementSet,
 ConnectivitySet) to organize :class:`.ChunkedProperty` and :class:`.ChunkedCollection`
 objects within them.
+
+Chunked properties can also be compacted into a *packed* layout, where the data of all
+chunks is stored contiguously in a single dataset per property, alongside an index that
+maps each chunk id to its start and stop row. Packed data is read transparently, and
+data appended to a chunk after compaction is read after that chunk's packed rows.
 """
 
 from .resource import Resource
-from ..._chunks import Chunk
+from ..._chunks import Chunk, ChunkList
 import numpy as np
 import contextlib
 
@@ -45,12 +50,19 @@ class ChunkLoader:
             self._collections.append(col)
 
     def get_loaded_chunks(self):
+        """
+        Return the chunks that data is read from, in the order that it is read in.
+
+        :rtype: :class:`~.storage.ChunkList`
+        """
         if not self._chunks:
             return self.get_all_chunks()
         else:
-            return self._chunks.copy()
+            chunks = list(self._chunks)
+            return ChunkList(chunks, chunks[0].dimensions)
 
     def get_all_chunks(self):
+        size = None
         with self._engine._read():
             with self._engine._handle("r") as h:
                 chunks = list(h[self._path + "/chunks"].keys())
@@ -58,7 +70,7 @@ class ChunkLoader:
                     # If any chunks have been written, this HDF5 file is tagged with a
                     # chunk size
                     size = self._get_chunk_size(h)
-        return [Chunk.from_id(int(c), size) for c in chunks]
+        return ChunkList.from_ids(np.array(chunks, dtype=np.uint64), size)
 
     @contextlib.contextmanager
     def chunk_context(self, *chunks):
@@ -81,6 +93,33 @@ class ChunkLoader:
         else:
             return f"{self._path}/chunks/{chunk.id}"
 
+    def get_packed_path(self, property=None):
+        """
+        Return the full HDF5 path of the packed data of a property.
+
+        :param property: Name of the property
+        :type property: str
+        :returns: HDF5 path
+        :rtype: str
+        """
+        if property is None:
+            return f"{self._path}/packed/"
+        else:
+            return f"{self._path}/packed/{property}"
+
+    def compact(self):
+        """
+        Move the data of all chunks into the packed layout. Each property is stored in a
+        single contiguous dataset, sorted by chunk id, and the per chunk datasets are
+        removed.
+        """
+        with self._engine._write():
+            with self._engine._handle("a") as f:
+                all_chunks = self.get_all_chunks()
+                chunks = all_chunks[np.argsort(all_chunks.ids())]
+                for prop in self._properties:
+                    prop.pack(f, chunks)
+
     def load_chunk(self, chunk):
         """
         Add a chunk to read data from when loading properties/collections.
@@ -157,53 +196,117 @@ class ChunkedProperty:
         maxshape = list(shape)
         maxshape[0] = None
         self.maxshape = tuple(maxshape)
+        self._packed_index = None
 
-    def load(self, raw=False):
-        with self.loader._engine._read():
-            if self.loader._chunks:
-                chunks = self.loader._chunks
-            else:
-                chunks = self.loader.get_all_chunks()
-            reader = self._chunk_reader(raw=raw)
-            chunk_loader = map(reader, chunks)
-            # Concatenate all non-empty chunks together
-            chunked_data = tuple(c for c in chunk_loader if c.size)
-        if not chunked_data:
-            return np.empty(self.shape)
-        return np.concatenate(chunked_data)
-
-    def _chunk_reader(self, raw):
+    def load(self, raw=False, chunks=None):
         """
-        Create a chunk reader that either returns the raw data or extracts it.
+        Load the data of the loaded chunks, or of the given chunks.
         """
-
-        def read_chunk(chunk):
-            self.loader.require_chunk(chunk)
-            with self.loader._engine._read():
-                with self.loader._engine._handle("r") as f:
-                    chunk_group = f[self.loader.get_chunk_path(chunk)]
-                    if self.name not in chunk_group:
-                        return np.empty(self.shape)
-                    data = chunk_group[self.name][()]
-                    return data
-
-        # If this property has an extractor and we're not in raw mode, wrap the above
-        # reader to extract the data
+        with self._open() as f:
+            if chunks is None:
+                chunks = self.loader.get_loaded_chunks()
+            data = self._read_chunks(f, chunks)
         if not (raw or self.extract is None):
-            _f = read_chunk
+            data = self.extract(data)
+            # Allow only `np.ndarray`. Sorry things that quack, today we're checking
+            # birth certificates. Purebred ducks only.
+            if type(data) is not np.ndarray:
+                # Just kidding, as long as you quack you're welcome, but you'll have
+                # to change your family name.
+                data = np.array(data)
+        return data
+
+    def load_sizes(self, chunks):
+        """
+        Return the amount of rows of data of each of the given chunks, without reading
+        the data.
+        """
+        with self._open() as f:
+            return np.array(
+                [
+                    sum(stop - start for _, start, stop in self._chunk_sources(f, c))
+                    for c in chunks
+                ],
+                dtype=int,
+            )
+
+    @contextlib.contextmanager
+    def _open(self):
+        with self.loader._engine._read():
+            with self.loader._engine._handle("r") as f:
+                # The packed index is only valid for as long as we hold the read lock.
+                self._packed_index = None
+                try:
+                    yield f
+                finally:
+                    self._packed_index = None
+
+    def _read_chunks(self, handle, chunks):
+        """
+        Read the datasets of the given chunks into a single preallocated array. Chunks
+        that don't exist, or that don't contain the property, are skipped.
+        """
+        # Resolve all the data sources and their sizes first, so that we can allocate
+        # the output once, and read each source straight into its own slice of it.
+        sources = [src for chunk in chunks for src in self._chunk_sources(handle, chunk)]
+        total = sum(stop - start for _, start, stop in sources)
+        data = np.empty((total, *self.shape[1:]), dtype=self.dtype)
+        ptr = 0
+        for dset, start, stop in sources:
+            n = stop - start
+            dset.read_direct(
+                data, source_sel=np.s_[start:stop], dest_sel=np.s_[ptr : ptr + n]
+            )
+            ptr += n
+        return data
+
+    def _chunk_sources(self, handle, chunk):
+        # Yield the `(dataset, start, stop)` sources of a chunk's data: first its rows in
+        # the packed dataset, then anything that was appended to the chunk afterwards.
+        if self._packed_index is None:
+            self._packed_index = self._read_packed_index(handle)
+        if chunk.id in self._packed_index:
+            start, stop = self._packed_index[chunk.id]
+            if stop > start:
+                yield handle[self.loader.get_packed_path(self.name)], start, stop
+        path = f"{self.loader.get_chunk_path(chunk)}/{self.name}"
+        if path in handle:
+            dset = handle[path]
+            if len(dset):
+                yield dset, 0, len(dset)
 
-            def read_chunk(chunk):
-                data = self.extract(_f(chunk))
-                # Allow only `np.ndarray`. Sorry things that quack, today we're checking
-                # birth certificates. Purebred ducks only.
-                if type(data) is not np.ndarray:
-                    # Just kidding, as long as you quack you're welcome, but you'll have
-                    # to change your family name.
-                    data = np.array(data)
-                return data
+    def _read_packed_index(self, handle):
+        path = self.loader.get_packed_path(f"{self.name}_index")
+        if path not in handle:
+            return {}
+        return {id: (start, stop) for id, start, stop in handle[path][()].tolist()}
 
-        # Return the created function
-        return read_chunk
+    def pack(self, handle, chunks):
+        """
+        Store the data of the given chunks contiguously in the packed dataset of this
+        property, and create the chunk offset index.
+        """
+        self._packed_index = None
+        sizes = [
+            sum(stop - start for _, start, stop in self._chunk_sources(handle, chunk))
+            for chunk in chunks
+        ]
+        data = self._read_chunks(handle, chunks)
+        stops = np.cumsum(sizes, dtype=int)
+        index = np.column_stack(
+            ([chunk.id for chunk in chunks], stops - sizes, stops)
+        ).astype(int)
+        path = self.loader.get_packed_path(self.name)
+        for p in (path, f"{path}_index"):
+            if p in handle:
+                del handle[p]
+        handle.create_dataset(path, data=data, maxshape=self.maxshape, dtype=self.dtype)
+        handle.create_dataset(f"{path}_index", data=index.reshape(-1, 3))
+        for chunk in chunks:
+            chunk_path = f"{self.loader.get_chunk_path(chunk)}/{self.name}"
+            if chunk_path in handle:
+                del handle[chunk_path]
+        self._packed_index = None
 
     def append(self, chunk, data):
         """
@@ -222,15 +325,13 @@ class ChunkedProperty:
                     chunk_group.create_dataset(
                         self.name,
                         self.shape,
-                        data=data,
                         maxshape=self.maxshape,
                         dtype=self.dtype,
                     )
-                else:
-                    dset = chunk_group[self.name]
-                    start_pos = dset.shape[0]
-                    dset.resize(start_pos + len(data), axis=0)
-                    dset[start_pos:] = data
+                dset = chunk_group[self.name]
+                start_pos = dset.shape[0]
+                dset.resize(start_pos + len(data), axis=0)
+                dset[start_pos:] = data
 
     def clear(self, chunk):
         with self.loader._engine._write():
@@ -248,6 +349,16 @@ class ChunkedProperty:
                 else:
                     dset = chunk_group[self.name]
                     dset.resize(0, axis=0)
+                self._clear_packed(f, chunk)
+
+    def _clear_packed(self, handle, chunk):
+        # Empty the chunk's rows in the index, the data is dropped on the next `pack`.
+        path = self.loader.get_packed_path(f"{self.name}_index")
+        if path in handle:
+            index = handle[path]
+            rows = np.nonzero(index[:, 0] == chunk.id)[0]
+            for row in rows:
+                index[row, 2] = index[row, 1]
 
 
 class ChunkedCollection:
@@ -1,6 +1,6 @@
 from ....exceptions import *
 from .resource import Resource
-from ... import Chunk
+from ... import Chunk, ChunkList
 from ...interfaces import ConnectivitySet as IConnectivitySet
 import numpy as np
 
@@ -29,6 +29,20 @@ class ConnectivitySet(Resource, IConnectivitySet):
                 self._pre_name = h[self._path].attrs["pre"]
                 self._post_name = h[self._path].attrs["post"]
 
+    @property
+    def pre_type_name(self):
+        """
+        Name of the presynaptic cell type.
+        """
+        return self._pre_name
+
+    @property
+    def post_type_name(self):
+        """
+        Name of the postsynaptic cell type.
+        """
+        return self._post_name
+
     @classmethod
     def get_tags(cls, engine):
         with engine._read():
@@ -138,85 +152,165 @@ class ConnectivitySet(Resource, IConnectivitySet):
             print(len(src_idx), "dropped to", len(src_locs))
 
     def _append_data(self, src_chunk, dest_chunk, src_locs, dest_locs, h):
-        # Require the data
+        # Each append is stored as a new block at the end of the datasets of the
+        # destination chunk, and a row is added to its block index, so that appending
+        # never has to move any of the existing data.
         grp = h.require_group(f"{self._path}/{dest_chunk.id}")
-        src_id = str(src_chunk.id)
-        unpack_me = [None, None]
+        if "chunk_list" in grp.attrs:
+            # Convert data stored with insertion pointers to blocks first.
+            self._compact_group(grp)
+        src_ds = self._require_dataset(grp, "source_loc", 3)
+        dest_ds = self._require_dataset(grp, "dest_loc", 3)
+        index_ds = self._require_dataset(grp, "block_index", 3)
+        start = len(src_ds)
+        stop = start + len(src_locs)
+        src_ds.resize(stop, axis=0)
+        src_ds[start:stop] = src_locs
+        dest_ds.resize(stop, axis=0)
+        dest_ds[start:stop] = dest_locs
+        index_ds.resize(len(index_ds) + 1, axis=0)
+        index_ds[-1] = [src_chunk.id, start, stop]
+
+    def _require_dataset(self, grp, tag, width):
         # require_dataset doesn't work for resizable datasets, see
         # https://github.com/h5py/h5py/issues/2018
-        # So we create a little thingy for requiring src & dest
-        for i, tag in enumerate(("source_loc", "dest_loc")):
-            if tag in grp:
-                unpack_me[i] = grp[tag]
-            else:
-                unpack_me[i] = grp.create_dataset(
-                    tag, shape=(0, 3), dtype=int, chunks=(1024, 3), maxshape=(None, 3)
-                )
-        src_ds, dest_ds = unpack_me
-        # Move the pointers that keep track of the chunks
-        new_rows = len(src_locs)
-        total = len(src_ds)
-        print("Inserting", new_rows, "rows")
-        print("Total data length", total)
-        self._store_pointers(grp, src_chunk, new_rows, total)
-        iptr, eptr = self._get_insert_pointers(grp, src_chunk)
-        print("Stored data from line", iptr, "to", eptr)
-        if eptr is None:
-            eptr = total + new_rows
-        # Resize and insert data.
-        src_end = src_ds[(eptr - new_rows) :]
-        dest_end = dest_ds[(eptr - new_rows) :]
-        src_ds.resize(len(src_ds) + new_rows, axis=0)
-        dest_ds.resize(len(dest_ds) + new_rows, axis=0)
-        src_ds[iptr:eptr] = np.concatenate((src_ds[iptr : (eptr - new_rows)], src_locs))
-        src_ds[eptr:] = src_end
-        dest_ds[iptr:eptr] = np.concatenate(
-            (dest_ds[iptr : (eptr - new_rows)], dest_locs)
-        )
-        dest_ds[eptr:] = dest_end
-
-    def _store_pointers(self, group, chunk, n, total):
-        print("Storing pointers", chunk, n)
-        chunks = [Chunk(t, (0, 0, 0)) for t in group.attrs.get("chunk_list", [])]
-        print("Chunks already present:", chunks)
-        if chunk in chunks:
-            print("Just moving up pointers")
-            # Source chunk already existed, just increment the subseq. pointers
-            inc_from = chunks.index(chunk) + 1
+        if tag in grp:
+            return grp[tag]
         else:
-            print("Appending new chunk to end")
-            # We are the last chunk, we start adding rows at the end.
-            group.attrs[str(chunk.id)] = total
-            # Move up the increment pointer to place ourselves after the
-            # last element
-            chunks.append(chunk)
-            inc_from = len(chunks)
-            group.attrs["chunk_list"] = chunks
-        # Increment the pointers of the chunks that follow us, by `n` rows.
-        for c in chunks[inc_from:]:
-            group.attrs[str(c.id)] += n
-
-    def _get_insert_pointers(self, group, chunk):
-        chunks = [Chunk(t, (0, 0, 0)) for t in group.attrs["chunk_list"]]
-        iptr = group.attrs[str(chunk.id)]
-        idx = chunks.index(chunk)
-        if idx + 1 == len(chunks):
-            # Last chunk, no end pointer
-            eptr = None
+            return grp.create_dataset(
+                tag,
+                shape=(0, width),
+                dtype=int,
+                chunks=(1024, width),
+                maxshape=(None, width),
+            )
+
+    def _get_blocks(self, grp):
+        """
+        Return the block index of a destination chunk group: an array with a row of
+        source chunk id, start and stop row for each block of data in the group.
+        """
+        if "block_index" in grp:
+            return grp["block_index"][()]
+        elif "chunk_list" in grp.attrs:
+            # Data stored with insertion pointers per source chunk, every pointer marks
+            # the start of a block that stops at the next pointer.
+            ids = [Chunk(c, (0, 0, 0)).id for c in grp.attrs["chunk_list"]]
+            starts = [grp.attrs[str(id)] for id in ids]
+            stops = starts[1:] + [len(grp["source_loc"])]
+            return np.column_stack((ids, starts, stops)).astype(int)
         else:
-            # Get the pointer of the next chunk
-            eptr = group.attrs[str(chunks[idx + 1].id)]
-        return iptr, eptr
+            return np.empty((0, 3), dtype=int)
 
-    def _get_chunk_data(self, dest_chunk):
+    def compact(self):
+        """
+        Sort the blocks of data of each destination chunk by source chunk, so that the
+        data of each source chunk is stored contiguously in a single block.
+        """
         with self._engine._write():
             with self._engine._handle("a") as h:
+                for grp in h[self._path].values():
+                    self._compact_group(grp)
+
+    def _compact_group(self, grp):
+        blocks = self._get_blocks(grp)
+        compact = np.all(np.diff(blocks[:, 0]) > 0)
+        if len(blocks) and (not compact or "block_index" not in grp):
+            order = np.argsort(blocks[:, 0], kind="stable")
+            blocks = blocks[order]
+            rows = np.concatenate(
+                [np.arange(start, stop) for _, start, stop in blocks]
+                + [np.empty(0, dtype=int)]
+            )
+            for tag in ("source_loc", "dest_loc"):
+                grp[tag][:] = grp[tag][()][rows]
+            sizes = blocks[:, 2] - blocks[:, 1]
+            # Merge the sorted blocks of each source chunk into a single block
+            stops = np.cumsum(sizes)
+            last = np.nonzero(np.diff(blocks[:, 0], append=-1))[0]
+            first = np.concatenate(([0], last[:-1] + 1))
+            index = np.column_stack(
+                (blocks[last, 0], stops[first] - sizes[first], stops[last])
+            )
+            if "block_index" in grp:
+                del grp["block_index"]
+            index_ds = self._require_dataset(grp, "block_index", 3)
+            index_ds.resize(len(index), axis=0)
+            index_ds[()] = index
+            # Remove the pointers of the old storage format
+            for c in grp.attrs.get("chunk_list", []):
+                del grp.attrs[str(Chunk(c, (0, 0, 0)).id)]
+            grp.attrs.pop("chunk_list", None)
+
+    def __len__(self):
+        with self._engine._read():
+            with self._engine._handle("r") as h:
+                return sum(len(grp["source_loc"]) for grp in h[self._path].values())
+
+    def iter_blocks(self, src_chunks=None, dest_chunks=None, block_size=1000000):
+        """
+        Iterate over the connectivity data, block by block, without loading all of it.
+        Unless the set was compacted, the data of a pair of chunks may be yielded in
+        several blocks. The blocks are listed when the iteration starts, and the read lock
+        is only held while each block is read, not while it is processed.
+
+        :param src_chunks: Only yield the data of these source chunks.
+        :type src_chunks: Iterable[:class:`~.storage.Chunk`]
+        :param dest_chunks: Only yield the data of these destination chunks.
+        :type dest_chunks: Iterable[:class:`~.storage.Chunk`]
+        :param block_size: Maximum number of connections per block.
+        :type block_size: int
+        :returns: Generator of source chunk, destination chunk, source locations and
+          destination locations.
+        """
+        # Only hold the read lock while listing the blocks, and while reading each
+        # block, so that writers aren't locked out while the consumer processes blocks.
+        size, slices = self._list_blocks(src_chunks, dest_chunks, block_size)
+        for src_id, dest_id, start, stop in slices:
+            with self._engine._read():
+                with self._engine._handle("r") as h:
+                    grp = h[f"{self._path}/{dest_id}"]
+                    src_locs = grp["source_loc"][start:stop]
+                    dest_locs = grp["dest_loc"][start:stop]
+            src_chunk = Chunk.from_id(src_id, size)
+            dest_chunk = Chunk.from_id(dest_id, size)
+            yield src_chunk, dest_chunk, src_locs, dest_locs
+
+    def _list_blocks(self, src_chunks, dest_chunks, block_size):
+        # Return the chunk size, and the source chunk id, destination chunk id, start and
+        # stop row of each block to read.
+        slices = []
+        with self._engine._read():
+            with self._engine._handle("r") as h:
+                size = h.attrs.get("chunk_size", None)
+                group = h[self._path]
+                if dest_chunks is None:
+                    dest_ids = [int(id) for id in group.keys()]
+                else:
+                    dest_ids = ChunkList(dest_chunks, size).ids()
+                if src_chunks is not None:
+                    src_ids = ChunkList(src_chunks, size).ids()
+                for dest_chunk in ChunkList.from_ids(dest_ids, size):
+                    if str(dest_chunk.id) not in group:
+                        continue
+                    blocks = self._get_blocks(group[str(dest_chunk.id)])
+                    if src_chunks is not None:
+                        blocks = blocks[np.isin(blocks[:, 0], src_ids)]
+                    for id, start, stop in blocks.tolist():
+                        slices.extend(
+                            (id, dest_chunk.id, ptr, min(ptr + block_size, stop))
+                            for ptr in range(start, stop, block_size)
+                        )
+        return size, slices
+
+    def _get_chunk_data(self, dest_chunk):
+        with self._engine._read():
+            with self._engine._handle("r") as h:
                 grp = h[f"{self._path}/{dest_chunk.id}"]
-                src_chunks = grp.attrs["chunk_list"]
-                chunk_ptrs = [grp.attrs[str(Chunk(c, (0, 0, 0)).id)] for c in src_chunks]
+                blocks = self._get_blocks(grp)
                 src = grp["source_loc"][()]
                 dest = grp["dest_loc"][()]
-        return src_chunks, chunk_ptrs, src, dest
+        return blocks, src, dest
 
 
 def _sort_triple(a, b):
@@ -67,10 +67,13 @@ class FileStore(Resource, IFileStore):
             return Configuration(**tree)
 
     def store_active_config(self, config):
-        id = self._active_config_id()
-        if id is not None:
-            self.remove(id)
-        return self.store(json.dumps(config.__tree__()), {"active_config": True})
+        # Replace the active config under a single write lock, so that concurrent
+        # writers don't try to remove the same previous active config.
+        with self._engine._write():
+            id = self._active_config_id()
+            if id is not None:
+                self.remove(id)
+            return self.store(json.dumps(config.__tree__()), {"active_config": True})
 
     def _active_config_id(self):
         match = (id for id, m in self.all().items() if m.get("active_config", False))
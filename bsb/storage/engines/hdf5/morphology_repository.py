@@ -3,9 +3,25 @@ from ....exceptions import *
 from ...interfaces import MorphologyRepository as IMorphologyRepository, StoredMorphology
 from .resource import Resource
 import numpy as np
+from itertools import chain
 import arbor
+import json
+import h5py
+import uuid
 
 _root = "/morphologies"
+_index = "_index"
+_index_dtype = np.dtype(
+    [
+        ("name", h5py.string_dtype()),
+        ("ldc", float, (3,)),
+        ("mdc", float, (3,)),
+        ("branches", int),
+        ("points", int),
+        ("labels", h5py.string_dtype()),
+        ("removed", bool),
+    ]
+)
 
 
 class MorphologyRepository(Resource, IMorphologyRepository):
@@ -21,7 +37,13 @@ class MorphologyRepository(Resource, IMorphologyRepository):
         return selected
 
     def preload(self, name):
-        return StoredMorphology(name, self._make_loader(name), self.get_meta(name))
+        return StoredMorphology(
+            name,
+            self._make_loader(name),
+            self.get_meta(name),
+            cache=self._engine.morphology_cache,
+            version=self._get_version,
+        )
 
     def _make_loader(self, name):
         def loader():
@@ -30,24 +52,30 @@ class MorphologyRepository(Resource, IMorphologyRepository):
         return loader
 
     def get_meta(self, name):
-        with self._engine._read():
-            with self._engine._handle("r") as repo:
-                try:
-                    meta = _meta(repo[f"{self._path}/{name}/"])
-                except KeyError:
-                    raise MissingMorphologyError(
-                        f"`{self._engine.root}` contains no morphology named `{name}`."
-                    ) from None
-        meta["name"] = name
-        return meta
+        try:
+            return self._get_index()[name].copy()
+        except KeyError:
+            raise MissingMorphologyError(
+                f"`{self._engine.root}` contains no morphology named `{name}`."
+            ) from None
+
+    def keys(self):
+        return list(self._get_index().keys())
 
     def all(self):
-        return [self.preload(name) for name in self.keys()]
+        return [
+            StoredMorphology(
+                name,
+                self._make_loader(name),
+                meta.copy(),
+                cache=self._engine.morphology_cache,
+                version=self._get_version,
+            )
+            for name, meta in self._get_index().items()
+        ]
 
     def has(self, name):
-        with self._engine._read():
-            with self._engine._handle("r") as repo:
-                return f"{self._path}/{name}" in repo
+        return name in self._get_index()
 
     def load(self, name):
         with self._engine._read():
@@ -61,57 +89,270 @@ class MorphologyRepository(Resource, IMorphologyRepository):
                 return _morphology(group)
 
     def save(self, name, morphology, overwrite=False):
+        if name == _index:
+            raise MorphologyRepositoryError(f"'{_index}' is a reserved name.")
         with self._engine._write():
             with self._engine._handle("a") as repo:
                 me = repo[self._path]
-                if self.has(name):
+                index = self._require_index(me)
+                if name in me:
                     if overwrite:
-                        self.remove(name)
+                        del me[name]
                     else:
                         raise MorphologyRepositoryError(
                             f"A morphology called '{name}' already exists in `{self._engine.root}`."
                         )
                 root = me.create_group(name)
-                branches_group = root.create_group("branches")
-                for id, branch in enumerate(morphology.branches):
-                    # Cheap trick: store the id assigned to each branch so that parent
-                    # branches can give their id to their children for serialization.
-                    branch._tmp_id = id
-                    if branch._parent is not None:
-                        parent_id = branch._parent._tmp_id
-                    else:
-                        parent_id = -1
-                    self._save_branch(branches_group, id, branch, parent_id)
-                points = morphology.flatten(["x", "y", "z"], matrix=True)
-                root.attrs["ldc"] = np.min(points, axis=0)
-                root.attrs["mdc"] = np.max(points, axis=0)
-        # Clean up the temporary ids stored on each branch.
-        for branch in morphology.branches:
-            del branch._tmp_id
-
-    def _save_branch(self, group, branch_id, branch, parent_id):
-        branch_group = group.create_group(str(branch_id))
-        branch_group.attrs["parent"] = parent_id
-        # Save vectors
-        for v in Branch.vectors:
-            branch_group.create_dataset(v, data=getattr(branch, v))
-        # Save branch labels
-        branch_group.attrs["branch_labels"] = branch._full_labels
-        # Save point labels
-        label_group = branch_group.create_group("labels")
-        for label, label_mask in branch._label_masks.items():
-            label_group.create_dataset(label, data=label_mask, dtype=np.bool)
+                meta = _save_morphology(root, morphology)
+                index.put(me, {"name": name, **meta})
+        self._engine.morphology_cache.invalidate()
 
     def remove(self, name):
         with self._engine._write():
             with self._engine._handle("a") as repo:
+                me = repo[self._path]
+                index = self._require_index(me)
                 try:
-                    del repo[f"{self._path}/{name}"]
+                    del me[name]
                 except KeyError:
                     raise MorphologyRepositoryError(f"'{name}' doesn't exist.") from None
+                index.remove(me, name)
+        self._engine.morphology_cache.invalidate()
+
+    def _get_index(self):
+        # The metadata of all morphologies is read from the index dataset, and kept on
+        # the engine for as long as the version of the index dataset doesn't change.
+        with self._engine._read():
+            with self._engine._handle("r") as repo:
+                me = repo[self._path]
+                if _index in me:
+                    return self._load_index(me).meta
+        # Repositories created before the index existed are indexed once.
+        with self._engine._write():
+            with self._engine._handle("a") as repo:
+                return self._require_index(repo[self._path]).meta
+
+    def _get_version(self):
+        # The version of the index changes whenever a morphology is saved or removed, by
+        # any process, so it tells whether the cached morphologies are still current.
+        with self._engine._read():
+            with self._engine._handle("r") as repo:
+                me = repo[self._path]
+                return me[_index].attrs.get("version", None) if _index in me else None
+
+    def _load_index(self, group):
+        cached = self._engine._morphology_index
+        version = group[_index].attrs.get("version", None)
+        if cached is None or version is None or cached.version != version:
+            cached = _MorphologyIndex.read(group)
+            self._engine._morphology_index = cached
+        return cached
+
+    def _require_index(self, group):
+        # Return the index of the repository group, creating or upgrading the index
+        # dataset if necessary. Requires a write lock.
+        if _index in group and _MorphologyIndex.is_current(group[_index]):
+            return self._load_index(group)
+        if _index in group:
+            metas = _MorphologyIndex.read(group).meta.values()
+            del group[_index]
+        else:
+            metas = (
+                {"name": name, **_stored_meta(group[name])}
+                for name in group.keys()
+                if name != _index
+            )
+        index = _MorphologyIndex.create(group)
+        for meta in metas:
+            index.put(group, meta)
+        self._engine._morphology_index = index
+        return index
+
+
+class _MorphologyIndex:
+    """
+    The index dataset of a repository, and an in memory copy of it. Rows are appended,
+    or overwritten in place, and rows of removed morphologies are marked as removed, so
+    that the dataset never has to be rewritten. Each change gives the dataset a new
+    version, so that copies read by other processes can be recognized as stale.
+    """
+
+    def __init__(self, version, meta, rows):
+        self.version = version
+        self.meta = meta
+        self._rows = rows
+
+    @classmethod
+    def create(cls, group):
+        group.create_dataset(
+            _index, shape=(0,), maxshape=(None,), dtype=_index_dtype, chunks=(256,)
+        )
+        index = cls(None, {}, {})
+        index._bump(group)
+        return index
+
+    @staticmethod
+    def is_current(dataset):
+        return (
+            dataset.maxshape == (None,)
+            and "removed" in dataset.dtype.names
+            and "version" in dataset.attrs
+        )
+
+    @classmethod
+    def read(cls, group):
+        dataset = group[_index]
+        meta, rows = {}, {}
+        for i, row in enumerate(dataset[()]):
+            if "removed" in row.dtype.names and row["removed"]:
+                continue
+            name = _str(row["name"])
+            rows[name] = i
+            meta[name] = {
+                "name": name,
+                "ldc": row["ldc"],
+                "mdc": row["mdc"],
+                "branches": int(row["branches"]),
+                "points": int(row["points"]),
+                "labels": json.loads(row["labels"]),
+            }
+        return cls(dataset.attrs.get("version", None), meta, rows)
+
+    def put(self, group, meta):
+        row = np.empty(1, dtype=_index_dtype)[0]
+        row["name"] = meta["name"]
+        row["ldc"] = meta["ldc"]
+        row["mdc"] = meta["mdc"]
+        row["branches"] = meta["branches"]
+        row["points"] = meta["points"]
+        row["labels"] = json.dumps(meta["labels"])
+        row["removed"] = False
+        dataset = group[_index]
+        i = self._rows.get(meta["name"])
+        if i is None:
+            i = len(dataset)
+            dataset.resize((i + 1,))
+        dataset[i] = row
+        self._rows[meta["name"]] = i
+        self.meta[meta["name"]] = meta
+        self._bump(group)
+
+    def remove(self, group, name):
+        i = self._rows.pop(name, None)
+        self.meta.pop(name, None)
+        if i is not None:
+            dataset = group[_index]
+            row = dataset[i]
+            row["removed"] = True
+            dataset[i] = row
+        self._bump(group)
+
+    def _bump(self, group):
+        self.version = uuid.uuid4().hex
+        group[_index].attrs["version"] = self.version
+
+
+def _str(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _stored_meta(group):
+    # Collect the index metadata of a stored morphology from the shapes and attributes
+    # of its datasets, without reading its points.
+    if "points" in group:
+        points = len(group["points"])
+        branches = len(group["structure"])
+        labels = [str(n) for n in group["labels"].attrs["names"]]
+    else:
+        branch_groups = list(group["branches"].values())
+        points = sum(len(b["x"]) for b in branch_groups)
+        branches = len(branch_groups)
+        labels = sorted(
+            set(
+                chain.from_iterable(
+                    chain(b.attrs.get("branch_labels", []), b["labels"].keys())
+                    for b in branch_groups
+                )
+            )
+        )
+    if not points:
+        ldc, mdc = np.zeros(3), np.zeros(3)
+    elif "ldc" in group.attrs and "mdc" in group.attrs:
+        ldc, mdc = group.attrs["ldc"], group.attrs["mdc"]
+    else:
+        # Only morphologies stored without their bounds have to be read.
+        if "points" in group:
+            coords = group["points"][:, :3]
+        else:
+            coords = np.concatenate(
+                [np.column_stack([b[v][()] for v in "xyz"]) for b in branch_groups]
+            )
+        ldc, mdc = np.min(coords, axis=0), np.max(coords, axis=0)
+    return {
+        "ldc": np.array(ldc, dtype=float),
+        "mdc": np.array(mdc, dtype=float),
+        "branches": branches,
+        "points": points,
+        "labels": [str(l) for l in labels],
+    }
+
+
+def _bounds_meta(points, branches, labels):
+    if len(points):
+        ldc, mdc = np.min(points[:, :3], axis=0), np.max(points[:, :3], axis=0)
+    else:
+        ldc, mdc = np.zeros(3), np.zeros(3)
+    return {
+        "ldc": ldc,
+        "mdc": mdc,
+        "branches": branches,
+        "points": len(points),
+        "labels": labels,
+    }
+
+
+def _save_morphology(root, morphology):
+    # Store the morphology in the flat format: the points of all branches, depth first,
+    # in one dataset, the stop offset and parent of each branch in another, and the
+    # point and branch labels as packed bitmasks.
+    branches = morphology.branches
+    ids = {branch: id for id, branch in enumerate(branches)}
+    parents = [-1 if b._parent is None else ids[b._parent] for b in branches]
+    stops = np.cumsum([len(b) for b in branches], dtype=int)
+    points = morphology.flatten(matrix=True)
+    names = sorted(
+        set(chain.from_iterable(chain(b._full_labels, b._label_masks) for b in branches))
+    )
+    point_bits = np.zeros((len(points), len(names)), dtype=bool)
+    branch_bits = np.zeros((len(branches), len(names)), dtype=bool)
+    for i, (branch, stop) in enumerate(zip(branches, stops)):
+        for label in branch._full_labels:
+            branch_bits[i, names.index(label)] = True
+        for label, mask in branch._label_masks.items():
+            point_bits[stop - len(branch) : stop, names.index(label)] = mask
+    root.create_dataset("points", data=points, dtype=float)
+    root.create_dataset("structure", data=np.column_stack((stops, parents)), dtype=int)
+    labels = root.create_dataset("labels", data=_pack(point_bits))
+    labels.attrs["names"] = names
+    root.create_dataset("branch_labels", data=_pack(branch_bits))
+    meta = _bounds_meta(points, len(branches), names)
+    if len(points):
+        root.attrs["ldc"] = meta["ldc"]
+        root.attrs["mdc"] = meta["mdc"]
+    return meta
+
+
+def _pack(bits):
+    return np.packbits(bits, axis=1, bitorder="little")
+
+
+def _unpack(packed, n):
+    return np.unpackbits(packed, axis=1, count=n, bitorder="little").astype(bool)
 
 
 def _morphology(m_root_group):
+    if "points" in m_root_group:
+        return _flat_morphology(m_root_group)
     b_root_group = m_root_group["branches"]
     branches = [_branch(b_group) for b_group in _int_ordered_iter(b_root_group)]
     _attach_branches(branches)
@@ -120,6 +361,29 @@ def _morphology(m_root_group):
     return morpho
 
 
+def _flat_morphology(m_root_group):
+    points = m_root_group["points"][()]
+    structure = m_root_group["structure"][()]
+    names = [str(n) for n in m_root_group["labels"].attrs["names"]]
+    point_bits = _unpack(m_root_group["labels"][()], len(names))
+    branch_bits = _unpack(m_root_group["branch_labels"][()], len(names))
+    branches = []
+    start = 0
+    for (stop, parent), labelled in zip(structure, branch_bits):
+        # The branch vectors are views on the columns of the points matrix.
+        branch = Branch(*points[start:stop].T)
+        branch.label_all(*(names[i] for i in np.nonzero(labelled)[0]))
+        bits = point_bits[start:stop]
+        for i in np.nonzero(bits.any(axis=0))[0]:
+            branch.label_points(names[i], bits[:, i])
+        if parent >= 0:
+            branches[parent].attach_child(branch)
+        branches.append(branch)
+        start = stop
+    roots = [b for b in branches if b._parent is None]
+    return Morphology(roots, meta=_meta(m_root_group))
+
+
 def _meta(group):
     return dict(group.attrs)
 
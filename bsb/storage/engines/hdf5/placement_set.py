@@ -5,6 +5,7 @@ from ....morphologies import MorphologySet, RotationSet
 from .chunks import ChunkLoader, ChunkedProperty
 import numpy as np
 import itertools
+import h5py
 
 _pos_prop = lambda l: ChunkedProperty(l, "position", shape=(0, 3), dtype=float)
 _rot_prop = lambda l: ChunkedProperty(l, "rotation", shape=(0, 3), dtype=float)
@@ -118,33 +119,189 @@ class PlacementSet(
         :raises: DatasetNotFoundError when the morphology data is not found.
         """
         try:
-            return MorphologySet(
-                self._get_morphology_loaders(), self._morphology_chunks.load()
-            )
+            with self._engine._read():
+                names = self._get_morphology_names()
+                if names is None:
+                    names, indices = self._load_legacy_morphologies()
+                else:
+                    indices = self._morphology_chunks.load()
+            return MorphologySet(self._get_morphology_loaders(names), indices)
         except DatasetNotFoundError:
             raise DatasetNotFoundError(
                 "No morphology information for the '{}' placement set.".format(self.tag)
             )
 
-    def _get_morphology_loaders(self):
-        loaded_names = set()
-        stor_mor = []
+    def query_region(self, ldc, mdc):
+        """
+        Return the ids of the cells positioned inside of a box. Only the positions of the
+        chunks whose cells lie partially inside of the box are read.
+
+        :param ldc: Least dominant corner of the box.
+        :param mdc: Most dominant corner of the box.
+        :returns: Sorted ids of the cells, indices into :meth:`.load_positions`.
+        :rtype: numpy.ndarray
+        """
+        ldc, mdc = np.array(ldc, dtype=float), np.array(mdc, dtype=float)
+        return self._query(
+            lambda c_ldc, c_mdc: np.all((c_ldc <= mdc) & (c_mdc >= ldc), axis=1),
+            lambda c_ldc, c_mdc: np.all((c_ldc >= ldc) & (c_mdc <= mdc), axis=1),
+            lambda pos: np.all((pos >= ldc) & (pos <= mdc), axis=1),
+        )
+
+    def query_sphere(self, center, radius):
+        """
+        Return the ids of the cells positioned inside of a sphere. Only the positions of
+        the chunks whose cells lie partially inside of the sphere are read.
+
+        :param center: Center of the sphere.
+        :param radius: Radius of the sphere.
+        :returns: Sorted ids of the cells, indices into :meth:`.load_positions`.
+        :rtype: numpy.ndarray
+        """
+        center = np.array(center, dtype=float)
+        r2 = radius ** 2
+
+        def overlaps(c_ldc, c_mdc):
+            # Distance to the point of the chunk closest to the center
+            nearest = np.clip(center, c_ldc, c_mdc)
+            return np.sum((nearest - center) ** 2, axis=1) <= r2
+
+        def contains(c_ldc, c_mdc):
+            # Distance to the corner of the chunk furthest from the center
+            furthest = np.maximum(np.abs(c_ldc - center), np.abs(c_mdc - center))
+            return np.sum(furthest ** 2, axis=1) <= r2
+
+        return self._query(
+            overlaps, contains, lambda pos: np.sum((pos - center) ** 2, axis=1) <= r2
+        )
+
+    def _query(self, overlaps, contains, select):
+        # Use the bounding boxes of the positions in each chunk as a coarse index: skip
+        # the chunks that don't overlap, take all cells of the chunks that are contained,
+        # and only read the positions of the other chunks, to select the cells within
+        # them. Cells aren't necessarily positioned inside of their chunk, so the chunk's
+        # own bounds can't be used.
+        prop = self._position_chunks
         with self._engine._read():
-            with self._engine._handle("r") as f:
-                for chunk in self.get_loaded_chunks():
-                    path = self.get_chunk_path(chunk)
-                    _map = f[path].attrs.get("morphology_loaders", [])
-                    cmlist = self._engine.morphologies.select(_MapSelector(self, _map))
-                    stor_mor.extend(m for m in cmlist if m.name not in loaded_names)
-                    loaded_names.update(m.name for m in cmlist)
-        return stor_mor
+            chunks = self.get_loaded_chunks()
+            if not chunks:
+                return np.empty(0, dtype=int)
+            sizes = prop.load_sizes(chunks)
+            offsets = np.cumsum(sizes) - sizes
+            c_ldc, c_mdc, known = self._load_position_bounds(chunks)
+            near = (~known | overlaps(c_ldc, c_mdc)) & (sizes > 0)
+            inside = near & known & contains(c_ldc, c_mdc)
+            partial = near & ~inside
+            ranges = lambda mask: [
+                np.arange(o, o + n) for o, n in zip(offsets[mask], sizes[mask])
+            ]
+            partial_ids = np.concatenate(ranges(partial) + [np.empty(0, dtype=int)])
+            if len(partial_ids):
+                pos = prop.load(chunks=chunks[partial])
+                partial_ids = partial_ids[select(pos)]
+        ids = np.concatenate(ranges(inside) + [partial_ids])
+        return np.sort(ids)
 
-    def _set_morphology_loaders(self, map):
+    def _load_position_bounds(self, chunks):
+        # Return the bounding boxes of the positions of the chunks, and whether they are
+        # known. Chunks written before the bounds were stored have none.
+        bounds = np.zeros((len(chunks), 6))
+        known = np.zeros(len(chunks), dtype=bool)
+        with self._engine._handle("r") as f:
+            for i, chunk in enumerate(chunks):
+                path = self.get_chunk_path(chunk)
+                if path in f and "position_bounds" in f[path].attrs:
+                    bounds[i] = f[path].attrs["position_bounds"]
+                    known[i] = True
+        return bounds[:, :3], bounds[:, 3:], known
+
+    def _extend_position_bounds(self, chunk, positions):
+        positions = np.asarray(positions, dtype=float)
+        if not len(positions):
+            return
         with self._engine._write():
             with self._engine._handle("a") as f:
-                for chunk in self.get_loaded_chunks():
+                attrs = f[self.get_chunk_path(chunk)].attrs
+                if positions.ndim != 2 or positions.shape[1] != 3:
+                    # Can't bound data we don't understand, fall back to reading it.
+                    attrs.pop("position_bounds", None)
+                    return
+                bounds = np.concatenate(
+                    (np.min(positions, axis=0), np.max(positions, axis=0))
+                )
+                if "position_bounds" in attrs:
+                    old = attrs["position_bounds"]
+                    bounds[:3] = np.minimum(bounds[:3], old[:3])
+                    bounds[3:] = np.maximum(bounds[3:], old[3:])
+                attrs["position_bounds"] = bounds
+
+    def clear(self, chunks=None):
+        if chunks is None:
+            chunks = self.get_loaded_chunks()
+        super().clear(chunks)
+        with self._engine._write():
+            with self._engine._handle("a") as f:
+                for chunk in chunks:
                     path = self.get_chunk_path(chunk)
-                    f[path].attrs["morphology_loaders"] = map
+                    if path in f:
+                        f[path].attrs.pop("position_bounds", None)
+
+    def _get_morphology_names(self):
+        # Return the morphology name table of this set, or `None` if it has none.
+        with self._engine._handle("r") as f:
+            path = self._path + "/morphology_names"
+            if path not in f:
+                return None
+            return list(f[path].asstr()[()])
+
+    def _get_morphology_loaders(self, names):
+        # Resolve all the loaders of the set in a single pass over the repository, and
+        # put them in name table order.
+        loaders = {
+            m.get_meta()["name"]: m
+            for m in self._engine.morphologies.select(_MapSelector(self, names))
+        }
+        return [loaders[name] for name in names]
+
+    def _load_legacy_morphologies(self):
+        # Sets written before the name table have a map of names per chunk, to which the
+        # indices of that chunk refer. Remap them to a table of all the names instead.
+        names, lookup, indices = [], {}, []
+        with self._engine._handle("r") as f:
+            for chunk in self.get_loaded_chunks():
+                map = self._legacy_map(f, chunk)
+                remap = _remap_names(names, lookup, map)
+                indices.append(remap[self._morphology_chunks.load(chunks=[chunk])])
+        return names, np.concatenate(indices) if indices else np.empty(0, dtype=int)
+
+    def _legacy_map(self, handle, chunk):
+        path = self.get_chunk_path(chunk)
+        if path not in handle:
+            return []
+        return [_str(name) for name in handle[path].attrs.get("morphology_loaders", [])]
+
+    def _require_morphology_names(self, handle):
+        # Return the name table dataset, create it when it doesn't exist yet, and migrate
+        # the indices of any chunks that refer to a legacy per chunk map.
+        path = self._path + "/morphology_names"
+        if path in handle:
+            return handle[path]
+        table = handle.create_dataset(
+            path, (0,), maxshape=(None,), dtype=h5py.string_dtype()
+        )
+        names, lookup = [], {}
+        for chunk in self.get_all_chunks():
+            chunk_group = handle[self.get_chunk_path(chunk)]
+            if "morphology_loaders" not in chunk_group.attrs:
+                continue
+            remap = _remap_names(names, lookup, self._legacy_map(handle, chunk))
+            data = self._morphology_chunks.load(chunks=[chunk])
+            self._morphology_chunks.clear(chunk)
+            self._morphology_chunks.append(chunk, remap[data])
+            del chunk_group.attrs["morphology_loaders"]
+        table.resize((len(names),))
+        table[:] = names
+        return table
 
     def __iter__(self):
         return itertools.zip_longest(
@@ -189,6 +346,7 @@ class PlacementSet(
 
         if positions is not None:
             self._position_chunks.append(chunk, positions)
+            self._extend_position_bounds(chunk, positions)
         if rotations is not None and morphologies is None:
             raise ValueError("Can't append rotations without morphologies.")
         if morphologies is not None:
@@ -202,11 +360,19 @@ class PlacementSet(
                 self.append_additional(key, chunk, ds)
 
     def _append_morphologies(self, chunk, new_set):
-        with self.chunk_context(chunk):
-            morphology_set = self.load_morphologies().merge(new_set)
-            self._set_morphology_loaders(morphology_set._serialize_loaders())
-            self._morphology_chunks.clear(chunk)
-            self._morphology_chunks.append(chunk, morphology_set.get_indices())
+        # Add the new names to the name table of the set, and append the indices of the
+        # new set, remapped to the table, to the chunk. Existing data is left untouched.
+        with self._engine._write():
+            with self._engine._handle("a") as f:
+                table = self._require_morphology_names(f)
+                names = list(table.asstr()[()])
+                lookup = {name: i for i, name in enumerate(names)}
+                remap = _remap_names(names, lookup, new_set._serialize_loaders())
+                if len(names) > len(table):
+                    start = len(table)
+                    table.resize((len(names),))
+                    table[start:] = names[start:]
+            self._morphology_chunks.append(chunk, remap[new_set.get_indices()])
 
     def append_entities(self, chunk, count, additional=None):
         self.append_data(chunk, count=count, additional=additional)
@@ -225,3 +391,17 @@ class PlacementSet(
                     start_pos = dset.shape[0]
                     dset.resize(start_pos + len(data), axis=0)
                     dset[start_pos:] = data
+
+
+def _remap_names(names, lookup, map):
+    # Add the names of the map that aren't in the table yet, and return the table index
+    # of each name in the map.
+    for name in map:
+        if name not in lookup:
+            lookup[name] = len(names)
+            names.append(name)
+    return np.array([lookup[name] for name in map], dtype=int)
+
+
+def _str(name):
+    return name.decode() if isinstance(name, bytes) else name
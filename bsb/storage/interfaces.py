@@ -1,10 +1,13 @@
 import abc
 import types
 import functools
+import itertools
 from contextlib import contextmanager
 import numpy as np
 import arbor
 from ..morphologies import Morphology, Branch
+from .. import options
+from ._cache import MorphologyCache
 from ..trees import BoxTree
 from rtree import index as rtree
 from scipy.spatial.transform import Rotation
@@ -25,6 +28,7 @@ class Interface(abc.ABC):
 class Engine(Interface):
     def __init__(self, root):
         self.root = root
+        self.morphology_cache = MorphologyCache(options.morphology_cache * 2 ** 20)
 
     @property
     def format(self):
@@ -198,6 +202,40 @@ class PlacementSet(Interface):
 
     @abc.abstractmethod
     def get_all_chunks(self):
+        """
+        Override with a method to return all chunks that contain data of the placement
+        set.
+
+        :rtype: :class:`~.storage.ChunkList`
+        """
+        pass
+
+    def compact(self):
+        """
+        Can be overridden with a method to optimize the storage layout of the placement
+        set for reading, once all data has been appended to it. The default
+        implementation does nothing.
+        """
+        pass
+
+    @abc.abstractmethod
+    def query_region(self, ldc, mdc):
+        """
+        Return the ids of the cells positioned inside of a box.
+
+        :param ldc: Least dominant corner of the box.
+        :param mdc: Most dominant corner of the box.
+        """
+        pass
+
+    @abc.abstractmethod
+    def query_sphere(self, center, radius):
+        """
+        Return the ids of the cells positioned inside of a sphere.
+
+        :param center: Center of the sphere.
+        :param radius: Radius of the sphere.
+        """
         pass
 
     @abc.abstractmethod
@@ -242,33 +280,44 @@ class PlacementSet(Interface):
     def append_additional(self, name, chunk, data):
         pass
 
-    def load_boxes(self, cache=None, itr=True):
+    def load_boxes(self, cache=None, itr=False, block_size=100000):
+        """
+        Load the bounding boxes of the rotated and translated morphologies of the cells.
+
+        :param cache: Morphology set to use instead of loading it.
+        :type cache: :class:`~.morphologies.MorphologySet`
+        :param itr: Return a generator that yields the boxes in blocks of at most
+          ``block_size`` cells, to bound the memory usage, instead of all the boxes.
+        :type itr: bool
+        :param block_size: Maximum number of boxes per block.
+        :type block_size: int
+        :returns: Matrix with the min and max corner of the box of each cell on each row.
+        :rtype: Union[numpy.ndarray, Iterator[numpy.ndarray]]
+        """
         if cache is None:
             mset = self.load_morphologies()
         else:
             mset = cache
-        expansion = [*zip([0] * 4 + [1] * 4, ([0] * 2 + [1] * 2) * 2, [0, 1] * 4)]
-
-        def _box_of(m, o, r):
-            oo = (m["ldc"], m["mdc"])
-            # Make the 8 corners of the box
-            corners = np.array([[oo[x][0], oo[y][1], oo[z][2]] for x, y, z in expansion])
-            # Rotate them
-            rotbox = r.apply(corners)
-            # Find outer box of rotated and translated starting box
-            return np.concatenate(
-                (np.min(rotbox, axis=0) + o, np.max(rotbox, axis=0) + o)
-            )
-
-        iters = (mset.iter_meta(), self.load_positions(), self.load_rotations())
-        iter = map(_box_of, *iters)
+        metas = list(mset.iter_meta(unique=True))
+        ldc = np.array([m["ldc"] for m in metas], dtype=float).reshape(-1, 3)
+        mdc = np.array([m["mdc"] for m in metas], dtype=float).reshape(-1, 3)
+        # Make the 8 corners of the box of each unique morphology
+        expansion = np.array([*itertools.product((False, True), repeat=3)])
+        corners = np.where(expansion, mdc[:, np.newaxis], ldc[:, np.newaxis])
+        blocks = _box_blocks(
+            corners,
+            mset.get_indices(),
+            self.load_positions(),
+            self.load_rotations().get_raw(copy=False),
+            block_size,
+        )
         if itr:
-            return iter
+            return blocks
         else:
-            return list(iter)
+            return np.concatenate([*blocks, np.empty((0, 6))])
 
     def load_box_tree(self, cache=None):
-        return BoxTree(self.load_boxes(cache=cache, itr=True))
+        return BoxTree(self.load_boxes(cache=cache))
 
 
 class MorphologyRepository(Interface, engine_key="morphologies"):
@@ -429,16 +478,42 @@ class ConnectivitySet(Interface):
         """
         pass
 
+    @abc.abstractmethod
+    def iter_blocks(self, src_chunks=None, dest_chunks=None, block_size=1000000):
+        """
+        Override with a generator of blocks of connections, as tuples of source chunk,
+        destination chunk, source locations and destination locations.
+        """
+        pass
+
+    @abc.abstractmethod
+    def __len__(self):
+        """
+        Override with a method to return the number of connections, preferably without
+        loading them.
+        """
+        pass
+
+    def compact(self):
+        """
+        Can be overridden with a method to optimize the storage layout of the
+        connectivity set for reading, once all data has been appended to it. The default
+        implementation does nothing.
+        """
+        pass
+
     @abc.abstractclassmethod
     def get_tags(cls, engine):
         pass
 
 
 class StoredMorphology:
-    def __init__(self, name, loader, meta):
+    def __init__(self, name, loader, meta, cache=None, version=None):
         self.name = name
         self._loader = loader
         self._meta = meta
+        self._cache = cache
+        self._version = version
 
     def get_meta(self):
         return self._meta.copy()
@@ -446,6 +521,26 @@ class StoredMorphology:
     def load(self):
         return self._loader()
 
-    @functools.cache
     def cached_load(self):
-        return self.load()
+        """
+        Load the morphology through the :class:`~.storage.MorphologyCache` of the
+        storage engine. Each call returns a new copy that may be transformed freely, but
+        its point data is shared with the cache and can't be modified in place.
+        """
+        if self._cache is None:
+            return self.load()
+        version = self._version() if self._version is not None else None
+        return self._cache.get(self.name, self._loader, version)
+
+
+def _box_blocks(corners, indices, positions, angles, block_size):
+    for start in range(0, len(indices), block_size):
+        block = slice(start, start + block_size)
+        # Rotate the corners of the boxes of the morphologies of the cells
+        matrices = Rotation.from_euler("xyz", angles[block]).as_matrix()
+        rotated = np.einsum("nij,nkj->nki", matrices, corners[indices[block]])
+        # Find outer box of rotated and translated starting box
+        pos = positions[block]
+        yield np.column_stack(
+            (np.min(rotated, axis=1) + pos, np.max(rotated, axis=1) + pos)
+        )
@@ -1,4 +1,7 @@
 from rtree import index as rtree
+from . import options
+import numpy as np
+import itertools
 import abc
 
 
@@ -11,12 +14,37 @@ class BoxTreeInterface(abc.ABC):
     def __len__(self):
         pass
 
+    def query_batch(self, boxes):
+        """
+        Query the tree for the stored boxes that intersect each of the given boxes.
+
+        :param boxes: Matrix of the query boxes, with the min and max corner of a box on
+          each row.
+        :type boxes: numpy.ndarray
+        :returns: The ``offsets`` and ``indices`` arrays of the results in compressed
+          sparse row format: the indices of the stored boxes that intersect query box
+          ``i`` are ``indices[offsets[i]:offsets[i + 1]]``.
+        :rtype: Tuple[numpy.ndarray, numpy.ndarray]
+        """
+        results = [np.array(r, dtype=int) for r in self.query(boxes)]
+        offsets = np.zeros(len(results) + 1, dtype=int)
+        np.cumsum([len(r) for r in results], out=offsets[1:])
+        return offsets, np.concatenate(results) if results else np.empty(0, dtype=int)
+
 
 class BoxRTree(BoxTreeInterface):
     def __init__(self, boxes):
-        self._rtree = rtree.Index(properties=rtree.Property(dimension=3))
-        for id, box in enumerate(boxes):
-            self._rtree.insert(id, box)
+        props = rtree.Property(dimension=3)
+        stream = iter(enumerate(boxes))
+        try:
+            first = next(stream)
+        except StopIteration:
+            # The bulk loader doesn't accept empty streams
+            self._rtree = rtree.Index(properties=props)
+        else:
+            # Bulk load the boxes, which is much faster than inserting them one by one.
+            stream = ((id, box, None) for id, box in itertools.chain((first,), stream))
+            self._rtree = rtree.Index(stream, properties=props)
 
     def __len__(self):
         return self._rtree.get_size()
@@ -25,6 +53,185 @@ class BoxRTree(BoxTreeInterface):
         return ([*self._rtree.intersection(box, objects=False)] for box in boxes)
 
 
-# Cheapo provider
-class BoxTree(BoxRTree):
-    pass
+class BoxGridTree(BoxTreeInterface):
+    """
+    Box tree that hashes the boxes into the cells of a uniform grid, and answers batches
+    of queries with vectorized NumPy operations, without creating Python objects per box.
+
+    :param boxes: Matrix of the boxes, with the min and max corner of a box on each row.
+    :type boxes: numpy.ndarray
+    :param cell_size: Size of the grid cells. By default the median size of the boxes.
+    :type cell_size: Union[float, numpy.ndarray]
+    :param batch_size: Maximum number of query boxes to process at once, to limit the
+      memory of the intermediate results.
+    :type batch_size: int
+    :param max_cells: Maximum number of grid cells a box is hashed into. Larger stored
+      boxes are kept in an overflow list, and larger query boxes are tested against all
+      stored boxes, so that a few large boxes among small ones can't exhaust the memory.
+    :type max_cells: int
+    """
+
+    def __init__(self, boxes, cell_size=None, batch_size=100000, max_cells=64):
+        self._boxes = _as_boxes(boxes)
+        self._batch_size = batch_size
+        self._max_cells = max_cells
+        if cell_size is None:
+            cell_size = self._default_cell_size()
+        self._cell_size = np.broadcast_to(np.array(cell_size, dtype=float), (3,))
+        lo, hi = self._grid_coords(self._boxes)
+        large = np.prod(hi - lo + 1, axis=1) > max_cells
+        self._overflow = np.nonzero(large)[0]
+        small = np.nonzero(~large)[0]
+        if not len(small):
+            self._origin = np.zeros(3, dtype=int)
+            self._dims = np.ones(3, dtype=int)
+            self._codes = self._ids = np.empty(0, dtype=int)
+            return
+        # Only the small boxes span the grid, the overflow boxes are tested separately.
+        lo, hi = lo[small], hi[small]
+        self._origin = np.min(lo, axis=0)
+        self._dims = np.max(hi, axis=0) - self._origin + 1
+        ids, codes = self._cover(lo - self._origin, hi - self._origin)
+        ids = small[ids]
+        # Sort the (cell, box) pairs by cell, so that the boxes in a cell can be found
+        # with a binary search.
+        order = np.argsort(codes, kind="stable")
+        self._codes = codes[order]
+        self._ids = ids[order]
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def query(self, boxes):
+        offsets, indices = self.query_batch(boxes)
+        return (indices[s:e].tolist() for s, e in zip(offsets[:-1], offsets[1:]))
+
+    def query_batch(self, boxes):
+        boxes = _as_boxes(boxes)
+        results = [
+            self._query_batch(boxes[i : i + self._batch_size])
+            for i in range(0, len(boxes), self._batch_size)
+        ]
+        offsets = np.zeros(len(boxes) + 1, dtype=int)
+        if not results:
+            return offsets, np.empty(0, dtype=int)
+        np.cumsum(np.concatenate([np.diff(o) for o, _ in results]), out=offsets[1:])
+        return offsets, np.concatenate([indices for _, indices in results])
+
+    def _query_batch(self, boxes):
+        lo, hi = self._grid_coords(boxes)
+        lo = lo - self._origin
+        hi = hi - self._origin
+        # Skip the query boxes outside of the grid, and clip the others to it.
+        inside = np.all((hi >= 0) & (lo < self._dims), axis=1)
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, self._dims - 1)
+        # Query boxes that cover too many cells are tested against all stored boxes.
+        large = inside & (np.prod(hi - lo + 1, axis=1) > self._max_cells)
+        grid = inside & ~large
+        qids = np.nonzero(grid)[0]
+        owners, codes = self._cover(lo[grid], hi[grid])
+        owners = qids[owners]
+        # Look up the stored boxes in each cell covered by each query box
+        starts = np.searchsorted(self._codes, codes, side="left")
+        counts = np.searchsorted(self._codes, codes, side="right") - starts
+        qs = np.repeat(owners, counts)
+        bs = self._ids[_expand_ranges(starts, counts)]
+        # A pair of boxes can share multiple cells, keep the unique pairs.
+        pairs = np.unique(qs * len(self) + bs)
+        qs, bs = np.divmod(pairs, len(self)) if len(self) else (pairs, pairs)
+        # Sharing a cell is not enough, the boxes themselves have to intersect.
+        pairs = pairs[_intersect(boxes[qs], self._boxes[bs])]
+        # Add the pairs of the overflow boxes and of the large query boxes, and sort all
+        # of the pairs by query box and then stored box.
+        pairs = np.sort(
+            np.concatenate(
+                (
+                    pairs,
+                    self._brute_force(boxes, np.nonzero(~large)[0], self._overflow),
+                    self._brute_force(boxes, np.nonzero(large)[0], np.arange(len(self))),
+                )
+            )
+        )
+        qs, bs = np.divmod(pairs, len(self)) if len(self) else (pairs, pairs)
+        offsets = np.zeros(len(boxes) + 1, dtype=int)
+        np.cumsum(np.bincount(qs, minlength=len(boxes)), out=offsets[1:])
+        return offsets, bs
+
+    def _brute_force(self, boxes, qids, sids):
+        # Return the pairs of the query and stored boxes that intersect, testing all
+        # pairs in blocks of at most `batch_size` pairs.
+        pairs = [np.empty(0, dtype=int)]
+        step = max(self._batch_size // max(len(sids), 1), 1)
+        for i in range(0, len(qids) if len(sids) else 0, step):
+            q = qids[i : i + step]
+            qi, si = np.nonzero(_intersect(boxes[q, None], self._boxes[None, sids]))
+            pairs.append(q[qi] * len(self) + sids[si])
+        return np.concatenate(pairs)
+
+    def _default_cell_size(self):
+        if not len(self._boxes):
+            return 1.0
+        extent = self._boxes[:, 3:] - self._boxes[:, :3]
+        size = np.median(extent, axis=0)
+        # Fall back to an even division of the space for flat dimensions.
+        span = np.max(self._boxes[:, 3:], axis=0) - np.min(self._boxes[:, :3], axis=0)
+        size = np.where(size > 0, size, span / np.cbrt(len(self._boxes)))
+        return np.where(size > 0, size, 1.0)
+
+    def _grid_coords(self, boxes):
+        lo = np.floor(boxes[:, :3] / self._cell_size).astype(int)
+        hi = np.floor(boxes[:, 3:] / self._cell_size).astype(int)
+        return lo, hi
+
+    def _cover(self, lo, hi):
+        # Return the box index and the cell code of each grid cell covered by each box.
+        n = hi - lo + 1
+        total = np.prod(n, axis=1)
+        owners = np.repeat(np.arange(len(lo)), total)
+        local = _expand_ranges(np.zeros(len(lo), dtype=int), total)
+        n = n[owners]
+        z = local % n[:, 2]
+        y = (local // n[:, 2]) % n[:, 1]
+        x = local // (n[:, 2] * n[:, 1])
+        cells = lo[owners] + np.column_stack((x, y, z))
+        codes = (cells[:, 0] * self._dims[1] + cells[:, 1]) * self._dims[2] + cells[:, 2]
+        return owners, codes
+
+
+class BoxTree(BoxTreeInterface):
+    """
+    Box tree of the provider selected by the ``box_tree`` :doc:`option
+    </usage/options>`: ``rtree`` for :class:`.BoxRTree` or ``grid`` for
+    :class:`.BoxGridTree`.
+    """
+
+    def __new__(cls, boxes):
+        try:
+            provider = _providers[options.box_tree]
+        except KeyError:
+            raise ValueError(
+                f"Unknown box tree provider '{options.box_tree}',"
+                + f" choose from: {', '.join(_providers)}."
+            ) from None
+        return provider(boxes)
+
+
+_providers = {"rtree": BoxRTree, "grid": BoxGridTree}
+
+
+def _as_boxes(boxes):
+    if not isinstance(boxes, np.ndarray):
+        boxes = list(boxes)
+    return np.array(boxes, dtype=float, copy=False).reshape(-1, 6)
+
+
+def _intersect(a, b):
+    # Whether the boxes of `a` intersect the boxes of `b`, elementwise.
+    return np.all((a[..., :3] <= b[..., 3:]) & (b[..., :3] <= a[..., 3:]), axis=-1)
+
+
+def _expand_ranges(starts, counts):
+    # Concatenate the ranges `starts[i]:starts[i] + counts[i]`.
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(np.sum(counts, dtype=int))
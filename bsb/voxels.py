@@ -103,7 +103,8 @@ class VoxelSet:
           it needs to have the same length as `voxels`, and will be used as individual
           voxels.
         :type size: numpy.ndarray
-        :param data:
+        :param data: Data associated to each voxel, a row of data per voxel.
+        :type data: numpy.ndarray
 
         .. warning::
 
@@ -130,6 +131,7 @@ class VoxelSet:
                 f"Shape {voxel_size.shape} of `size` is"
                 + f" invalid for voxel shape {voxels.shape}"
             )
+        self._csr = None
         if data is not None:
             if isinstance(data, VoxelData):
                 if data_keys is None:
@@ -171,6 +173,8 @@ class VoxelSet:
         return len(self.get_raw(copy=False))
 
     def __getitem__(self, index):
+        if self._csr is not None:
+            return self._getitem_csr(index)
         if self.has_data:
             data = self._data[index]
             index, _, _ = self._data._split_index(index)
@@ -230,7 +234,19 @@ class VoxelSet:
 
         :rtype: bool
         """
-        return self._data is not None
+        return self._csr is not None or self._voxel_data is not None
+
+    @property
+    def _data(self):
+        # Voxel sets with a variable amount of data per voxel store it in a compressed
+        # sparse row format, and only expand it into voxel data rows when needed.
+        if self._voxel_data is None and self._csr is not None:
+            self._voxel_data = _csr_to_voxel_data(*self._csr)
+        return self._voxel_data
+
+    @_data.setter
+    def _data(self, value):
+        self._voxel_data = value
 
     @property
     def regular(self):
@@ -374,6 +390,15 @@ class VoxelSet:
     def copy(self):
         if self.is_empty:
             return VoxelSet.empty()
+        elif self._csr is not None:
+            offsets, values = self._csr
+            return VoxelSet._from_csr(
+                self.raw,
+                self.get_size(copy=True),
+                offsets.copy(),
+                values.copy(),
+                irregular=not self.regular,
+            )
         else:
             return VoxelSet(
                 self.raw,
@@ -389,7 +414,24 @@ class VoxelSet:
         return coords
 
     def get_data(self, index=None, /, copy=True):
-        if self.has_data:
+        """
+        Get the data of the voxels. Voxel sets with a variable amount of data per voxel,
+        such as those of :meth:`~.voxels.VoxelSet.from_morphology`, return the rows of
+        data of the voxel when indexed with a single integer, or the concatenated rows of
+        data of all the selected voxels otherwise.
+
+        :param index: Index of the voxels to get the data of. Returns all data if omitted.
+        :param copy: Return a copy of the data, if the data could be returned as a view.
+        :type copy: bool
+        """
+        if self._csr is not None and index is not None:
+            offsets, values = self._csr
+            if isinstance(index, (int, np.integer)):
+                data = values[offsets[index] : offsets[index + 1]]
+                return data.copy() if copy else data
+            else:
+                return _csr_take(offsets, values, index)[1]
+        elif self.has_data:
             if index is not None:
                 return self._data[index]
             else:
@@ -492,6 +534,21 @@ class VoxelSet:
     def _boxes_cache(self):
         return self._boxes()
 
+    def _getitem_csr(self, index):
+        ids = np.arange(len(self))[index]
+        if isinstance(ids, np.integer):
+            ids = np.array([ids])
+        if self._single_size:
+            voxel_size = self._size.copy()
+        else:
+            voxel_size = self._sizes[ids]
+        return VoxelSet._from_csr(
+            self.get_raw(copy=False)[ids],
+            voxel_size,
+            *_csr_take(*self._csr, ids),
+            irregular=not self.regular,
+        )
+
     def _boxes(self):
         base = self.as_spatial_coords(copy=False)
         sizes = self.get_size(copy=False)
@@ -505,8 +562,27 @@ class VoxelSet:
             mdc = shifted
         return np.column_stack((ldc, mdc))
 
+    @classmethod
+    def _from_csr(cls, voxels, size, offsets, values, irregular=False):
+        # Create a voxel set with the data rows `values[offsets[i]:offsets[i + 1]]` for
+        # each voxel `i`.
+        vs = cls(voxels, size, irregular=irregular)
+        vs._csr = (offsets, values)
+        return vs
+
     @classmethod
     def from_morphology(cls, morphology, estimate_n, with_data=True):
+        """
+        Voxelize a morphology into a grid of approximately ``estimate_n`` voxels.
+
+        :param morphology: Morphology to voxelize.
+        :type morphology: :class:`~.morphologies.Morphology`
+        :param estimate_n: Approximate amount of voxels to divide the morphology into.
+        :type estimate_n: int
+        :param with_data: Store the branch and point index of the points in each voxel
+          as the data of the voxel. See :meth:`~.voxels.VoxelSet.get_data`.
+        :type with_data: bool
+        """
         meta = morphology.meta
         if "mdc" in meta and "ldc" in meta:
             ldc, mdc = meta["ldc"], meta["mdc"]
@@ -516,21 +592,32 @@ class VoxelSet:
         size = mdc - ldc
         per_side = _eq_sides(size, estimate_n)
         voxel_size = size / per_side
-        branch_vcs = [
-            b.as_matrix(with_radius=False) // _safe_zero_div(voxel_size)
-            for b in morphology.branches
-        ]
-        if with_data:
-            voxel_reduce = {}
-            for branch, point_vcs in enumerate(branch_vcs):
-                for point, point_vc in enumerate(point_vcs):
-                    voxel_reduce.setdefault(tuple(point_vc), []).append((branch, point))
-            voxels = np.array(tuple(voxel_reduce.keys()))
-            data = np.array(list(voxel_reduce.values()), dtype=object)
-            return cls(voxels, voxel_size, data=data)
-        else:
-            voxels = np.unique(np.concatenate(branch_vcs), axis=0)
+        branches = morphology.branches
+        points = morphology.flatten(vectors=["x", "y", "z"], matrix=True)
+        if not len(points):
+            return cls(np.empty((0, 3)), voxel_size)
+        point_vcs = (points // _safe_zero_div(voxel_size)).astype(int)
+        # Encode the voxel coordinates of each point as a single integer, so that the
+        # points can be grouped per voxel with a 1D `np.unique`.
+        vc_min = np.min(point_vcs, axis=0)
+        dims = np.max(point_vcs, axis=0) - vc_min + 1
+        codes = np.ravel_multi_index((point_vcs - vc_min).T, dims)
+        if not with_data:
+            codes = np.unique(codes)
+            voxels = np.column_stack(np.unravel_index(codes, dims)) + vc_min
             return cls(voxels, voxel_size)
+        codes, inverse = np.unique(codes, return_inverse=True)
+        voxels = np.column_stack(np.unravel_index(codes, dims)) + vc_min
+        # Store the (branch, point) indices of the points, grouped per voxel in CSR form.
+        branch_sizes = [len(b) for b in branches]
+        branch_ids = np.repeat(np.arange(len(branches)), branch_sizes)
+        branch_starts = np.cumsum(branch_sizes) - branch_sizes
+        point_ids = np.arange(len(points)) - np.repeat(branch_starts, branch_sizes)
+        order = np.argsort(inverse, kind="stable")
+        values = np.column_stack((branch_ids[order], point_ids[order]))
+        offsets = np.zeros(len(voxels) + 1, dtype=int)
+        np.cumsum(np.bincount(inverse, minlength=len(voxels)), out=offsets[1:])
+        return cls._from_csr(voxels, voxel_size, offsets, values)
 
 
 @config.dynamic(
@@ -817,5 +904,22 @@ def _is_broadcastable(shape1, shape2):
     return True
 
 
+def _csr_take(offsets, values, index):
+    # Select the rows of a CSR offsets and values pair.
+    starts = np.atleast_1d(offsets[:-1][index])
+    counts = np.atleast_1d(offsets[1:][index]) - starts
+    new_offsets = np.zeros(len(counts) + 1, dtype=int)
+    np.cumsum(counts, out=new_offsets[1:])
+    take = np.repeat(starts - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+    return new_offsets, values[take]
+
+
+def _csr_to_voxel_data(offsets, values):
+    data = np.empty((len(offsets) - 1, 1), dtype=object)
+    for i, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+        data[i, 0] = values[start:stop]
+    return VoxelData(data)
+
+
 def _safe_zero_div(arr):
     return np.where(np.isclose(arr, 0), np.finfo(float).max, arr)
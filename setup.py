@@ -23,7 +23,7 @@ requires = [
     "pynrrd~=0.4",
     "mpilock~=1.1",
     "mpi4py",
-    "zwembad",
+    "zwembad~=1.2",
     "toml",
     "requests",
 ]
@@ -69,6 +69,10 @@ setuptools.setup(
             "sudo = bsb._options:sudo",
             "version = bsb._options:version",
             "config = bsb._options:config",
+            "scheduler = bsb._options:scheduler",
+            "pool = bsb._options:pool",
+            "morphology_cache = bsb._options:morphology_cache",
+            "box_tree = bsb._options:box_tree",
         ],
     },
     python_requires="~=3.8",
@@ -0,0 +1,59 @@
+import unittest, os, sys, numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+from types import SimpleNamespace
+from bsb.exceptions import UnknownGIDError
+from bsb.simulators.arbor.adapter import (
+    ConnectionTable,
+    QuickLookup,
+    _occurrence_index,
+)
+
+
+class TestConnectionTable(unittest.TestCase):
+    def setUp(self):
+        keys = np.array([1, 5, 3, 1, 7, 3])
+        self.table = ConnectionTable(
+            {3, 1, 7}, keys, weight=np.arange(6), start=np.arange(18).reshape(6, 3)
+        )
+
+    def test_rows(self):
+        self.assertEqual(5, len(self.table), "rows of unknown gids should be dropped")
+        self.assertEqual([0, 3], self.table.get(1, "weight").tolist(), "wrong rows")
+        self.assertEqual([2, 5], self.table.get(3, "weight").tolist(), "wrong rows")
+        self.assertEqual([4], self.table.get(7, "weight").tolist(), "wrong rows")
+        self.assertEqual((2, 3), self.table.get(3, "start").shape, "wrong column shape")
+        self.assertEqual([6, 7, 8], self.table.get(3, "start")[0].tolist(), "wrong row")
+
+    def test_missing(self):
+        self.assertEqual(0, len(self.table.get(5, "weight")), "dropped gid has rows")
+        self.assertEqual(0, len(self.table.get(100, "weight")), "unknown gid has rows")
+        empty = ConnectionTable([], np.empty(0, dtype=int), weight=np.empty(0))
+        self.assertEqual(0, len(empty), "empty table has rows")
+        self.assertEqual(0, len(empty.get(1, "weight")), "empty table has rows")
+
+    def test_occurrence_index(self):
+        gids = np.array([1, 1, 2, 1, 2, 1])
+        comps = np.array([4, 4, 4, 5, 4, 4])
+        index = _occurrence_index(gids, comps)
+        self.assertEqual([0, 1, 0, 0, 1, 2], index.tolist(), "wrong synapse numbering")
+
+
+class TestQuickLookup(unittest.TestCase):
+    def setUp(self):
+        self.a = SimpleNamespace(_ranges=[(0, 10), (20, 25)], _kind="a", _model="A")
+        self.b = SimpleNamespace(_ranges=[(10, 20)], _kind="b", _model="B")
+        self.lookup = QuickLookup.__new__(QuickLookup)
+        self.lookup._index([self.a, self.b])
+
+    def test_lookup(self):
+        for gid, owner in ((0, self.a), (9, self.a), (10, self.b), (19, self.b)):
+            self.assertIs(owner, self.lookup._lookup(gid), f"wrong owner of {gid}")
+        self.assertEqual("a", self.lookup.lookup_kind(24), "wrong kind")
+        self.assertEqual("B", self.lookup.lookup_model(15), "wrong model")
+
+    def test_unknown(self):
+        for gid in (-1, 25, 100):
+            with self.assertRaises(UnknownGIDError):
+                self.lookup._lookup(gid)
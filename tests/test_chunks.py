@@ -1,10 +1,12 @@
-import unittest, os, sys, numpy as np, h5py, json, shutil
+import unittest, os, sys, numpy as np, h5py, json, shutil, itertools
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
 from bsb.core import Scaffold
 from bsb.config import from_json
-from bsb.storage import Chunk
+from bsb.storage import Chunk, ChunkList
+from bsb.morphologies import Morphology, MorphologySet, Branch
+from scipy.spatial.transform import Rotation
 from bsb.exceptions import *
 from test_setup import get_config, skip_parallel, timeout
 
@@ -47,8 +49,231 @@ class TestChunks(unittest.TestCase):
         self.assertGreater(len(pos), 0, "No data loaded from chunk 000 after placement")
         # Force the addition of garbage data in another chunk, to be ignored by this
         # PlacementSet as it is set to load data only from chunk (0,0,0)
-        ps.append_data(Chunk((0, 0, 1), (100, 100, 100)), [0])
+        ps.append_data(Chunk((0, 0, 1), cs), [0])
         pos2 = ps.load_positions()
         self.assertEqual(
             pos.tolist(), pos2.tolist(), "PlacementSet loaded extraneous chunk data"
         )
+
+    @skip_parallel
+    @timeout(3)
+    def test_batched_load(self):
+        # Test that multiple chunks are read in order into one array, and that loading
+        # chunks that don't exist does not create them.
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        c0, c1, c2 = (Chunk((0, 0, i), cs) for i in range(3))
+        ps.append_data(c0, np.zeros((2, 3)))
+        ps.append_data(c1, np.ones((3, 3)))
+        ps.set_chunks([c1, c2])
+        pos = ps.load_positions()
+        self.assertEqual((3, 3), pos.shape, "Unexpected shape of loaded chunks")
+        self.assertTrue(np.all(pos == 1), "Loaded data of unloaded chunk")
+        self.assertEqual(2, len(ps.get_all_chunks()), "Read created missing chunk")
+        ps.clear_chunks()
+        pos = ps.load_positions()
+        self.assertEqual((5, 3), pos.shape, "Unexpected shape of all chunks")
+
+    @skip_parallel
+    @timeout(3)
+    def test_packed(self):
+        # Test that compacted placement data is read transparently, per chunk, and can
+        # still be appended to and cleared.
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        c0, c1 = Chunk((0, 0, 0), cs), Chunk((0, 0, 1), cs)
+        ps.append_data(c0, np.zeros((2, 3)))
+        ps.append_data(c1, np.ones((3, 3)))
+        ps.compact()
+        with network.storage._engine._read():
+            with network.storage._engine._handle("r") as f:
+                self.assertIn(ps.get_packed_path("position"), f, "Missing packed data")
+                self.assertNotIn(
+                    ps.get_chunk_path(c0) + "/position", f, "Chunk data not packed"
+                )
+        self.assertEqual(5, len(ps.load_positions()), "Packed data not read")
+        with ps.chunk_context(c1):
+            self.assertTrue(np.all(ps.load_positions() == 1), "Wrong packed chunk")
+        ps.append_data(c0, np.full((1, 3), 2))
+        with ps.chunk_context(c0):
+            pos = ps.load_positions()
+        self.assertEqual([0, 0, 2], pos[:, 0].tolist(), "Appended data not read")
+        ps.compact()
+        ps.clear([c1])
+        self.assertEqual(3, len(ps.load_positions()), "Packed chunk not cleared")
+
+    def test_chunk_list(self):
+        coords = [[0, 0, 0], [1, -1, 2], [-5, 3, 200]]
+        cl = ChunkList(coords, (10, 10, 10))
+        ids = cl.ids()
+        self.assertEqual(
+            [Chunk(c, (10, 10, 10)).id for c in coords], ids.tolist(), "Wrong ids"
+        )
+        self.assertEqual(coords, ChunkList.from_ids(ids, (10, 10, 10)).tolist())
+        self.assertIsInstance(cl[1], Chunk, "Indexing should produce a Chunk")
+        self.assertEqual([Chunk, Chunk, Chunk], [type(c) for c in cl])
+        self.assertIn(Chunk((1, -1, 2), (10, 10, 10)), cl)
+        self.assertNotIn(Chunk((1, 1, 2), (10, 10, 10)), cl)
+        self.assertEqual([[10, -10, 20, 20, 0, 30]], cl[1:2].boxes.tolist())
+        other = ChunkList([[-5, 3, 200], [4, 4, 4], [0, 0, 0]], (10, 10, 10))
+        self.assertEqual([[0, 0, 0], [-5, 3, 200]], cl.intersect(other).tolist())
+        union = ChunkList.union(cl, other)
+        self.assertEqual(4, len(union), "Union not unique")
+        self.assertEqual(sorted(union.ids()), union.ids().tolist(), "Union not sorted")
+        self.assertFalse(ChunkList([], None), "Empty chunk list should be falsy")
+        with self.assertRaises(ChunkError):
+            ChunkList([[0, 0, 40000]], (10, 10, 10))
+
+    @skip_parallel
+    @timeout(3)
+    def test_query(self):
+        # Test that region queries return the ids of the cells inside of the region, as
+        # indices into the loaded positions.
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        rng = np.random.default_rng(42)
+        for x, y in ((0, 0), (1, 0), (0, 1)):
+            c = Chunk((x, y, 0), cs)
+            ps.append_data(c, c.ldc + rng.random((50, 3)) * cs)
+        pos = ps.load_positions()
+        ldc, mdc = np.array([50, 0, 0]), np.array([200, 120, 150])
+        inside = np.all((pos >= ldc) & (pos <= mdc), axis=1)
+        ids = ps.query_region(ldc, mdc)
+        self.assertEqual(np.nonzero(inside)[0].tolist(), ids.tolist(), "Wrong box")
+        center = np.array([150, 150, 75])
+        inside = np.sum((pos - center) ** 2, axis=1) <= 100 ** 2
+        ids = ps.query_sphere(center, 100)
+        self.assertEqual(np.nonzero(inside)[0].tolist(), ids.tolist(), "Wrong sphere")
+        # A box containing all the chunks should return all ids, without reading them.
+        all_ids = ps.query_region([0, 0, 0], [2 * cs[0], 2 * cs[1], cs[2]])
+        self.assertEqual(list(range(150)), all_ids.tolist(), "Wrong contained chunks")
+        self.assertEqual(0, len(ps.query_sphere([-500, -500, -500], 10)))
+
+    @skip_parallel
+    @timeout(3)
+    def test_query_outside_chunk(self):
+        # Cells aren't bound to lie inside of their chunk, e.g. fixed positions are
+        # appended to every chunk, so the queries can't rely on the chunk bounds.
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        c0, c1 = Chunk((0, 0, 0), cs), Chunk((1, 0, 0), cs)
+        ps.append_data(c0, [[10, 10, 10], [-400, -400, -400], [cs[0] + 10, 10, 10]])
+        ps.append_data(c1, [[cs[0] + 20, 10, 10]])
+        self.assertEqual([1], ps.query_sphere([-400, -400, -400], 5).tolist())
+        ids = ps.query_region([cs[0], 0, 0], 2 * np.array(cs))
+        self.assertEqual([2, 3], ids.tolist(), "missed cells outside of their chunk")
+        # Chunk 0 is inside of the box, but one of its cells isn't.
+        ids = ps.query_region([0, 0, 0], cs)
+        self.assertEqual([0], ids.tolist(), "returned cells outside of the box")
+        ps.clear([c0])
+        self.assertFalse(ps._load_position_bounds([c0])[2][0], "bounds not cleared")
+        ids = ps.query_region([cs[0], 0, 0], 2 * np.array(cs))
+        self.assertEqual([0], ids.tolist(), "wrong ids after clear")
+
+    @skip_parallel
+    @timeout(3)
+    def test_load_boxes(self):
+        # Test that the boxes of the cells are the outer boxes of their rotated and
+        # translated morphology boxes.
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        v = len(Branch.vectors)
+        for i in range(2):
+            branch = Branch(*(np.arange(i, i + 10.0) * (k + 1) for k in range(v)))
+            network.morphologies.save(f"box{i}", Morphology([branch]), overwrite=True)
+        loaders = [network.morphologies.preload(f"box{i}") for i in range(2)]
+        rng = np.random.default_rng(42)
+        indices = rng.integers(2, size=50)
+        angles = rng.random((50, 3)) * 2 * np.pi
+        pos = rng.random((50, 3)) * cs
+        ps.append_data(Chunk((0, 0, 0), cs), pos, MorphologySet(loaders, indices), angles)
+        boxes = ps.load_boxes()
+        self.assertEqual((50, 6), boxes.shape, "Expected a box per cell")
+        blocks = [*ps.load_boxes(itr=True, block_size=20)]
+        self.assertEqual(3, len(blocks), "Expected 3 blocks of max 20 boxes")
+        self.assertTrue(np.allclose(boxes, np.concatenate(blocks)), "Blocks differ")
+        for box, i, angle, p in zip(boxes, indices, angles, pos):
+            meta = loaders[i].get_meta()
+            corners = np.array([*itertools.product(*zip(meta["ldc"], meta["mdc"]))])
+            rotated = Rotation.from_euler("xyz", angle).apply(corners)
+            expected = np.concatenate((rotated.min(axis=0) + p, rotated.max(axis=0) + p))
+            self.assertTrue(np.allclose(expected, box), "Incorrect box")
+
+    @skip_parallel
+    @timeout(3)
+    def test_append_morphologies(self):
+        # Test that morphology appends add to a deduplicated name table of the set, and
+        # append remapped indices without rewriting existing chunk data.
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        v = len(Branch.vectors)
+        for name in ("a", "b", "c"):
+            branch = Branch(*(np.arange(10.0) for k in range(v)))
+            network.morphologies.save(name, Morphology([branch]), overwrite=True)
+        ld = {name: network.morphologies.preload(name) for name in ("a", "b", "c")}
+        c0, c1 = Chunk((0, 0, 0), cs), Chunk((1, 0, 0), cs)
+        pos = np.zeros((3, 3))
+        ps.append_data(c0, pos, MorphologySet([ld["a"], ld["b"]], [1, 0, 1]))
+        ps.append_data(c1, pos, MorphologySet([ld["c"], ld["b"]], [0, 1, 0]))
+        ps.append_data(c0, pos, MorphologySet([ld["b"], ld["a"], ld["b"]], [2, 1, 0]))
+        path = "/placement/test_cell"
+        with h5py.File(network.storage.root, "r") as f:
+            table = list(f[f"{path}/morphology_names"].asstr()[()])
+            self.assertEqual(["a", "b", "c"], table, "Name table should be deduplicated")
+            stored = f[f"{path}/chunks/{c0.id}/morphology"][()]
+            self.assertEqual([1, 0, 1, 1, 0, 1], stored.tolist(), "Indices not remapped")
+        ps.set_chunks([c0, c1])
+        names = _morphology_names(ps.load_morphologies())
+        expected = ["b", "a", "b", "c", "b", "c", "b", "a", "b"]
+        self.assertEqual(sorted(expected), sorted(names), "Wrong morphologies")
+        ps.set_chunks([c1])
+        names = _morphology_names(ps.load_morphologies())
+        self.assertEqual(["c", "b", "c"], names, "Wrong chunk morphologies")
+
+    @skip_parallel
+    @timeout(3)
+    def test_legacy_morphology_maps(self):
+        # Test that sets with a map of morphology names per chunk are read and migrated.
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        v = len(Branch.vectors)
+        for name in ("a", "b"):
+            branch = Branch(*(np.arange(10.0) for k in range(v)))
+            network.morphologies.save(name, Morphology([branch]), overwrite=True)
+        c0, c1 = Chunk((0, 0, 0), cs), Chunk((1, 0, 0), cs)
+        ps.append_data(c0, np.zeros((2, 3)), MorphologySet([], []))
+        path = "/placement/test_cell"
+        with h5py.File(network.storage.root, "a") as f:
+            del f[f"{path}/morphology_names"]
+            for chunk, map, data in ((c0, ["a", "b"], [1, 0]), (c1, ["b"], [0, 0])):
+                group = f.require_group(f"{path}/chunks/{chunk.id}")
+                group.attrs["morphology_loaders"] = map
+                if "morphology" in group:
+                    del group["morphology"]
+                group.create_dataset("morphology", data=data, maxshape=(None,))
+        names = _morphology_names(ps.load_morphologies())
+        self.assertEqual(["b", "a", "b", "b"], names, "Legacy maps misread")
+        loader = network.morphologies.preload("a")
+        ps.append_data(c1, np.zeros((1, 3)), MorphologySet([loader], [0]))
+        ps.clear_chunks()
+        names = _morphology_names(ps.load_morphologies())
+        self.assertEqual(["b", "a", "b", "b", "a"], names, "Legacy maps not migrated")
+
+
+def _morphology_names(ms):
+    names = ms._serialize_loaders()
+    return [names[i] for i in ms.get_indices()]
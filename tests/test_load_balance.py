@@ -0,0 +1,146 @@
+import unittest, os, sys, numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+from types import SimpleNamespace
+from bsb.core import Scaffold
+from bsb.config import from_json
+from bsb.storage import Chunk
+from bsb.morphologies import Morphology, MorphologySet, Branch
+from bsb.simulators.neuron.adapter import NeuronSimulation, lpt_partition
+from bsb.exceptions import *
+from test_setup import get_config, skip_parallel, timeout
+
+
+class _Balancer:
+    # Just the parts of the NEURON adapter needed to estimate the cell costs and balance
+    # the load.
+    estimate_cell_costs = NeuronSimulation.estimate_cell_costs
+    load_balance = NeuronSimulation.load_balance
+    _iter_cell_chunks = NeuronSimulation._iter_cell_chunks
+
+    def __init__(self, scaffold, cell_models, connection_models, rank=0, size=1):
+        self.scaffold = scaffold
+        self.cell_models = cell_models
+        self.connection_models = connection_models
+        self._rank = rank
+        self._size = size
+
+    def get_rank(self):
+        return self._rank
+
+    def get_size(self):
+        return self._size
+
+
+class TestLPTPartition(unittest.TestCase):
+    def test_partition(self):
+        costs = [100, 1, 1, 1, 1, 50, 50, 1, 1]
+        bins, loads = lpt_partition(costs, 3)
+        self.assertEqual(sum(costs), sum(loads), "Costs lost")
+        self.assertEqual([100, 53, 53], sorted(loads, reverse=True), "Not balanced")
+        self.assertEqual(1, np.sum(bins == bins[0]), "Most expensive item not alone")
+
+    def test_groups(self):
+        costs = np.ones(12)
+        groups = np.repeat([0, 1, 2, 3], 3)
+        bins, loads = lpt_partition(costs, 2, groups=groups)
+        for g in range(4):
+            self.assertEqual(1, len(set(bins[groups == g])), "Group split up")
+        self.assertEqual([6, 6], loads.tolist(), "Not balanced")
+        # A group that costs more than the mean per bin is split up
+        bins, loads = lpt_partition(costs, 2, groups=np.zeros(12))
+        self.assertEqual([6, 6], loads.tolist(), "Expensive group not split up")
+
+    def test_empty(self):
+        bins, loads = lpt_partition([], 4)
+        self.assertEqual(0, len(bins), "Empty partition not empty")
+        self.assertEqual([0, 0, 0, 0], loads.tolist(), "Expected a cost per bin")
+
+
+class TestCellCosts(unittest.TestCase):
+    @skip_parallel
+    @timeout(10)
+    def test_estimate(self):
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        c0, c1 = Chunk((0, 0, 0), cs), Chunk((1, 0, 0), cs)
+        v = len(Branch.vectors)
+        for i, n in enumerate((10, 100)):
+            branch = Branch(*(np.arange(float(n)) for _ in range(v)))
+            network.morphologies.save(f"m{i}", Morphology([branch]), overwrite=True)
+        loaders = [network.morphologies.preload(f"m{i}") for i in range(2)]
+        ps.append_data(c0, np.zeros((2, 3)), MorphologySet(loaders, [0, 1]))
+        ps.append_data(c1, np.zeros((1, 3)), MorphologySet(loaders, [1]))
+        ct = network.cell_types.test_cell
+        conns = network.storage.require_connectivity_set(ct, ct, "test_conns")
+        locs = np.zeros((3, 3), dtype=int)
+        conns.append_data(c0, c1, locs, locs)
+        model = type("model", (), {"section_types": {"soma": {"mechanisms": ["a", "b"]}}})
+        balancer = _Balancer(
+            network,
+            {"test_cell": SimpleNamespace(name="test_cell", model=model)},
+            {"test_conns": SimpleNamespace(name="test_conns")},
+        )
+        costs, chunks = balancer.estimate_cell_costs()
+        self.assertEqual([c0.id, c0.id, c1.id], sorted(chunks.tolist()), "Wrong chunks")
+        self.assertEqual([30, 300], costs[chunks == c0.id].tolist(), "Wrong costs")
+        self.assertEqual([303], costs[chunks == c1.id].tolist(), "Synapses not counted")
+
+    @skip_parallel
+    @timeout(10)
+    def test_unmatched_morphologies(self):
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        c0 = Chunk((0, 0, 0), network.network.chunk_size)
+        v = len(Branch.vectors)
+        branch = Branch(*(np.arange(10.0) for _ in range(v)))
+        network.morphologies.save("m0", Morphology([branch]), overwrite=True)
+        loaders = [network.morphologies.preload("m0")]
+        ps.append_data(c0, np.zeros((2, 3)), MorphologySet(loaders, [0, 0]))
+        ps.append_data(c0, np.zeros((1, 3)))
+        balancer = _Balancer(
+            network, {"test_cell": SimpleNamespace(name="test_cell", model=None)}, {}
+        )
+        with self.assertWarns(SimulationWarning):
+            costs, _ = balancer.estimate_cell_costs()
+        self.assertEqual([1, 1, 1], costs.tolist(), "Expected the fallback cost")
+
+
+class TestLoadBalance(unittest.TestCase):
+    @skip_parallel
+    @timeout(10)
+    def test_cell_ids(self):
+        cfg = from_json(get_config("test_single"))
+        network = Scaffold(cfg, clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        c0, c1 = Chunk((0, 0, 0), cs), Chunk((1, 0, 0), cs)
+        v = len(Branch.vectors)
+        for i, n in enumerate((10, 100)):
+            branch = Branch(*(np.arange(float(n)) for _ in range(v)))
+            network.morphologies.save(f"m{i}", Morphology([branch]), overwrite=True)
+        loaders = [network.morphologies.preload(f"m{i}") for i in range(2)]
+        # Cells at x=0 and x=2 have 10 points, the cell at x=1 has 100 points.
+        ps.append_data(c1, np.array([[1, 0, 0]]), MorphologySet(loaders, [1]))
+        positions = np.array([[0, 0, 0], [2, 0, 0]])
+        ps.append_data(c0, positions, MorphologySet(loaders, [0, 0]))
+        cell_models = {"test_cell": SimpleNamespace(name="test_cell", model=None)}
+        nodes = []
+        for rank in range(2):
+            balancer = _Balancer(network, cell_models, {}, rank=rank, size=2)
+            balancer.load_balance()
+            costs = balancer.estimate_cell_costs()[0]
+            cost = sum(costs[id] for id in balancer.node_cells)
+            self.assertEqual(balancer.rank_costs[rank], cost, "Ids don't match costs")
+            nodes.append(balancer.node_cells)
+        self.assertEqual({0, 1, 2}, nodes[0] | nodes[1], "Cells lost")
+        self.assertEqual(set(), nodes[0] & nodes[1], "Cells on multiple ranks")
+        # The cells are created from the positions read with the same ids.
+        expected = {0: 10, 1: 100, 2: 10}
+        for _, ps, _, ids in balancer._iter_cell_chunks():
+            for id, position in zip(ids, ps.load_positions()):
+                self.assertEqual(expected[position[0]], costs[id], "Wrong cell ids")
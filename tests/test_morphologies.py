@@ -2,9 +2,11 @@ import unittest, os, sys, numpy as np, h5py
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
-from bsb.morphologies import Morphology, Branch
+from bsb.morphologies import Morphology, Branch, RotationSet, TransformedMorphology
 from bsb.storage.engines.hdf5 import morphology_repository as _mr_module
 from bsb.exceptions import *
+from scipy.spatial.transform import Rotation
+from test_setup import skip_parallel
 
 
 @unittest.skip("Re-enabling tests gradually while advancing v4.0 rework")
@@ -231,6 +233,264 @@ class TestRepositories(unittest.TestCase):
         )
 
 
+@skip_parallel
+class TestFlatRepository(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from bsb.storage import Storage
+
+        cls.storage = Storage("hdf5", "test_flat_repository.hdf5")
+        cls.mr = cls.storage.morphologies
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.storage.remove()
+
+    def test_roundtrip(self):
+        v = len(Branch.vectors)
+        root = Branch(*(np.arange(3.0) for i in range(v)))
+        child = Branch(*(np.arange(3.0, 5.0) for i in range(v)))
+        empty = Branch(*(np.empty(0) for i in range(v)))
+        root.label_all("B")
+        root.label_points("A", [False, True, False])
+        child.label_points("C", [True, False])
+        empty.label_all("D")
+        root.attach_child(child)
+        root.attach_child(empty)
+        self.mr.save("flat", Morphology([root]), overwrite=True)
+        m = self.mr.load("flat")
+        self.assertEqual(1, len(m.roots), "Wrong number of roots")
+        lroot = m.roots[0]
+        self.assertEqual(2, len(lroot.children), "Wrong number of children")
+        lchild, lempty = lroot.children
+        self.assertEqual([0, 1, 2], lroot.x.tolist(), "Wrong points")
+        self.assertEqual([3, 4], lchild.radii.tolist(), "Wrong points")
+        self.assertEqual(0, len(lempty), "Empty branch not empty")
+        self.assertEqual(["B"], lroot._full_labels)
+        self.assertEqual(["D"], lempty._full_labels)
+        self.assertEqual(
+            [["B"], ["B", "A"], ["B"]], list(map(list, lroot.label_walk()))
+        )
+        self.assertEqual([["C"], []], list(map(list, lchild.label_walk())))
+        self.assertIs(lroot.x.base, lchild.y.base, "Branches not views")
+        self.assertEqual([0, 0, 0], m.meta["ldc"].tolist(), "Wrong meta")
+
+    def test_old_format(self):
+        with self.storage._engine._write():
+            with self.storage._engine._handle("a") as f:
+                g = f.require_group("morphologies").create_group("old")
+                b = g.create_group("branches")
+                for i in range(2):
+                    b0 = b.create_group(str(i))
+                    for vec in Branch.vectors:
+                        b0.create_dataset(vec, data=[i, i])
+                    b0.create_group("labels").create_dataset("A", data=[True, False])
+                b["1"].attrs["parent"] = 0
+        m = self.mr.load("old")
+        self.assertEqual(1, len(m.roots), "Old format branches not attached")
+        expected = [[0] * 4, [0] * 4, [1] * 4, [1] * 4]
+        self.assertEqual(expected, m.flatten(matrix=True).tolist())
+        self.assertEqual([["A"], []], list(map(list, m.roots[0].label_walk())))
+
+
+@skip_parallel
+class TestMorphologyIndex(unittest.TestCase):
+    _file = "test_morphology_index.hdf5"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from bsb.storage import Storage
+
+        # Clean up even if the class setup fails halfway.
+        cls.addClassCleanup(cls._remove_file)
+        cls._remove_file()
+        cls.storage = Storage("hdf5", cls._file)
+        cls.mr = cls.storage.morphologies
+        v = len(Branch.vectors)
+        root = Branch(*(np.arange(3.0) for i in range(v)))
+        root.label_all("soma")
+        root.attach_child(Branch(*(np.arange(3.0, 5.0) for i in range(v))))
+        cls.mr.save("A", Morphology([root]), overwrite=True)
+        cls.mr.save("B", Morphology([Branch(*(np.ones(1) for i in range(v)))]))
+
+    @classmethod
+    def _remove_file(cls):
+        if os.path.exists(cls._file):
+            os.remove(cls._file)
+
+    def _single(self):
+        v = len(Branch.vectors)
+        return Morphology([Branch(*(np.ones(1) for i in range(v)))])
+
+    def test_meta(self):
+        meta = self.mr.get_meta("A")
+        self.assertEqual("A", meta["name"])
+        self.assertEqual([0, 0, 0], meta["ldc"].tolist(), "Wrong ldc")
+        self.assertEqual([4, 4, 4], meta["mdc"].tolist(), "Wrong mdc")
+        self.assertEqual(2, meta["branches"], "Wrong branch count")
+        self.assertEqual(5, meta["points"], "Wrong point count")
+        self.assertEqual(["soma"], meta["labels"], "Wrong labels")
+        with self.assertRaises(MissingMorphologyError):
+            self.mr.get_meta("doesntexist")
+
+    def test_cached(self):
+        # Test that the index is read from file only once.
+        self.storage._engine._morphology_index = None
+        read, reads = _mr_module._MorphologyIndex.read, []
+        _mr_module._MorphologyIndex.read = lambda group: reads.append(1) or read(group)
+        try:
+            for i in range(3):
+                self.assertEqual(["A", "B"], sorted(m.name for m in self.mr.all()))
+                self.assertEqual(["A", "B"], sorted(self.mr.keys()))
+                self.mr.get_meta("A")
+                self.assertTrue(self.mr.has("B"))
+        finally:
+            _mr_module._MorphologyIndex.read = read
+        self.assertEqual(1, len(reads), "Index not cached")
+
+    def test_stale(self):
+        # Test that changes made by another engine invalidate the cached index.
+        from bsb.storage import Storage
+
+        other = Storage("hdf5", self._file).morphologies
+        self.assertEqual(["A", "B"], sorted(other.keys()))
+        self.mr.save("C", self._single())
+        try:
+            self.assertEqual(["A", "B", "C"], sorted(other.keys()), "Stale index")
+        finally:
+            self.mr.remove("C")
+        self.assertEqual(["A", "B"], sorted(other.keys()), "Stale index")
+
+    def test_persisted(self):
+        from bsb.storage import Storage
+
+        self.mr.save("C", self._single())
+        fresh = Storage("hdf5", self._file).morphologies
+        self.assertEqual(["A", "B", "C"], sorted(fresh.keys()), "Save not indexed")
+        self.mr.remove("C")
+        self.assertEqual(["A", "B"], sorted(self.mr.keys()), "Remove not indexed")
+        fresh = Storage("hdf5", self._file).morphologies
+        self.assertEqual(["A", "B"], sorted(fresh.keys()), "Remove not persisted")
+        with self.assertRaises(MorphologyRepositoryError):
+            self.mr.save("_index", Morphology([]))
+
+    def test_in_place(self):
+        # Test that overwrites reuse their row of the index, instead of growing it.
+        with h5py.File(self._file, "r") as f:
+            rows = len(f["morphologies/_index"])
+        for i in range(3):
+            self.mr.save("B", self._single(), overwrite=True)
+        self.mr.save("D", self._single())
+        self.mr.remove("D")
+        with h5py.File(self._file, "r") as f:
+            index = f["morphologies/_index"][()]
+        self.assertEqual(rows + 1, len(index), "Index rows not reused")
+        self.assertEqual([False] * rows + [True], index["removed"].tolist())
+        self.assertEqual(["A", "B"], sorted(self.mr.keys()), "Wrong morphologies")
+
+    def test_unindexed(self):
+        # Test that repositories without an index are indexed once, without loading the
+        # point data of the morphologies.
+        from bsb.storage import Storage
+
+        with h5py.File(self._file, "a") as f:
+            del f["morphologies/_index"]
+        morphology = _mr_module._morphology
+        _mr_module._morphology = None
+        try:
+            fresh = Storage("hdf5", self._file).morphologies
+            self.assertEqual(["A", "B"], sorted(fresh.keys()), "Not indexed")
+            meta = fresh.get_meta("A")
+        finally:
+            _mr_module._morphology = morphology
+        self.assertEqual(self.mr.get_meta("A")["ldc"].tolist(), meta["ldc"].tolist())
+        self.assertEqual(5, meta["points"], "Wrong point count")
+        self.assertEqual(2, meta["branches"], "Wrong branch count")
+        self.assertEqual(["soma"], meta["labels"], "Wrong labels")
+        with h5py.File(self._file, "r") as f:
+            self.assertIn("morphologies/_index", f, "Index not written")
+
+
+@skip_parallel
+class TestMorphologyCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from bsb.storage import Storage
+
+        cls.storage = Storage("hdf5", "test_morphology_cache.hdf5")
+        v = len(Branch.vectors)
+        root = Branch(*(np.arange(3.0) for i in range(v)))
+        root.attach_child(Branch(*(np.arange(3.0, 5.0) for i in range(v))))
+        cls.storage.morphologies.save("cached", Morphology([root]), overwrite=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.storage.remove()
+
+    def test_cached_load(self):
+        cache = self.storage.morphology_cache
+        cache.clear()
+        loader = self.storage.morphologies.preload("cached")
+        hits, misses = cache.hits, cache.misses
+        m1 = loader.cached_load()
+        m2 = loader.cached_load()
+        self.assertEqual((hits + 1, misses + 1), (cache.hits, cache.misses))
+        self.assertIsNot(m1, m2, "Cache handed out the same object")
+        self.assertIsNot(m1.branches[0], m2.branches[0], "Branches shared")
+        self.assertIs(m1.branches[0].x, m2.branches[0].x, "Point data copied")
+        m1.translate([1, 0, 0])
+        m1.roots[0].label_all("A")
+        self.assertEqual([1, 2, 3], m1.roots[0].x.tolist(), "Copy not translated")
+        m3 = loader.cached_load()
+        self.assertEqual([0, 1, 2], m3.roots[0].x.tolist(), "Cache modified")
+        self.assertEqual([], m3.roots[0]._full_labels, "Cache labels modified")
+        with self.assertRaises(ValueError):
+            m3.roots[0].x[0] = 10
+        self.storage.morphologies.save("cached", m1, overwrite=True)
+        self.assertEqual(0, len(cache), "Cache not invalidated by save")
+        self.assertEqual([1, 2, 3], loader.cached_load().roots[0].x.tolist())
+
+    def test_budget(self):
+        from bsb.storage import MorphologyCache
+
+        loader = self.storage.morphologies.preload("cached")
+        size = sum(b.points.nbytes for b in loader.load().branches)
+        cache = MorphologyCache(2 * size)
+        for name in ("a", "b", "a", "c"):
+            cache.get(name, loader.load)
+        self.assertEqual(2, len(cache), "Cache not within budget")
+        self.assertEqual(2 * size, cache.size, "Wrong cache size")
+        cache.get("a", loader.load)
+        cache.get("b", loader.load)
+        self.assertEqual((2, 4), (cache.hits, cache.misses), "Least recent not evicted")
+        cache = MorphologyCache(0)
+        m = cache.get("a", loader.load)
+        self.assertEqual(0, len(cache), "Morphology over budget cached")
+        m.roots[0].x[0] = 10
+
+    def test_stale(self):
+        # Test that a morphology overwritten through another engine isn't served from
+        # the cache.
+        from bsb.storage import Storage
+
+        v = len(Branch.vectors)
+        root = lambda n: Branch(*(np.arange(float(n)) for i in range(v)))
+        self.storage.morphologies.save("stale", Morphology([root(3)]), overwrite=True)
+        loader = self.storage.morphologies.preload("stale")
+        self.assertEqual(3, len(loader.cached_load().roots[0]))
+        other = Storage("hdf5", self.storage.root).morphologies
+        other.save("stale", Morphology([root(5)]), overwrite=True)
+        self.assertEqual(5, len(loader.cached_load().roots[0]), "Stale morphology")
+        hits = self.storage.morphology_cache.hits
+        loader.cached_load()
+        self.assertEqual(hits + 1, self.storage.morphology_cache.hits, "Not cached")
+
+
 class TestMorphologies(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -330,3 +590,101 @@ class TestMorphologyLabels(unittest.TestCase):
         self.assertEqual(
             [["B"], ["B", "A"]] + [["B"]] * (v - 2), list(map(list, branch.label_walk()))
         )
+
+
+class TestRotationSet(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.angles = rng.random((20, 3)) * 2 * np.pi
+        self.rotations = RotationSet(self.angles)
+
+    def test_as_matrices(self):
+        matrices = self.rotations.as_matrices()
+        self.assertEqual((20, 3, 3), matrices.shape, "Expected a matrix per rotation")
+        for rot, matrix in zip(self.rotations, matrices):
+            self.assertTrue(np.allclose(rot.as_matrix(), matrix), "Wrong matrix")
+        self.assertTrue(np.allclose(matrices[3:5], self.rotations.as_matrices([3, 4])))
+        self.assertEqual((0, 3, 3), RotationSet(np.empty((0, 3))).as_matrices().shape)
+
+    def test_apply_to(self):
+        rng = np.random.default_rng(1)
+        points = rng.random((500, 3))
+        index = rng.integers(20, size=500)
+        rotated = self.rotations.apply_to(points, index, block_size=64)
+        expected = [self.rotations[i].apply(p) for p, i in zip(points, index)]
+        self.assertTrue(np.allclose(expected, rotated), "Wrong rotated points")
+        rotated = self.rotations.apply_to(points, 7)
+        self.assertTrue(np.allclose(self.rotations[7].apply(points), rotated))
+
+    def test_iter(self):
+        for cache in (False, True):
+            rotations = [*self.rotations.iter(cache=cache)]
+            self.assertEqual(20, len(rotations), "Wrong amount of rotations")
+            for rot, matrix in zip(rotations, self.rotations.as_matrices()):
+                self.assertTrue(np.allclose(rot.as_matrix(), matrix), "Wrong rotation")
+
+
+class TestTransformedMorphology(unittest.TestCase):
+    def setUp(self):
+        v = len(Branch.vectors)
+        rng = np.random.default_rng(0)
+        root = Branch(*(rng.random(8) * 10 for _ in range(v)))
+        root.attach_child(Branch(*(rng.random(5) * 10 for _ in range(v))))
+        self.morpho = Morphology([root], meta={"ldc": [0, 0, 0], "mdc": [1, 1, 1]})
+        self.rot = Rotation.from_euler("xyz", [0.3, 1.2, -0.5])
+
+    def _transformed(self):
+        view = TransformedMorphology(self.morpho)
+        view.rotate(self.rot)
+        view.translate([5, -3, 2])
+        view.rotate(self.rot.inv().as_matrix(), center=[1, 1, 1])
+        return view
+
+    def _expected(self):
+        m = self.morpho.copy()
+        m.rotate(self.rot)
+        m.translate([5, -3, 2])
+        m.rotate(self.rot.inv(), center=np.array([1, 1, 1]))
+        return m
+
+    def test_flatten(self):
+        original = self.morpho.flatten(matrix=True)
+        view = self._transformed()
+        expected = self._expected()
+        self.assertTrue(
+            np.allclose(expected.flatten(matrix=True), view.flatten(matrix=True)),
+            "Transformed points differ",
+        )
+        zx = view.flatten(vectors=["z", "x"], matrix=True)
+        expected_zx = expected.flatten(vectors=["z", "x"], matrix=True)
+        self.assertTrue(np.allclose(expected_zx, zx), "Transformed vectors differ")
+        self.assertTrue(np.allclose(original, self.morpho.flatten(matrix=True)))
+        self.assertTrue(np.allclose(expected.bounds, view.bounds), "Wrong bounds")
+        self.assertNotIn("ldc", view.meta, "Source bounds are invalid after transform")
+
+    def test_copy(self):
+        view = self._transformed()
+        copy = view.copy().translate([1, 0, 0])
+        diff = copy.flatten(matrix=True) - view.flatten(matrix=True)
+        self.assertTrue(np.allclose([1, 0, 0], diff[:, :3]), "Copy not translated")
+        self.assertTrue(np.allclose(0, diff[:, 3:]), "Non spatial vectors changed")
+        self.assertIs(view._source, copy._source, "Copies should share source points")
+
+    def test_voxelize(self):
+        view = self._transformed()
+        expected = self._expected()
+        expected._meta = {}
+        vs, evs = view.voxelize(10), expected.voxelize(10)
+        self.assertTrue(np.allclose(evs.as_boxes(), vs.as_boxes()), "Different voxels")
+        self.assertEqual(
+            [evs.get_data(i).tolist() for i in range(len(evs))],
+            [vs.get_data(i).tolist() for i in range(len(vs))],
+            "Different voxel data",
+        )
+
+    def test_materialize(self):
+        m = self._transformed().materialize()
+        expected = self._expected()
+        points = m.flatten(matrix=True)
+        self.assertTrue(np.allclose(expected.flatten(matrix=True), points))
+        self.assertEqual(2, len(m.branches), "Branches lost")
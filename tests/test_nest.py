@@ -3,8 +3,12 @@ import unittest, os, sys, numpy as np, h5py, importlib
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
 from bsb.core import Scaffold
-from bsb.simulators.nest import NestCell
+from bsb.storage import Chunk
+from bsb.simulators.nest import NestCell, NestSimulation, IdentifierMap
+from bsb.simulators.nest import MapsScaffoldIdentifiers
+from bsb.config import from_json
 from bsb.exceptions import *
+from test_setup import get_config, skip_parallel, timeout
 
 
 def relative_to_tests_folder(path):
@@ -471,3 +475,154 @@ class TestDeviceProtocol(unittest.TestCase):
         self.assertEqual(1, len(adapter.result.recorders))
         adapter.simulate(simulator)
         adapter.collect_output()
+
+
+class TestIdentifierMap(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.scaffold_ids = rng.permutation(1000)[:500]
+        self.nest_ids = np.arange(1, 501)
+        self.map = IdentifierMap(self.scaffold_ids, self.nest_ids)
+
+    def test_map(self):
+        ids = self.scaffold_ids[[3, 7, 7, 0, 499]]
+        self.assertEqual([4, 8, 8, 1, 500], self.map.map(ids).tolist())
+        self.assertEqual(ids.tolist(), self.map.inverse([4, 8, 8, 1, 500]).tolist())
+        self.assertEqual(0, len(self.map.map([])), "Empty lookup should be empty")
+
+    def test_sparse(self):
+        sparse = IdentifierMap(self.scaffold_ids * 1000, self.nest_ids)
+        ids = self.scaffold_ids[[3, 7, 0]] * 1000
+        self.assertEqual([4, 8, 1], sparse.map(ids).tolist())
+        with self.assertRaises(KeyError) as cm:
+            sparse.map([ids[0] + 1])
+        self.assertEqual(ids[0] + 1, cm.exception.args[0], "Wrong missing id reported")
+
+    def test_missing(self):
+        missing = np.setdiff1d(np.arange(1001), self.scaffold_ids)[0]
+        with self.assertRaises(KeyError) as cm:
+            self.map.map([self.scaffold_ids[0], missing])
+        self.assertEqual(missing, cm.exception.args[0], "Wrong missing id reported")
+        with self.assertRaises(KeyError):
+            self.map.map([1001])
+        with self.assertRaises(KeyError):
+            self.map.inverse([0])
+        with self.assertRaises(KeyError):
+            IdentifierMap([], []).map([0])
+
+    def test_merge(self):
+        other = IdentifierMap([1000, 1001], [501, 502])
+        merged = IdentifierMap.merge([self.map, other])
+        self.assertEqual(502, len(merged), "Merged map misses identifiers")
+        ids = [1001, self.scaffold_ids[10]]
+        self.assertEqual([502, 11], merged.map(ids).tolist())
+
+
+class _BlockAdapter:
+    # Just the parts of the NEST adapter needed to create the cells and stream their
+    # connectivity blocks.
+    create_neurons = NestSimulation.create_neurons
+    _build_identifier_map = NestSimulation._build_identifier_map
+    _iter_connection_blocks = NestSimulation._iter_connection_blocks
+    _load_connections = NestSimulation._load_connections
+    _connection_id_map = NestSimulation._connection_id_map
+    _map_connection_ids = NestSimulation._map_connection_ids
+    get_nest_ids = NestSimulation.get_nest_ids
+
+    def __init__(self, scaffold, size, local=None):
+        self.connect_block_size = 4
+        self.scaffold = scaffold
+        self.cell_models = {"test_cell": _Model("test_cell")}
+        self.entities = {}
+        self.nest = _Nest()
+        self._size = size
+        self._local = local
+        self.create_neurons()
+        self._build_identifier_map()
+
+    def create_model(self, cell_model):
+        pass
+
+    def suffixed(self, name):
+        return name
+
+    def get_size(self):
+        return self._size
+
+    def _is_local(self, nest_ids):
+        return np.isin(nest_ids, self._local)
+
+
+class _Model(MapsScaffoldIdentifiers):
+    def __init__(self, name):
+        self.name = name
+        self.reset_identifiers()
+
+
+class _Nest:
+    # Creates nodes with consecutive ids, starting at 1, like NEST.
+    def __init__(self):
+        self._next = 1
+
+    def Create(self, model, n):
+        self._next += n
+        return tuple(range(self._next - n, self._next))
+
+
+@skip_parallel
+class TestConnectionBlocks(unittest.TestCase):
+    @timeout(10)
+    def setUp(self):
+        network = Scaffold(from_json(get_config("test_single")), clear=True)
+        ps = network.get_placement_set("test_cell")
+        cs = network.network.chunk_size
+        self.chunks = c0, c1 = Chunk((0, 0, 0), cs), Chunk((1, 0, 0), cs)
+        # Label the cells with their chunk and index in the chunk in x and y.
+        ps.append_data(c1, np.array([[1, i, 0] for i in range(4)]))
+        ps.append_data(c0, np.array([[0, i, 0] for i in range(6)]))
+        ct = network.cell_types.test_cell
+        self.cs = network.storage.require_connectivity_set(ct, ct, "test_conns")
+        # 6 connections from chunk 0 and 4 from chunk 1, to the cells of chunk 1.
+        self.cs.append_data(c0, c1, _locs(range(6)), _locs([3, 3, 3, 3, 0, 1]))
+        self.cs.append_data(c1, c1, _locs(range(4)), _locs([2, 3, 0, 0]))
+        self.network = network
+        # Position of each NEST node, the nodes are created in placement set order.
+        self.positions = ps.load_positions()
+
+    def _cells(self, nest_ids):
+        return [tuple(self.positions[id - 1][:2]) for id in nest_ids]
+
+    def test_blocks(self):
+        adapter = _BlockAdapter(self.network, 1)
+        self.assertEqual(10, len(adapter.global_identifier_map), "Cells not created")
+        blocks = [*adapter._iter_connection_blocks(self.cs, "test")]
+        self.assertEqual([4, 2, 4], [len(post) for _, post in blocks], "Wrong blocks")
+        pre, post = adapter._load_connections(self.cs, "test")
+        self.assertEqual(
+            [(0, i) for i in range(6)] + [(1, i) for i in range(4)],
+            self._cells(pre),
+            "Wrong presynaptic cells",
+        )
+        self.assertEqual(
+            [(1, i) for i in [3, 3, 3, 3, 0, 1, 2, 3, 0, 0]],
+            self._cells(post),
+            "Wrong postsynaptic cells",
+        )
+
+    def test_local_blocks(self):
+        local = [i + 1 for i, p in enumerate(self.positions) if p[0] == 1 and p[1] < 2]
+        adapter = _BlockAdapter(self.network, 2, local=local)
+        blocks = [*adapter._iter_connection_blocks(self.cs, "test")]
+        self.assertEqual(2, len(blocks), "Block without local targets not skipped")
+        self.assertEqual(
+            [[(0, 4), (0, 5)], [(1, 2), (1, 3)]], [self._cells(pre) for pre, _ in blocks]
+        )
+
+    def test_unknown(self):
+        self.cs.append_data(self.chunks[1], self.chunks[1], _locs([4]), _locs([0]))
+        with self.assertRaises(UnknownGIDError):
+            [*_BlockAdapter(self.network, 1)._iter_connection_blocks(self.cs, "test")]
+
+
+def _locs(idx):
+    return np.column_stack((idx, np.full(len(idx), -1), np.full(len(idx), -1)))
@@ -241,6 +241,27 @@ class TestOptions(unittest.TestCase):
         # Double reset shouldn't error
         del self.opt["verbosity"].script
 
+    def test_pool_option(self):
+        try:
+            options.pool = "Processes:2"
+            self.assertEqual("processes:2", options.pool, "pool not set")
+            for value in ("threads", "processes:", "processes:0", "processes:x"):
+                with self.subTest(value=value), self.assertRaises(OptionError):
+                    options.pool = value
+            self.assertEqual("processes:2", options.pool, "invalid pool was set")
+        finally:
+            del options.pool
+
+    def test_scheduler_option(self):
+        try:
+            options.scheduler = "Locality"
+            self.assertEqual("locality", options.scheduler, "scheduler not set")
+            with self.assertRaises(OptionError):
+                options.scheduler = "localty"
+            self.assertEqual("locality", options.scheduler, "invalid scheduler was set")
+        finally:
+            del options.scheduler
+
     def test_set_module_option(self):
         with self.assertRaises(OptionError):
             options.set_module_option("config", 3)
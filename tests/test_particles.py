@@ -0,0 +1,94 @@
+import unittest
+import numpy as np
+from scipy.spatial.distance import pdist
+from bsb.voxels import VoxelSet
+from bsb.particles import ParticleSystem, ArrayParticleSystem
+
+
+def _particle_types(voxels):
+    return [
+        {"name": "small", "voxels": list(range(len(voxels))), "radius": 2, "count": 300},
+        {"name": "large", "voxels": list(range(len(voxels))), "radius": 4, "count": 30},
+    ]
+
+
+def _min_gap(system):
+    pos = system.positions
+    radii = np.array(system.radii)
+    n = len(pos)
+    i, j = np.triu_indices(n, k=1)
+    return np.min(pdist(pos) - (radii[i] + radii[j]))
+
+
+class TestArrayParticleSystem(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(42)
+        self.voxels = VoxelSet([[0, 0, 0], [1, 0, 0]], 50)
+
+    def test_fill(self):
+        system = ArrayParticleSystem()
+        system.fill(self.voxels, _particle_types(self.voxels))
+        self.assertEqual(330, len(system), "incorrect amount of particles")
+        self.assertEqual((330, 3), system.positions.shape, "positions not a matrix")
+        self.assertTrue(np.all(system.positions >= 0), "particles outside of voxels")
+        self.assertTrue(np.all(system.positions < [100, 50, 50]), "outside of voxels")
+        large = system.get_positions(system.particle_types[1])
+        self.assertEqual(30, len(large), "incorrect amount of typed particles")
+
+    def test_solve_collisions(self):
+        system = ArrayParticleSystem(track_displaced=True)
+        system.fill(self.voxels, _particle_types(self.voxels))
+        self.assertLess(0, len(system.find_colliding_particles()), "expected collisions")
+        system.solve_collisions()
+        self.assertEqual(0, len(system.find_colliding_particles()), "collisions left")
+        self.assertGreaterEqual(_min_gap(system), 0, "overlapping particles")
+        self.assertLess(0, len(system.displaced_particles), "no displaced particles")
+
+    def test_equivalent_packing(self):
+        for cls in (ParticleSystem, ArrayParticleSystem):
+            with self.subTest(system=cls.__name__):
+                system = cls(track_displaced=True)
+                system.fill(self.voxels, _particle_types(self.voxels))
+                system.find_colliding_particles()
+                system.solve_collisions()
+                self.assertGreaterEqual(_min_gap(system), 0, "overlapping particles")
+
+    def test_prune(self):
+        for cls in (ParticleSystem, ArrayParticleSystem):
+            with self.subTest(system=cls.__name__):
+                system = cls()
+                system.fill(self.voxels, _particle_types(self.voxels))
+                positions = system.positions
+                positions[:10] = -10
+                if cls is ParticleSystem:
+                    for p, pos in zip(system.particles, positions):
+                        p.position = pos
+                masks = system.prune()
+                self.assertEqual(330, len(system), "prune shouldn't remove particles")
+                self.assertEqual(["small", "large"], list(masks), "expected mask per type")
+                self.assertEqual(10, np.sum(~masks["small"]), "particles not pruned")
+                self.assertTrue(np.all(masks["small"][10:]), "particles pruned")
+                self.assertTrue(np.all(masks["large"]), "particles pruned")
+
+    def test_prune_irregular(self):
+        # Irregular voxel sets fall back to an R-tree of the voxels
+        voxels = VoxelSet([[0, 0, 0], [50, 0, 0]], [[50, 50, 50], [50, 50, 50]])
+        system = ArrayParticleSystem()
+        system.fill(voxels, _particle_types(voxels))
+        system.positions[:10] = -10
+        masks = system.prune(at_risk_particles=np.arange(20))
+        self.assertEqual(10, np.sum(~masks["small"]), "particles not pruned")
+        self.assertTrue(np.all(masks["small"][10:]), "particles pruned")
+
+    def test_add_particles(self):
+        system = ArrayParticleSystem()
+        system.add_particles(1, [[0, 0, 0], [1, 1, 1]])
+        system.add_particle(1, [2, 2, 2])
+        self.assertEqual([None], system.particle_types, "untyped particles type repeated")
+        self.assertEqual((3, 3), system.positions.shape, "positions not a matrix")
+        system.fill(self.voxels, _particle_types(self.voxels))
+        self.assertEqual(4, system.max_radius, "wrong max radius")
+        system.add_particle(1, [2, 2, 2])
+        self.assertEqual(3, len(system.particle_types), "untyped particles type repeated")
+        self.assertEqual(["small", "large"], list(system.prune()), "untyped type pruned")
+        self.assertLess(0, system.get_packing_factor(), "no packing factor")
@@ -10,8 +10,10 @@ from bsb.topology import Region, Partition
 from bsb.exceptions import *
 from bsb.storage import Chunk
 from bsb.placement import PlacementStrategy
-from bsb._pool import JobPool, FakeFuture, create_job_pool
-from test_setup import timeout
+from bsb._pool import JobPool, FakeFuture, LocalityScheduler, create_job_pool
+import bsb.options
+from bsb.config import from_json
+from test_setup import timeout, get_config
 from time import sleep
 
 
@@ -208,10 +210,113 @@ class TestParallelScheduler(unittest.TestCase, SchedulerBaseTest):
             self.assertTrue(result, "A job with unfinished dependencies was scheduled.")
 
 
+@unittest.skipIf(MPI.COMM_WORLD.Get_size() < 2, "Skipped during serial testing.")
+class TestParallelLocalityScheduler(TestParallelScheduler):
+    def setUp(self):
+        bsb.options.scheduler = "locality"
+
+    def tearDown(self):
+        del bsb.options.scheduler
+
+
 @unittest.skipIf(MPI.COMM_WORLD.Get_size() > 1, "Skipped during parallel testing.")
 class TestSerialScheduler(unittest.TestCase, SchedulerBaseTest):
     pass
 
 
+@unittest.skipIf(MPI.COMM_WORLD.Get_size() > 1, "Skipped during parallel testing.")
+class TestProcessScheduler(unittest.TestCase):
+    # The worker processes load the network from storage, so we can't use the network
+    # of the other scheduler tests, it contains classes that can't be serialized.
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cfg = from_json(get_config("test_single"))
+        cfg.network.x = 450
+        cls.network = Scaffold(cfg, clear=True)
+
+    def setUp(self):
+        bsb.options.pool = "processes:2"
+
+    def tearDown(self):
+        del bsb.options.pool
+
+    @timeout(10)
+    def test_listeners(self):
+        i = 0
+
+        def spy(job):
+            nonlocal i
+            i += 1
+
+        pool = JobPool(self.network, listeners=[spy])
+        job = pool.queue(test_dud, (5, 0.1))
+        pool.execute()
+        self.assertEqual(1, i, "Listeners not executed.")
+
+    @timeout(10)
+    def test_dependencies(self):
+        pool = JobPool(self.network)
+        job = pool.queue(test_dud, (5, 0.1))
+        job2 = pool.queue(test_dud, (5, 0.1), deps=[job])
+        result = None
+
+        def spy_queue(jobs):
+            nonlocal result
+            if result is None:
+                result = jobs[0]._future.running() and not jobs[1]._future.running()
+
+        pool.execute(master_event_loop=spy_queue)
+        self.assertTrue(result, "A job with unfinished dependencies was scheduled.")
+        self.assertTrue(job2._future.done(), "Dependent job not executed.")
+
+    @timeout(10)
+    def test_placement_jobs(self):
+        network = self.network
+        strategy = network.placement.test_placement
+        pool = JobPool(network)
+        for x in range(3):
+            pool.queue_placement(strategy, Chunk((x, 0, 0), network.network.chunk_size))
+        pool.execute()
+        ps = network.get_placement_set("test_cell")
+        self.assertEqual(3, len(ps.get_all_chunks()), "Placement not stored by workers")
+        self.assertGreater(len(ps.load_positions()), 0, "No positions placed")
+
+
+class _PoolDummy:
+    _workers = {1, 2}
+
+
+class TestLocalityScheduler(unittest.TestCase):
+    def test_locality(self):
+        pool = JobPool(network)
+        jobs = [
+            pool.queue_chunk(test_chunk, _chunk(x, y, 0)) for x in range(4) for y in (0, 1)
+        ]
+        scheduler = LocalityScheduler(_PoolDummy(), pool._queue)
+        homes = {tuple(j._c): scheduler._home[j] for j in jobs}
+        # The Z-order curve first fills the 2x2 block at the origin.
+        self.assertEqual(
+            1, len({homes[(x, y, 0)] for x in (0, 1) for y in (0, 1)}), "Split block"
+        )
+        self.assertEqual({1, 2}, set(homes.values()), "Jobs not divided over workers")
+
+    def test_supports(self):
+        self.assertTrue(LocalityScheduler.supports(_PoolDummy()), "zwembad unsupported")
+        self.assertFalse(LocalityScheduler.supports(object()), "pool without workers")
+
+    def test_steal(self):
+        pool = JobPool(network)
+        job = pool.queue_chunk(test_chunk, _chunk(0, 0, 0))
+        job2 = pool.queue_chunk(test_chunk, _chunk(0, 0, 1), deps=[job])
+        scheduler = LocalityScheduler(_PoolDummy(), pool._queue)
+        for j in (job, job2):
+            scheduler._home[j] = 1
+            scheduler._push(j)
+        self.assertIs(job2, scheduler._pop(2), "Idle worker did not steal furthest job")
+        self.assertIs(job, scheduler._pop(1), "Worker did not pick its nearest job")
+        self.assertIsNone(scheduler._pop(2), "Stole from empty queues")
+
+
 class TestPlacementStrategies(unittest.TestCase):
     pass
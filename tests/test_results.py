@@ -0,0 +1,99 @@
+import unittest, os, sys, tempfile, numpy as np, h5py
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+from bsb.simulation.results import SimulationResult, SimulationRecorder, ResultWriter
+
+
+class _Comm:
+    # Stand-in for an MPI communicator, to write the shards of several ranks.
+    def __init__(self, rank, size):
+        self.rank = rank
+        self.size = size
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return self.size
+
+    def Barrier(self):
+        pass
+
+
+class _StreamRecorder(SimulationRecorder):
+    streams = True
+
+    def __init__(self):
+        self.recorded = []
+
+    def get_path(self):
+        return ("recorders", "stream")
+
+    def get_data(self):
+        return np.array(self.recorded, dtype=float)
+
+    def flush(self):
+        data = self.get_data()
+        self.recorded = []
+        return data
+
+
+class TestResultWriter(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "results.hdf5")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_append(self):
+        writer = ResultWriter(self.path, _Comm(0, 1), block_size=16)
+        writer.append(("a", "b"), np.arange(10).reshape(5, 2), {"x": 1})
+        writer.append(("a", "b"), np.arange(10, 16).reshape(3, 2))
+        writer.append(("c",), np.float64(3.0))
+        self.assertTrue(os.path.exists(writer.shard_path), "shard not created")
+        self.assertEqual(self.path, writer.merge({"conf": "{}"}), "wrong result path")
+        self.assertFalse(os.path.exists(writer.shard_path), "shard not removed")
+        with h5py.File(self.path, "r") as f:
+            self.assertEqual("{}", f.attrs["conf"], "file attrs not set")
+            self.assertEqual(np.arange(16).reshape(8, 2).tolist(), f["a/b"][()].tolist())
+            self.assertEqual(1, f["a/b"].attrs["x"], "meta not copied")
+            self.assertEqual([3.0], f["c"][()].tolist(), "scalar not appended")
+            self.assertEqual((None, 2), f["a/b"].maxshape, "dataset not resizable")
+
+    def test_merge_ranks(self):
+        writers = [ResultWriter(self.path, _Comm(r, 2)) for r in (1, 0)]
+        for r, writer in zip((1, 0), writers):
+            writer.append(("data",), np.full(3, r))
+            writer.append(("rank", str(r)), np.arange(2))
+        # Rank 1 has nothing left to merge, rank 0 merges the shards.
+        writers[0].merge()
+        writers[1].merge()
+        with h5py.File(self.path, "r") as f:
+            self.assertEqual([0, 0, 0, 1, 1, 1], f["data"][()].tolist(), "not in order")
+            self.assertIn("rank/0", f, "rank 0 data missing")
+            self.assertIn("rank/1", f, "rank 1 data missing")
+        for writer in writers:
+            self.assertFalse(os.path.exists(writer.shard_path), "shard not removed")
+
+    def test_flush(self):
+        result = SimulationResult()
+        recorder = _StreamRecorder()
+        result.add(recorder)
+        result.create_recorder(lambda: ("time",), lambda: np.arange(3))
+        writer = ResultWriter(self.path, _Comm(0, 1))
+        recorder.recorded.extend([1, 2])
+        writer.write(result.safe_flush())
+        self.assertEqual([], recorder.recorded, "recorder not flushed")
+        recorder.recorded.extend([3])
+        for i in range(2):
+            collected = {path: data.tolist() for path, data, _ in result.collect()}
+            self.assertEqual([3.0], collected[("recorders", "stream")], "data freed")
+        writer.write(result.safe_flush())
+        writer.write(result.safe_collect(streams=False))
+        writer.merge()
+        with h5py.File(self.path, "r") as f:
+            stream = f["recorders/stream"][()].tolist()
+            self.assertEqual([1, 2, 3], stream, "not streamed")
+            self.assertEqual([0, 1, 2], f["time"][()].tolist(), "not collected")
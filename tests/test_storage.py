@@ -7,7 +7,7 @@ from bsb.config import from_json
 from bsb.exceptions import *
 from bsb.storage import Storage, Chunk
 from bsb.storage import _util
-from test_setup import get_config, timeout
+from test_setup import get_config, timeout, skip_parallel
 import mpi4py.MPI as MPI
 import pathlib
 
@@ -124,6 +124,110 @@ class TestHDF5Storage(unittest.TestCase):
         self.assertTrue(os.path.exists(s._root))
         self.assertTrue(s.exists())
 
+    @timeout(10)
+    def test_handle_pool(self):
+        s = self.random_storage()
+        engine = s._engine
+        with engine._read():
+            with engine._handle("r") as h1:
+                pass
+            with engine._handle("r") as h2:
+                self.assertIs(h1, h2, "Handle not reused within read fence.")
+            self.assertTrue(h1, "Pooled handle closed within read fence.")
+            with engine._write():
+                with engine._handle("a") as h3:
+                    h3.attrs["pooled"] = True
+                with engine._handle("r") as h4:
+                    self.assertIs(h3, h4, "Writable handle not reused for reading.")
+        self.assertFalse(h3, "Pooled handle not closed after leaving fence.")
+        with engine._read():
+            with engine._handle("r") as h:
+                self.assertTrue(h.attrs["pooled"], "Write not persisted")
+
+    @skip_parallel
+    @timeout(10)
+    def test_connectivity_blocks(self):
+        cfg = from_json(get_config("test_single"))
+        ct = cfg.cell_types.test_cell
+        s = self.random_storage()
+        cs = s.require_connectivity_set(ct, ct, "blocks")
+        c0, c1 = Chunk((0, 0, 0), (100, 100, 100)), Chunk((1, 0, 0), (100, 100, 100))
+        block = lambda v, n: np.full((n, 3), v)
+        # Interleave appends from 2 source chunks into the same destination chunk
+        cs.append_data(c1, c0, block(1, 2), block(-1, 2))
+        cs.append_data(c0, c0, block(0, 3), block(-2, 3))
+        cs.append_data(c1, c0, block(1, 1), block(-1, 1))
+        blocks, src, dest = cs._get_chunk_data(c0)
+        self.assertEqual(
+            [[c1.id, 0, 2], [c0.id, 2, 5], [c1.id, 5, 6]],
+            blocks.tolist(),
+            "Appends not stored as blocks",
+        )
+        self.assertEqual([1, 1, 0, 0, 0, 1], src[:, 0].tolist(), "Data not appended")
+        cs.compact()
+        blocks, src, dest = cs._get_chunk_data(c0)
+        self.assertEqual([[c0.id, 0, 3], [c1.id, 3, 6]], blocks.tolist(), "Not sorted")
+        self.assertEqual([0, 0, 0, 1, 1, 1], src[:, 0].tolist(), "Data not sorted")
+        self.assertEqual([-2, -2, -2, -1, -1, -1], dest[:, 0].tolist(), "Dest not sorted")
+
+    @skip_parallel
+    @timeout(10)
+    def test_connectivity_iter_blocks(self):
+        cfg = from_json(get_config("test_single"))
+        ct = cfg.cell_types.test_cell
+        s = self.random_storage()
+        cs = s.require_connectivity_set(ct, ct, "iter")
+        c0, c1 = Chunk((0, 0, 0), (100, 100, 100)), Chunk((1, 0, 0), (100, 100, 100))
+        block = lambda v, n: np.full((n, 3), v)
+        cs.append_data(c0, c0, block(0, 5), block(0, 5))
+        cs.append_data(c1, c0, block(1, 2), block(0, 2))
+        cs.append_data(c0, c1, block(0, 3), block(1, 3))
+        self.assertEqual(10, len(cs), "Wrong number of connections")
+        blocks = list(cs.iter_blocks(block_size=2))
+        self.assertEqual(
+            [(c0.id, c0.id, 2), (c0.id, c0.id, 2), (c0.id, c0.id, 1), (c1.id, c0.id, 2)],
+            [(sc.id, dc.id, len(src)) for sc, dc, src, _ in blocks if dc == c0],
+            "Unexpected blocks",
+        )
+        self.assertEqual(10, sum(len(b[2]) for b in blocks), "Missing connections")
+        src_only = list(cs.iter_blocks(src_chunks=[c1]))
+        self.assertEqual(1, len(src_only), "Source chunk filter failed")
+        self.assertTrue(np.all(src_only[0][2] == 1), "Wrong source chunk data")
+        dest_only = list(cs.iter_blocks(dest_chunks=[c1]))
+        self.assertEqual(1, len(dest_only), "Destination chunk filter failed")
+        self.assertTrue(np.all(dest_only[0][3] == 1), "Wrong destination chunk data")
+        # The consumer of the blocks shouldn't hold the read lock.
+        it = cs.iter_blocks(block_size=2)
+        next(it)
+        self.assertEqual([], cs._engine._fences, "Lock held while yielding a block")
+        # Writers can go ahead, the blocks to read were listed when iteration started.
+        cs.append_data(c1, c1, block(1, 1), block(1, 1))
+        self.assertEqual(8, sum(len(b[2]) for b in it), "Wrong remaining connections")
+
+    @skip_parallel
+    @timeout(10)
+    def test_connectivity_pointers(self):
+        # Test that data stored with insertion pointers is read and compacted
+        cfg = from_json(get_config("test_single"))
+        ct = cfg.cell_types.test_cell
+        s = self.random_storage()
+        cs = s.require_connectivity_set(ct, ct, "pointers")
+        c0, c1 = Chunk((0, 0, 0), (100, 100, 100)), Chunk((1, 0, 0), (100, 100, 100))
+        with s._engine._write():
+            with s._engine._handle("a") as h:
+                grp = h.create_group(f"{cs._path}/{c0.id}")
+                grp.create_dataset("source_loc", data=[[1, 0, 0]] * 2 + [[0, 0, 0]])
+                grp.create_dataset("dest_loc", data=np.zeros((3, 3), dtype=int))
+                grp.attrs["chunk_list"] = [c1, c0]
+                grp.attrs[str(c1.id)] = 0
+                grp.attrs[str(c0.id)] = 2
+        blocks, src, dest = cs._get_chunk_data(c0)
+        self.assertEqual([[c1.id, 0, 2], [c0.id, 2, 3]], blocks.tolist())
+        cs.compact()
+        blocks, src, dest = cs._get_chunk_data(c0)
+        self.assertEqual([[c0.id, 0, 1], [c1.id, 1, 3]], blocks.tolist())
+        self.assertEqual([0, 1, 1], src[:, 0].tolist(), "Data not sorted")
+
 
 class TestUtil(unittest.TestCase):
     def test_links(self):
@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+from bsb import options
+from bsb.trees import BoxTree, BoxRTree, BoxGridTree
+
+
+def _random_boxes(rng, n, spread=100, size=10):
+    ldc = rng.random((n, 3)) * spread
+    return np.column_stack((ldc, ldc + rng.random((n, 3)) * size))
+
+
+class TestBoxTrees(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.boxes = _random_boxes(rng, 500)
+        self.queries = _random_boxes(rng, 200, spread=120, size=20)
+
+    def test_query_batch(self):
+        for cls in (BoxRTree, BoxGridTree):
+            with self.subTest(provider=cls.__name__):
+                tree = cls(self.boxes)
+                self.assertEqual(500, len(tree), "incorrect amount of boxes")
+                offsets, indices = tree.query_batch(self.queries)
+                self.assertEqual(len(self.queries) + 1, len(offsets), "offsets length")
+                self.assertEqual(offsets[-1], len(indices), "offsets don't span indices")
+                expected = [sorted(r) for r in tree.query(self.queries)]
+                for i, r in enumerate(expected):
+                    found = sorted(indices[offsets[i] : offsets[i + 1]])
+                    self.assertEqual(r, found, "query_batch differs from query")
+
+    def test_equal_results(self):
+        rtree = BoxRTree(self.boxes).query(self.queries)
+        grid = BoxGridTree(self.boxes).query(self.queries)
+        for i, (r, g) in enumerate(zip(rtree, grid)):
+            self.assertEqual(sorted(r), sorted(g), f"query {i} differs")
+
+    def test_empty(self):
+        for cls in (BoxRTree, BoxGridTree):
+            with self.subTest(provider=cls.__name__):
+                tree = cls(np.empty((0, 6)))
+                self.assertEqual(0, len(tree), "empty tree not empty")
+                offsets, indices = tree.query_batch(self.queries)
+                self.assertEqual(0, offsets[-1], "empty tree returned results")
+                offsets, indices = cls(self.boxes).query_batch(np.empty((0, 6)))
+                self.assertEqual([0], offsets.tolist(), "empty query returned results")
+
+    def test_flat_boxes(self):
+        boxes = self.boxes.copy()
+        boxes[:, 5] = boxes[:, 2]
+        grid = BoxGridTree(boxes).query(self.queries)
+        for r, g in zip(BoxRTree(boxes).query(self.queries), grid):
+            self.assertEqual(sorted(r), sorted(g), "flat boxes differ")
+
+    def test_outlier_box(self):
+        # One box spanning the volume among unit boxes would be hashed into every cell.
+        rng = np.random.default_rng(1)
+        boxes = np.vstack(
+            (_random_boxes(rng, 1000, spread=1000, size=1), [[0, 0, 0, 1000, 1000, 1000]])
+        )
+        queries = np.vstack(
+            (_random_boxes(rng, 100, spread=1000, size=2), [[0, 0, 0, 500, 500, 500]])
+        )
+        tree = BoxGridTree(boxes, batch_size=50)
+        self.assertEqual([1000], tree._overflow.tolist(), "outlier box not in overflow")
+        grid = tree.query(queries)
+        for i, (r, g) in enumerate(zip(BoxRTree(boxes).query(queries), grid)):
+            self.assertEqual(sorted(r), sorted(g), f"query {i} differs")
+            self.assertIn(1000, g, "outlier box not found")
+
+    def test_option(self):
+        self.assertIsInstance(BoxTree(self.boxes), BoxRTree, "rtree should be default")
+        options.box_tree = "grid"
+        try:
+            self.assertIsInstance(BoxTree(self.boxes), BoxGridTree, "option ignored")
+            options.box_tree = "unknown"
+            with self.assertRaises(ValueError):
+                BoxTree(self.boxes)
+        finally:
+            del options.box_tree
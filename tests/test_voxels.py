@@ -308,6 +308,28 @@ class TestVoxelSet(unittest.TestCase):
         vs = VoxelSet.from_morphology(morpho, 16, with_data=False)
         self.assertLess(0, len(vs), "Empty voxelset from non empty morpho")
 
+    def test_from_morphology_data(self):
+        branches = [Branch([i] * 5, [0, 1, 2, 3, 4], [i] * 5, [1] * 5) for i in range(5)]
+        morpho = Morphology(branches)
+        vs = morpho.voxelize(16)
+        boxes = vs.as_boxes()
+        n = 0
+        for i in range(len(vs)):
+            data = vs.get_data(i)
+            self.assertEqual(2, data.ndim, "voxel data should be (branch, point) rows")
+            n += len(data)
+            for b, p in data:
+                point = morpho.branches[b].as_matrix()[p]
+                self.assertAll(boxes[i, :3] <= point, "point not in its voxel")
+                self.assertAll(point <= boxes[i, 3:], "point not in its voxel")
+        self.assertEqual(25, n, "each point should be in exactly 1 voxel")
+        self.assertEqual(25, len(vs.get_data(np.arange(len(vs)))), "concat data")
+        sub = vs[1:3]
+        self.assertEqual(2, len(sub), "CSR slice")
+        self.assertClose(vs.get_data(2), sub.get_data(1), "CSR slice data")
+        self.assertClose(vs.get_data(2), vs.copy().get_data(2), "CSR copy data")
+        self.assertEqual((len(vs), 1), vs.data.shape, "expanded data")
+
     def test_from_empty_morphology(self):
         empty_morpho = Morphology([])
         vs = empty_morpho.voxelize(16)